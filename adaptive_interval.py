@@ -0,0 +1,133 @@
+"""
+自适应拉取间隔
+根据每个服务器最近的日志速率、玩家数量和比赛状态调整拉取间隔：
+空服时很少拉取，满人对局时频繁拉取，并保证回溯窗口不会溢出
+"""
+
+import re
+import time
+from typing import Dict, Any, List, Optional
+
+MATCH_START_PATTERN = re.compile(r'\bMATCH START\b')
+MATCH_END_PATTERN = re.compile(r'\bMATCH ENDED\b')
+
+def detect_match_state(messages: List[str]) -> Optional[str]:
+    """
+    从一批日志消息中识别最新的比赛状态
+
+    Args:
+        messages: 按时间顺序排列的日志消息
+
+    Returns:
+        Optional[str]: "active"（比赛进行中）、"ended"（比赛已结束），没有相关日志时返回None
+    """
+    for message in reversed(messages):
+        if MATCH_END_PATTERN.search(message):
+            return "ended"
+        if MATCH_START_PATTERN.search(message):
+            return "active"
+    return None
+
+class AdaptiveInterval:
+    """单个服务器的自适应拉取间隔"""
+
+    def __init__(self, min_interval: float = 5, max_interval: float = 60,
+                 target_events_per_poll: float = 20, busy_player_count: int = 60,
+                 smoothing: float = 0.3, backtrack_limit: Optional[float] = None):
+        """
+        初始化自适应间隔
+
+        Args:
+            min_interval: 最小拉取间隔（秒）
+            max_interval: 最大拉取间隔（秒）
+            target_events_per_poll: 期望每次拉取得到的日志条数
+            busy_player_count: 达到该玩家数量时按最小间隔拉取
+            smoothing: 日志速率指数加权平均的平滑系数（0-1，越大越重视最近的拉取）
+            backtrack_limit: 拉取间隔的硬上限（秒），应为最大回溯时间减去重叠时间
+        """
+        if backtrack_limit is not None:
+            max_interval = min(max_interval, backtrack_limit)
+        self.min_interval = min(min_interval, max_interval)
+        self.max_interval = max_interval
+        self.target_events_per_poll = target_events_per_poll
+        self.busy_player_count = max(1, busy_player_count)
+        self.smoothing = smoothing
+
+        self.event_rate: Optional[float] = None  # 每秒日志条数（指数加权平均）
+        self.player_count: Optional[int] = None
+        self.match_state: Optional[str] = None
+        self.players_updated: Optional[float] = None
+
+        # 没有观测数据时按最小间隔拉取
+        self.interval = self.min_interval
+
+    def record_fetch(self, new_events: int, elapsed_seconds: float):
+        """
+        记录一次拉取的结果
+
+        Args:
+            new_events: 本次拉取得到的新日志条数
+            elapsed_seconds: 距上次成功拉取的时间（秒）
+        """
+        if elapsed_seconds <= 0:
+            return
+        rate = new_events / elapsed_seconds
+        if self.event_rate is None:
+            self.event_rate = rate
+        else:
+            self.event_rate += self.smoothing * (rate - self.event_rate)
+        self._update()
+
+    def record_players(self, player_count: int, now: Optional[float] = None):
+        """记录当前玩家数量"""
+        self.player_count = player_count
+        self.players_updated = now if now is not None else time.time()
+        self._update()
+
+    def record_match_state(self, match_state: Optional[str]):
+        """记录比赛状态（active或ended），None表示没有变化"""
+        if match_state is not None:
+            self.match_state = match_state
+            self._update()
+
+    def players_due(self, refresh_interval: float, now: Optional[float] = None) -> bool:
+        """判断是否需要重新获取玩家数量"""
+        if self.players_updated is None:
+            return True
+        if now is None:
+            now = time.time()
+        return now - self.players_updated >= refresh_interval
+
+    def _update(self):
+        """根据观测数据重新计算拉取间隔"""
+        span = self.max_interval - self.min_interval
+        candidates = []
+
+        # 日志速率：按期望的每次拉取条数计算间隔
+        if self.event_rate is not None:
+            if self.event_rate > 0:
+                candidates.append(self.target_events_per_poll / self.event_rate)
+            else:
+                candidates.append(self.max_interval)
+
+        # 玩家数量：玩家越多间隔越短
+        if self.player_count is not None:
+            load = min(1.0, self.player_count / self.busy_player_count)
+            candidates.append(self.max_interval - span * load)
+
+        interval = min(candidates) if candidates else self.min_interval
+
+        # 比赛进行中且有玩家时，间隔不超过中间值
+        if self.match_state == "active" and self.player_count != 0:
+            interval = min(interval, self.min_interval + span / 2)
+
+        self.interval = max(self.min_interval, min(self.max_interval, interval))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取自适应间隔状态"""
+        return {
+            'interval': round(self.interval, 1),
+            'event_rate': round(self.event_rate, 3) if self.event_rate is not None else None,
+            'player_count': self.player_count,
+            'match_state': self.match_state
+        }
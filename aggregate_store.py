@@ -0,0 +1,355 @@
+"""
+分类统计聚合
+保存日志时按 服务器 × 日志类型 × 小时 累加数量，同时更新所在日和所在月的汇总。
+任意时间范围的统计先使用整月汇总，再使用整日汇总，只在范围两端使用小时数据，
+跨多天、多周和多个服务器的统计不需要读取日志文件。
+
+每个服务器每月一个文件: logs/server1/.aggregates/25_10.agg
+    文件头（24字节）| zlib压缩的计数表
+计数表为 (1 + 31 + 744) 行 × 日志类型数 列的uint32（小端序）：
+第0行为月汇总，第1~31行为日汇总，之后每行为一个小时。
+"""
+
+import os
+import sys
+import zlib
+import array
+import struct
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+from log_classifier import LogClassifier, LogType
+from segment_io import segment_files, read_segment, partition_by_hour
+from segment_manifest import list_segments
+
+AGGREGATE_MAGIC = b'HAG1'
+AGGREGATE_VERSION = 1
+# magic, version, 年, 月, 日志类型数, 计数表长度, 压缩数据CRC32, 保留
+AGGREGATE_HEADER = struct.Struct('<4sHHBBIII')
+
+AGGREGATE_DIRECTORY = ".aggregates"
+AGGREGATE_EXTENSION = ".agg"
+
+# 计数表的列顺序，增加日志类型后旧文件的列数不同，需要重新生成
+TYPES = tuple(log_type.value for log_type in LogType)
+_TYPE_INDEX = {value: index for index, value in enumerate(TYPES)}
+
+DAY_ROWS = 31
+HOUR_ROWS = DAY_ROWS * 24
+TABLE_ROWS = 1 + DAY_ROWS + HOUR_ROWS
+
+_NATIVE_LITTLE_ENDIAN = sys.byteorder == 'little'
+
+def _month_name(timestamp: datetime) -> str:
+    """年月目录名，与日志目录一致：25_10"""
+    return f"{timestamp.year % 100:02d}_{timestamp.month:02d}"
+
+def _next_month(timestamp: datetime) -> datetime:
+    """下个月第一天的零点"""
+    if timestamp.month == 12:
+        return datetime(timestamp.year + 1, 1, 1)
+    return datetime(timestamp.year, timestamp.month + 1, 1)
+
+def _floor_hour(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+class MonthTable:
+    """一个服务器一个月的计数表"""
+
+    __slots__ = ('year', 'month', 'counts')
+
+    def __init__(self, year: int, month: int, counts: Optional[array.array] = None):
+        self.year = year
+        self.month = month
+        self.counts = counts if counts is not None else array.array('I', bytes(4 * TABLE_ROWS * len(TYPES)))
+
+    @staticmethod
+    def day_row(day: int) -> int:
+        return day
+
+    @staticmethod
+    def hour_row(day: int, hour: int) -> int:
+        return 1 + DAY_ROWS + (day - 1) * 24 + hour
+
+    def add(self, day: int, hour: int, type_index: int, count: int):
+        """累加一个小时的数量，同时更新日汇总和月汇总"""
+        width = len(TYPES)
+        counts = self.counts
+        counts[type_index] += count
+        counts[self.day_row(day) * width + type_index] += count
+        counts[self.hour_row(day, hour) * width + type_index] += count
+
+    def row(self, row: int) -> array.array:
+        width = len(TYPES)
+        return self.counts[row * width:(row + 1) * width]
+
+    def encode(self) -> bytes:
+        """编码为文件内容"""
+        counts = self.counts
+        if not _NATIVE_LITTLE_ENDIAN:
+            counts = array.array('I', counts)
+            counts.byteswap()
+        body = zlib.compress(counts.tobytes(), 6)
+        header = AGGREGATE_HEADER.pack(AGGREGATE_MAGIC, AGGREGATE_VERSION, self.year, self.month,
+                                       len(TYPES), 0, len(body), zlib.crc32(body))
+        return header + body
+
+    @classmethod
+    def decode(cls, data: bytes) -> "MonthTable":
+        """
+        从文件内容解码
+
+        Raises:
+            ValueError: 文件损坏或类型列表与当前版本不一致
+        """
+        if len(data) < AGGREGATE_HEADER.size:
+            raise ValueError("文件头不完整")
+        magic, version, year, month, type_count, _, body_length, crc = AGGREGATE_HEADER.unpack_from(data)
+        if magic != AGGREGATE_MAGIC or version != AGGREGATE_VERSION:
+            raise ValueError("不是聚合统计文件")
+        if type_count != len(TYPES):
+            raise ValueError(f"日志类型数量不一致（{type_count}），需要重新生成")
+        body = data[AGGREGATE_HEADER.size:AGGREGATE_HEADER.size + body_length]
+        if len(body) != body_length or zlib.crc32(body) != crc:
+            raise ValueError("校验失败")
+        counts = array.array('I')
+        counts.frombytes(zlib.decompress(body))
+        if not _NATIVE_LITTLE_ENDIAN:
+            counts.byteswap()
+        if len(counts) != TABLE_ROWS * len(TYPES):
+            raise ValueError("计数表长度不正确")
+        return cls(year, month, counts)
+
+class AggregateStore:
+    """
+    分类日志数量的聚合统计
+
+    record在内存中累加，flush时把修改过的月份写入磁盘；
+    查询时按月、日、小时三级汇总组合出时间范围内的数量
+    """
+
+    def __init__(self, logs_directory: str = "logs", max_cached_months: int = 64):
+        """
+        初始化聚合统计
+
+        Args:
+            logs_directory: 日志基础目录
+            max_cached_months: 内存中最多缓存的月份数量（服务器 × 月）
+        """
+        self.logs_directory = logs_directory
+        self.max_cached_months = max(2, max_cached_months)
+        self.lock = threading.RLock()
+        self.logger = logging.getLogger("AggregateStore")
+
+        self._months: "OrderedDict[Tuple[str, str], MonthTable]" = OrderedDict()  # (服务器, 年月) -> 计数表
+        self._dirty: set = set()
+
+        # 统计信息
+        self.stats = {
+            'recorded_entries': 0,
+            'month_writes': 0,
+            'month_loads': 0,
+            'corrupt_files': 0
+        }
+
+    def _month_path(self, server_name: str, month_name: str) -> str:
+        return os.path.join(self.logs_directory, server_name, AGGREGATE_DIRECTORY, month_name + AGGREGATE_EXTENSION)
+
+    def _table(self, server_name: str, timestamp: datetime, create: bool) -> Optional[MonthTable]:
+        """获取计数表：优先使用缓存，其次读取文件；create为True时不存在则新建"""
+        key = (server_name, _month_name(timestamp))
+        table = self._months.get(key)
+        if table is not None:
+            self._months.move_to_end(key)
+            return table
+
+        month_path = self._month_path(*key)
+        try:
+            with open(month_path, 'rb') as f:
+                table = MonthTable.decode(f.read())
+            self.stats['month_loads'] += 1
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, zlib.error) as e:
+            self.stats['corrupt_files'] += 1
+            self.logger.error(f"读取聚合统计失败 {month_path}: {e}，请使用 --rebuild-aggregates 重新生成")
+
+        if table is None:
+            if not create:
+                return None
+            table = MonthTable(timestamp.year, timestamp.month)
+
+        self._months[key] = table
+        while len(self._months) > self.max_cached_months:
+            oldest = next(iter(self._months))
+            if oldest in self._dirty:
+                break
+            self._months.pop(oldest)
+        return table
+
+    def record(self, server_name: str, hour: datetime, counts: Dict[Any, int]):
+        """
+        记录一个小时内保存的各类型日志数量（调用flush后写入磁盘）
+
+        Args:
+            server_name: 服务器名称
+            hour: 日志所属的小时
+            counts: 日志类型（LogType或其值） -> 数量
+        """
+        with self.lock:
+            table = self._table(server_name, hour, create=True)
+            for log_type, count in counts.items():
+                if not count:
+                    continue
+                type_index = _TYPE_INDEX[log_type.value if isinstance(log_type, LogType) else log_type]
+                table.add(hour.day, hour.hour, type_index, count)
+                self.stats['recorded_entries'] += count
+            self._dirty.add((server_name, _month_name(hour)))
+
+    def flush(self):
+        """把修改过的月份写入磁盘"""
+        with self.lock:
+            for key in sorted(self._dirty):
+                month_path = self._month_path(*key)
+                os.makedirs(os.path.dirname(month_path), exist_ok=True)
+                tmp_path = f"{month_path}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(self._months[key].encode())
+                os.replace(tmp_path, month_path)
+                self.stats['month_writes'] += 1
+            self._dirty.clear()
+
+    def count(self, server_name: str, start: datetime, end: datetime) -> Dict[str, int]:
+        """
+        统计一个服务器在时间范围内各类型日志的数量
+
+        按整点小时计算：包括start所在的小时，不包括end之后开始的小时。
+        完整的月份使用月汇总，完整的日期使用日汇总，其余使用小时数据
+
+        Args:
+            server_name: 服务器名称
+            start: 开始时间
+            end: 结束时间
+
+        Returns:
+            Dict[str, int]: 日志类型 -> 数量
+        """
+        totals = [0] * len(TYPES)
+        cursor = _floor_hour(start)
+        end_hour = _floor_hour(end)
+        if end_hour < end:
+            end_hour += timedelta(hours=1)
+
+        with self.lock:
+            while cursor < end_hour:
+                month_start = cursor.replace(day=1, hour=0)
+                next_month = _next_month(cursor)
+                table = self._table(server_name, cursor, create=False)
+                if table is None:
+                    cursor = next_month
+                    continue
+
+                day_start = cursor.replace(hour=0)
+                next_day = day_start + timedelta(days=1)
+                if cursor == month_start and next_month <= end_hour:
+                    row, cursor = 0, next_month
+                elif cursor == day_start and next_day <= end_hour:
+                    row, cursor = MonthTable.day_row(cursor.day), next_day
+                else:
+                    row, cursor = MonthTable.hour_row(cursor.day, cursor.hour), cursor + timedelta(hours=1)
+
+                for index, value in enumerate(table.row(row)):
+                    totals[index] += value
+
+        return dict(zip(TYPES, totals))
+
+    def count_servers(self, server_names: Iterable[str], start: datetime, end: datetime) -> Dict[str, Any]:
+        """
+        统计多个服务器在时间范围内各类型日志的数量
+
+        Args:
+            server_names: 服务器名称
+            start: 开始时间
+            end: 结束时间
+
+        Returns:
+            Dict: {"servers": {服务器: {类型: 数量}}, "total": {类型: 数量}}
+        """
+        result = {"servers": {}, "total": dict.fromkeys(TYPES, 0)}
+        for server_name in server_names:
+            counts = self.count(server_name, start, end)
+            result["servers"][server_name] = counts
+            for log_type, value in counts.items():
+                result["total"][log_type] += value
+        return result
+
+    def rebuild(self, server_names: Optional[Iterable[str]] = None,
+                classifier: Optional[LogClassifier] = None) -> Dict[str, int]:
+        """
+        从原始日志分段（hll_logs_*，包括已封存的文件）重新生成聚合统计
+
+        应在收集器停止时运行；只保留仍有原始日志的月份，其余月份的聚合文件会被删除
+
+        Args:
+            server_names: 要重新生成的服务器，默认为日志目录下的所有服务器
+            classifier: 分类器，默认使用内置规则
+
+        Returns:
+            Dict[str, int]: 服务器 -> 统计的日志数量
+        """
+        if classifier is None:
+            classifier = LogClassifier()
+        if server_names is None:
+            server_names = sorted(
+                entry.name for entry in os.scandir(self.logs_directory)
+                if entry.is_dir() and not entry.name.startswith('.')
+            ) if os.path.isdir(self.logs_directory) else []
+
+        rebuilt = {}
+        with self.lock:
+            for server_name in server_names:
+                tables: Dict[str, MonthTable] = {}
+                total = 0
+                for segment_path, segment_hour in list_segments(os.path.join(self.logs_directory, server_name), ("hll_logs",)):
+                    entries = []
+                    for file_path in segment_files(segment_path):
+                        try:
+                            entries.extend(read_segment(file_path))
+                        except Exception as e:
+                            self.logger.error(f"重新生成聚合统计时读取分段失败 {file_path}: {e}")
+                    # 与保存时一样按事件时间分组，无法确定时间的日志计入分段所在的小时
+                    for hour, hour_entries in partition_by_hour(entries, segment_hour).items():
+                        table = tables.get(_month_name(hour))
+                        if table is None:
+                            table = tables[_month_name(hour)] = MonthTable(hour.year, hour.month)
+                        for log_type, type_entries in classifier.classify_logs(hour_entries).items():
+                            if type_entries:
+                                table.add(hour.day, hour.hour, _TYPE_INDEX[log_type.value], len(type_entries))
+                    total += len(entries)
+
+                aggregate_dir = os.path.join(self.logs_directory, server_name, AGGREGATE_DIRECTORY)
+                if os.path.isdir(aggregate_dir):
+                    for entry in os.scandir(aggregate_dir):
+                        if entry.name.endswith(AGGREGATE_EXTENSION) and entry.name[:-len(AGGREGATE_EXTENSION)] not in tables:
+                            os.remove(entry.path)
+                for key in [key for key in self._months if key[0] == server_name]:
+                    self._months.pop(key)
+                    self._dirty.discard(key)
+                for month_name, table in tables.items():
+                    self._months[(server_name, month_name)] = table
+                    self._dirty.add((server_name, month_name))
+                self.flush()
+                rebuilt[server_name] = total
+                self.logger.info(f"重新生成了 {server_name} 的聚合统计，共 {total} 条日志，{len(tables)} 个月")
+        return rebuilt
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取聚合统计存储的统计信息"""
+        with self.lock:
+            return {
+                **self.stats,
+                'cached_months': len(self._months)
+            }
@@ -0,0 +1,231 @@
+"""
+基于asyncio的日志收集器
+所有服务器的日志拉取作为协程运行在同一个事件循环中，不再为每个服务器每个周期创建线程
+"""
+
+import time
+import random
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+
+from hll_http_client import HLLHttpClient
+from hll_rcon_client import HLLRconClient
+from log_collector import LogCollector
+from log_entry import LogEntry
+
+class AsyncLogCollector(LogCollector):
+    """
+    基于asyncio的HLL日志收集器
+
+    - 原生RCON服务器直接使用asyncio客户端
+    - HTTP服务器的阻塞请求在固定大小的线程池中执行
+    - 全局并发数和每个API地址的并发数都有上限
+    start/stop/get_status/force_save 接口与LogCollector相同
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        log_settings = config.get("log_settings", {})
+
+        # 并发限制
+        self.max_concurrency = log_settings.get("max_concurrency", 50)
+        self.max_concurrency_per_host = log_settings.get("max_concurrency_per_host", 10)
+        self.http_workers = log_settings.get("http_workers", 16)
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self._http_executor: Optional[ThreadPoolExecutor] = None
+        self._global_semaphore: Optional[asyncio.Semaphore] = None
+        self._host_semaphores: Dict[Tuple[str, int], asyncio.Semaphore] = {}
+
+        super().__init__(config)
+
+    def _create_client(self, server_name: str, server: Dict[str, Any], api_config: Dict[str, Any]) -> Any:
+        """原生RCON服务器使用asyncio客户端，其余与LogCollector相同"""
+        if server.get("transport", "http") == "rcon":
+            client = HLLRconClient(
+                host=server["host"],
+                port=server["port"],
+                password=server["password"],
+                timeout=api_config.get("timeout", 30)
+            )
+            self.logger.info(f"初始化RCON客户端: {server_name} ({client.host}:{client.port})")
+            return client
+        return super()._create_client(server_name, server, api_config)
+
+    def stop(self):
+        """停止日志收集"""
+        if self.running and self.loop is not None and self._stop_event is not None:
+            self.loop.call_soon_threadsafe(self._stop_event.set)
+        super().stop()
+
+    def _close_clients(self):
+        """断开HTTP客户端（RCON客户端在事件循环退出前已断开）"""
+        for client in self.clients.values():
+            if isinstance(client, HLLHttpClient):
+                client.disconnect()
+
+    def _collection_loop(self):
+        """在收集线程中运行事件循环"""
+        self.logger.info(f"开始日志收集循环（asyncio），间隔: {self.collection_interval}秒，"
+                         f"全局并发: {self.max_concurrency}，每地址并发: {self.max_concurrency_per_host}")
+
+        self.loop = asyncio.new_event_loop()
+        self._http_executor = ThreadPoolExecutor(max_workers=self.http_workers, thread_name_prefix="hll-http")
+        try:
+            self.loop.run_until_complete(self._run())
+        except Exception as e:
+            self.logger.error(f"日志收集循环出错: {e}")
+        finally:
+            self._http_executor.shutdown(wait=False)
+            self.loop.close()
+
+    async def _run(self):
+        """为每个服务器启动一个拉取协程，直到收到停止信号"""
+        self._stop_event = asyncio.Event()
+        self._global_semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._host_semaphores = {}
+
+        tasks = [
+            asyncio.ensure_future(self._poll_server(server_name, client))
+            for server_name, client in self.clients.items()
+        ]
+
+        # stop()可能在事件创建之前就已调用
+        while self.running and not self._stop_event.is_set():
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        for client in self.clients.values():
+            if isinstance(client, HLLRconClient):
+                await client.disconnect()
+
+    async def _poll_server(self, server_name: str, client: Any):
+        """按该服务器自己的调度时间持续拉取日志，失败时独立退避"""
+        # 首次拉取时间在一个间隔内随机分布
+        delay = random.uniform(0, self.collection_interval)
+        self.poll_states[server_name]["next_due"] = time.time() + delay
+        await asyncio.sleep(delay)
+
+        while self.running:
+            start_time = time.time()
+            success = False
+
+            # 断路器打开时不发出请求，直接等到退避结束
+            wait = self._breaker_wait(server_name, client, start_time)
+            if wait > 0:
+                self.poll_states[server_name]["next_due"] = start_time + wait
+                await asyncio.sleep(wait)
+                continue
+
+            try:
+                logs = await self._collect_server_logs_async(server_name, client)
+                if logs:
+                    # 加入缓存需要cache_lock（可能等待检查点或溢出），写入WAL和等待组提交时都不阻塞事件循环
+                    loop = asyncio.get_running_loop()
+                    lsn = await loop.run_in_executor(None, self._cache_logs, server_name, logs)
+                    if lsn is not None and self.wal_fsync:
+                        await loop.run_in_executor(None, self.wal.wait_durable, lsn)
+                    self.logger.debug(f"收集到 {len(logs)} 条日志 from {server_name}")
+                success = True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.warning(f"收集 {server_name} 日志失败: {e}")
+
+            if success and self._players_due(server_name):
+                try:
+                    self._record_players(server_name, await self._fetch_players(client))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.logger.debug(f"获取 {server_name} 玩家数量失败: {e}")
+
+            opened = self._record_breakers(server_name, client, success)
+            delay = self._next_poll_delay(server_name, success, start_time)
+            if opened:
+                try:
+                    await self._disconnect(client)
+                except Exception as e:
+                    self.logger.error(f"断开 {server_name} 连接失败: {e}")
+
+            self.poll_states[server_name]["next_due"] = time.time() + delay
+            await asyncio.sleep(delay)
+
+    async def _collect_server_logs_async(self, server_name: str, client: Any) -> List[LogEntry]:
+        """拉取一次单个服务器的日志（只返回没有收集过的新日志），失败时抛出异常"""
+        async with self._acquire_slots(client):
+            poll_started = time.time()
+            seconds = self._get_backtrack_seconds(server_name, poll_started)
+            logs = await self._fetch_logs(client, seconds)
+
+        if logs is None:
+            raise Exception("获取日志返回None")
+        return self._ingest_logs(server_name, logs, poll_started, seconds)
+
+    def _acquire_slots(self, client: Any) -> "_ConcurrencySlots":
+        """
+        获取按地址并发和全局并发的名额
+
+        先获取地址名额再获取全局名额：等待繁忙地址的协程不占用全局名额，其他地址的服务器不会被它们挡住
+        """
+        host_key = self._host_key(client)
+        semaphore = self._host_semaphores.get(host_key)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency_per_host)
+            self._host_semaphores[host_key] = semaphore
+        return _ConcurrencySlots(semaphore, self._global_semaphore)
+
+    async def _fetch_logs(self, client: Any, seconds: int) -> Optional[List[Dict[str, Any]]]:
+        """拉取日志：RCON客户端直接await，HTTP客户端在线程池中执行"""
+        if isinstance(client, HLLRconClient):
+            return await client.get_admin_logs(seconds=seconds)
+
+        return await self.loop.run_in_executor(self._http_executor, self._fetch_logs_blocking, client, seconds)
+
+    async def _fetch_players(self, client: Any) -> Optional[List[Dict[str, Any]]]:
+        """获取玩家列表，占用与拉取日志相同的并发名额"""
+        async with self._acquire_slots(client):
+            if isinstance(client, HLLRconClient):
+                return await client.get_players()
+            return await self.loop.run_in_executor(self._http_executor, client.get_players)
+
+    @staticmethod
+    def _fetch_logs_blocking(client: HLLHttpClient, seconds: int) -> Optional[List[Dict[str, Any]]]:
+        """在线程池中执行的HTTP拉取（会话失效时由客户端重新连接并重试）"""
+        return client.get_admin_logs(seconds=seconds)
+
+    async def _disconnect(self, client: Any):
+        """断开客户端连接"""
+        if isinstance(client, HLLRconClient):
+            await client.disconnect()
+        else:
+            await self.loop.run_in_executor(self._http_executor, client.disconnect)
+
+class _ConcurrencySlots:
+    """按顺序获取多个信号量的异步上下文管理器（按相反顺序释放）"""
+
+    def __init__(self, *semaphores: asyncio.Semaphore):
+        self.semaphores = semaphores
+
+    async def __aenter__(self):
+        acquired = []
+        try:
+            for semaphore in self.semaphores:
+                await semaphore.acquire()
+                acquired.append(semaphore)
+        except BaseException:
+            for semaphore in reversed(acquired):
+                semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        for semaphore in reversed(self.semaphores):
+            semaphore.release()
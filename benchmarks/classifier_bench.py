@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+日志分类器基准测试
+生成模拟的管理员日志，比较关键字分派与逐条正则匹配的耗时，并校验两者的分类结果完全一致
+
+用法:
+    python benchmarks/classifier_bench.py --lines 3000000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_classifier import LogClassifier
+
+NAMES = ["esc—5", "ICE Tea", "美术特长生", "晟循", "javito", "於罔yu", "World's End Dancehall",
+         "WinterKill", "Defeated", "Matchbox", "kill: -> with", "Kaiser", "Round[1]", "gamer>", "(team)"]
+# re.IGNORECASE与str.lower()处理方式不同的字符（İ、ſ、开尔文符号、ı），实际很少出现
+RARE_NAMES = ["İstanbul", "ſniper", "Kaiser", "ıvan"]
+WEAPONS = ["M1 GARAND", "MP40", "150MM HOWITZER [sFH 18]", "KARABINER 98K", "GRENADE", "Tank Win"]
+MESSAGES = ["KKKKK", "gg", "win this one", "push mid", "defeat incoming", "team kill: sorry -> with love",
+            "我们赢了", "connected (yes)", "game end soon", "teamswitch (a > b)"]
+
+def _name(rng: random.Random) -> str:
+    return rng.choice(RARE_NAMES) if rng.random() < 0.002 else rng.choice(NAMES)
+
+def _player(rng: random.Random) -> str:
+    team = rng.choice(["Allies", "Axis"])
+    return f"{_name(rng)}({team}/7656119{rng.randint(0, 10**10):010d})"
+
+def generate_messages(count: int, seed: int = 1) -> list:
+    """生成模拟日志消息（各类型比例接近实际服务器）"""
+    rng = random.Random(seed)
+    epoch = 1761193883
+    messages = []
+
+    for i in range(count):
+        prefix = f"[{rng.randint(0, 59)}:{rng.randint(0, 59):02d} min ({epoch + i // 10})]"
+        roll = rng.random()
+        if roll < 0.55:
+            body = f"KILL: {_player(rng)} -> {_player(rng)} with {rng.choice(WEAPONS)}"
+        elif roll < 0.58:
+            body = f"TEAM KILL: {_player(rng)} -> {_player(rng)} with {rng.choice(WEAPONS)}"
+        elif roll < 0.73:
+            channel = rng.choice(["Team", "Unit", "All"])
+            body = f"CHAT[{channel}][{_player(rng)}]: {rng.choice(MESSAGES)}"
+        elif roll < 0.83:
+            verb = rng.choice(["CONNECTED", "DISCONNECTED"])
+            body = f"{verb} {_name(rng)} (7656119{rng.randint(0, 10**10):010d})"
+        elif roll < 0.89:
+            body = f"TEAMSWITCH {_name(rng)} ({rng.choice(['None', 'Allies', 'Axis'])} > {rng.choice(['Allies', 'Axis'])})"
+        elif roll < 0.90:
+            body = rng.choice(["MATCH START CARENTAN Warfare", "MATCH ENDED `CARENTAN Warfare` ALLIED (2 - 3) AXIS"])
+        elif roll < 0.995:
+            body = rng.choice([
+                f"KICK: [{_name(rng)}] has been kicked. [Idle]",
+                f"BAN: [{_name(rng)}] has been banned. [Cheating]",
+                f"MESSAGE: player [{_name(rng)}(7656119{rng.randint(0, 10**10):010d})], content [Welcome]",
+                f"VOTESYS: Player [{_name(rng)}] voted [PV_Favour] for VoteID[2]",
+                f"Player [{_name(rng)}] Entered Admin Camera",
+            ])
+        else:
+            # 没有前缀、包含换行等少见格式
+            body = rng.choice(["", "multi\nline KILL: a -> b with c", "unknown event WIN"])
+            if rng.random() < 0.5:
+                messages.append(body)
+                continue
+        messages.append(f"{prefix} {body}")
+
+    return messages
+
+def _time(classify, entries: list) -> tuple:
+    start = time.perf_counter()
+    results = [classify(entry) for entry in entries]
+    return time.perf_counter() - start, results
+
+def main():
+    parser = argparse.ArgumentParser(description="日志分类器基准测试")
+    parser.add_argument("--lines", type=int, default=2000000, help="日志条数")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    args = parser.parse_args()
+
+    print(f"生成 {args.lines} 条模拟日志...")
+    entries = [{"message": message} for message in generate_messages(args.lines, args.seed)]
+
+    classifier = LogClassifier()
+    legacy_time, legacy_results = _time(classifier.classify_log_legacy, entries)
+    dispatch_time, dispatch_results = _time(classifier.classify_log, entries)
+
+    mismatches = [i for i, (a, b) in enumerate(zip(legacy_results, dispatch_results)) if a != b]
+
+    print(f"逐条正则匹配: {legacy_time:.2f}秒 ({args.lines / legacy_time:,.0f} 条/秒)")
+    print(f"关键字分派:   {dispatch_time:.2f}秒 ({args.lines / dispatch_time:,.0f} 条/秒)")
+    print(f"加速比: {legacy_time / dispatch_time:.2f}x")
+    print(f"分类分布: { {log_type.name: count for log_type, count in Counter(dispatch_results).items()} }")
+    print(f"分派统计: {classifier.stats}")
+
+    if mismatches:
+        for i in mismatches[:10]:
+            print(f"结果不一致: {entries[i]['message']!r} {legacy_results[i]} != {dispatch_results[i]}")
+        sys.exit(1)
+    print("两种实现的分类结果完全一致")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+预写日志fsync基准测试
+多个线程模拟并发的服务器拉取，每次拉取写入一条WAL记录并等待其同步到磁盘，比较:
+    - 逐条fsync: 每条记录写入后在锁内单独fsync
+    - 立即组提交: sync_interval=0，fsync期间到达的记录共用下一次fsync
+    - 定时组提交: 最早的未同步记录最多等待sync_interval秒，fsync次数最少
+
+用法:
+    python benchmarks/fsync_bench.py --threads 32 --records 200 --dir /var/tmp/wal_bench
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from write_ahead_log import WriteAheadLog, encode_record, read_records
+
+def make_entries(count: int, thread_id: int, seq: int) -> list:
+    """生成一次拉取返回的模拟日志条目"""
+    epoch = 1761193883 + seq
+    return [
+        {"timestamp": f"[{epoch}]", "message": f"[{epoch}] KILL: Player{thread_id}(Allies/7656119{seq:010d}) -> "
+                                                f"Enemy{i}(Axis/7656119{i:010d}) with M1 GARAND"}
+        for i in range(count)
+    ]
+
+def run_per_record(directory: str, threads: int, records: int, entries: int) -> dict:
+    """每条记录写入后在锁内单独fsync（对照组）"""
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    lock = threading.Lock()
+    latencies = []
+    fsync_times = []
+
+    with open(os.path.join(directory, "00000001.wal"), 'ab') as f:
+        def worker(thread_id: int):
+            local = []
+            for seq in range(records):
+                record = encode_record(f"server{thread_id}", make_entries(entries, thread_id, seq))
+                start = time.perf_counter()
+                with lock:
+                    f.write(record)
+                    f.flush()
+                    sync_start = time.perf_counter()
+                    os.fsync(f.fileno())
+                    fsync_times.append(time.perf_counter() - sync_start)
+                local.append(time.perf_counter() - start)
+            with lock:
+                latencies.extend(local)
+
+        elapsed = _run_workers(worker, threads)
+
+    return _summary(directory, threads, records, elapsed, latencies, {
+        'fsyncs': len(fsync_times),
+        'records_per_fsync': 1,
+        'avg_fsync_ms': sum(fsync_times) * 1000 / len(fsync_times),
+        'max_fsync_ms': max(fsync_times) * 1000,
+    })
+
+def _run_workers(worker, threads: int) -> float:
+    """启动线程并等待结束，返回耗时"""
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return time.perf_counter() - start
+
+def _summary(directory: str, threads: int, records: int, elapsed: float, latencies: list, stats: dict) -> dict:
+    """校验所有记录都能完整读回并汇总结果"""
+    recovered = sum(len(read_records(os.path.join(directory, name))[0]) for name in os.listdir(directory))
+    assert recovered == threads * records, (recovered, threads * records)
+
+    latencies.sort()
+    return {
+        "records_per_second": threads * records / elapsed,
+        "fsyncs": stats['fsyncs'],
+        "records_per_fsync": stats.get('records_per_fsync', 0),
+        "avg_fsync_ms": stats.get('avg_fsync_ms', 0),
+        "max_fsync_ms": stats['max_fsync_ms'],
+        "p50_wait_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_wait_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+def run(directory: str, threads: int, records: int, entries: int, sync_interval: float) -> dict:
+    """
+    运行一轮测试
+
+    Args:
+        directory: WAL目录
+        threads: 并发线程数
+        records: 每个线程写入的记录数
+        entries: 每条记录的日志条数
+        sync_interval: 组提交等待时间，0表示没有正在进行的fsync时立即fsync
+
+    Returns:
+        dict: 测试结果
+    """
+    shutil.rmtree(directory, ignore_errors=True)
+    wal = WriteAheadLog(directory, sync_interval=sync_interval)
+    wal.open()
+    latencies = []
+    latency_lock = threading.Lock()
+
+    def worker(thread_id: int):
+        local = []
+        for seq in range(records):
+            record = encode_record(f"server{thread_id}", make_entries(entries, thread_id, seq))
+            start = time.perf_counter()
+            wal.wait_durable(wal.append_encoded(record))
+            local.append(time.perf_counter() - start)
+        with latency_lock:
+            latencies.extend(local)
+
+    elapsed = _run_workers(worker, threads)
+    wal.close()
+    return _summary(directory, threads, records, elapsed, latencies, wal.get_stats())
+
+def main():
+    parser = argparse.ArgumentParser(description='预写日志fsync基准测试')
+    parser.add_argument('--threads', type=int, default=32, help='并发线程数（模拟并发拉取的服务器）')
+    parser.add_argument('--records', type=int, default=200, help='每个线程写入的记录数')
+    parser.add_argument('--entries', type=int, default=20, help='每条记录的日志条数')
+    parser.add_argument('--sync-interval', type=float, default=0.05, help='组提交等待时间（秒）')
+    parser.add_argument('--dir', help='WAL目录（应位于实际存放日志的磁盘上），默认使用临时目录')
+    args = parser.parse_args()
+
+    base = args.dir or tempfile.mkdtemp(prefix="wal_bench_")
+    try:
+        directory = os.path.join(base, "wal")
+        runs = (
+            ("逐条fsync", lambda: run_per_record(directory, args.threads, args.records, args.entries)),
+            ("立即组提交", lambda: run(directory, args.threads, args.records, args.entries, 0)),
+            ("定时组提交", lambda: run(directory, args.threads, args.records, args.entries, args.sync_interval)),
+        )
+        for name, bench in runs:
+            result = bench()
+            print(f"{name}: {result['records_per_second']:.0f} 记录/秒, fsync {result['fsyncs']} 次 "
+                  f"(每次 {result['records_per_fsync']} 条记录, 平均 {result['avg_fsync_ms']:.2f}ms, "
+                  f"最长 {result['max_fsync_ms']:.2f}ms), 等待 p50 {result['p50_wait_ms']:.2f}ms "
+                  f"p99 {result['p99_wait_ms']:.2f}ms")
+    finally:
+        shutil.rmtree(os.path.join(base, "wal"), ignore_errors=True)
+        if not args.dir:
+            shutil.rmtree(base, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
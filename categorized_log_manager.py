@@ -5,22 +5,51 @@
 
 import json
 import os
-from datetime import datetime
-from typing import Dict, List, Any
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Tuple, Iterable, Iterator, Optional
 from log_classifier import LogClassifier, LogType
+from log_parser import LogParser, KillEvent
+from segment_manifest import ManifestStore
+from aggregate_store import AggregateStore
+from chat_index import ChatIndex
+from kill_columns import KILL_COLUMNS_EXTENSION, KillColumns, KillColumnReader, append_kill_block
+from segment_io import (
+    STORAGE_FORMATS, segment_extension, segment_files, read_segment, partition_by_hour,
+    iter_hours, in_time_range, storable_entry, write_json_atomic, sync_files, SegmentWriterPool
+)
 
 class CategorizedLogManager:
     """分类日志管理器"""
     
-    def __init__(self, base_logs_dir: str = "logs"):
+    def __init__(self, base_logs_dir: str = "logs", storage_format: str = "json",
+                 max_open_files: int = 64, idle_timeout: float = 300,
+                 classifier_rules: Optional[List[Dict[str, Any]]] = None, kill_columns: bool = False,
+                 chat_index: bool = False):
         """
         初始化分类日志管理器
         
         Args:
             base_logs_dir: 日志基础目录
+            storage_format: 存储格式，json（整个文件重写）或jsonl（通过常驻句柄追加）
+            max_open_files: jsonl格式下最多同时打开的文件句柄数量
+            idle_timeout: jsonl格式下句柄空闲多少秒后关闭
+            classifier_rules: 自定义分类规则，默认使用log_classifier.DEFAULT_RULES
+            kill_columns: 是否额外保存列式击杀文件（kills_*.kcol），用于快速统计
+            chat_index: 是否为聊天日志建立全文索引
         """
+        if storage_format not in STORAGE_FORMATS:
+            raise ValueError(f"不支持的存储格式: {storage_format}")
+        
         self.base_logs_dir = base_logs_dir
-        self.classifier = LogClassifier()
+        self.storage_format = storage_format
+        self.classifier = LogClassifier(classifier_rules)
+        self.writer_pool = SegmentWriterPool(max_open_files=max_open_files, idle_timeout=idle_timeout)
+        self._unsynced_files: set = set()  # 上次sync之后写入过的分段文件
+        self.kill_columns = kill_columns
+        self._parser: Optional[LogParser] = None  # 日志没有预先解析的事件记录时使用
+        
+        # 预先计算的小时目录和文件名片段: (服务器, 年, 月, 日, 时) -> (目录, 文件名后缀)
+        self._hour_paths: Dict[Tuple, Tuple[str, str]] = {}
         
         # 为每种日志类型定义文件名前缀
         self.type_prefixes = {
@@ -31,8 +60,50 @@ class CategorizedLogManager:
             LogType.TEAM_SWITCH: "teams",
             LogType.OTHER: "other"
         }
+        
+        # 分段清单，统计只读取清单
+        self.manifests = ManifestStore("categorized", self.type_prefixes.values(), self.classifier)
+        
+        # 按 服务器 × 类型 × 小时 累加的数量，任意时间范围的统计只读取汇总
+        self.aggregates = AggregateStore(base_logs_dir)
+        
+        # 聊天全文索引
+        self.chat_index: Optional[ChatIndex] = ChatIndex(base_logs_dir) if chat_index else None
+    
+    def _get_hour_path(self, server_name: str, timestamp: datetime, create: bool = True) -> Tuple[str, str]:
+        """
+        获取小时分段所在目录和文件名中的日期部分（结果会被缓存）
+        
+        Args:
+            server_name: 服务器名称
+            timestamp: 时间戳
+            create: 是否创建目录
+            
+        Returns:
+            Tuple[str, str]: (目录路径, 形如"2025-10-23_12"的日期小时)
+        """
+        key = (server_name, timestamp.year, timestamp.month, timestamp.day, timestamp.hour)
+        cached = self._hour_paths.get(key)
+        if cached is not None:
+            return cached
+        
+        # 创建目录结构: logs/server1/25_10/23/kills_2025-10-23_12.json
+        year_month = f"{timestamp.year % 100:02d}_{timestamp.month:02d}"
+        day = f"{timestamp.day:02d}"
+        date_hour = f"{timestamp.year:04d}-{timestamp.month:02d}-{timestamp.day:02d}_{timestamp.hour:02d}"
+        
+        log_dir = os.path.join(self.base_logs_dir, server_name, year_month, day)
+        if not create:
+            return log_dir, date_hour
+        
+        os.makedirs(log_dir, exist_ok=True)
+        if len(self._hour_paths) >= 4096:
+            self._hour_paths.clear()
+        self._hour_paths[key] = (log_dir, date_hour)
+        return log_dir, date_hour
     
-    def _get_log_file_path(self, server_name: str, log_type: LogType, timestamp: datetime = None) -> str:
+    def _get_log_file_path(self, server_name: str, log_type: LogType, timestamp: datetime = None,
+                           storage_format: str = None, create: bool = True) -> str:
         """
         获取指定类型日志的文件路径
         
@@ -40,76 +111,205 @@ class CategorizedLogManager:
             server_name: 服务器名称
             log_type: 日志类型
             timestamp: 时间戳，默认使用当前时间
+            storage_format: 存储格式，默认为当前配置的格式
+            create: 是否创建目录
             
         Returns:
             str: 日志文件路径
         """
         if timestamp is None:
             timestamp = datetime.now()
+        if storage_format is None:
+            storage_format = self.storage_format
         
-        # 创建目录结构: logs/server1/25_10/23/kills_2025-10-23_12.json
-        year_month = timestamp.strftime("%y_%m")
-        day = timestamp.strftime("%d")
-        hour = timestamp.strftime("%H")
-        date_str = timestamp.strftime("%Y-%m-%d")
-        
-        log_dir = os.path.join(self.base_logs_dir, server_name, year_month, day)
-        os.makedirs(log_dir, exist_ok=True)
+        log_dir, date_hour = self._get_hour_path(server_name, timestamp, create)
         
         prefix = self.type_prefixes[log_type]
-        filename = f"{prefix}_{date_str}_{hour}.json"
+        filename = f"{prefix}_{date_hour}{segment_extension(storage_format)}"
         
         return os.path.join(log_dir, filename)
     
-    def save_categorized_logs(self, server_name: str, logs: List[Dict[str, Any]]) -> Dict[str, int]:
+    def _get_kill_columns_path(self, server_name: str, timestamp: datetime, create: bool = True) -> str:
+        """获取列式击杀文件路径，与同一小时的击杀日志在同一目录"""
+        log_dir, date_hour = self._get_hour_path(server_name, timestamp, create)
+        return os.path.join(log_dir, f"{self.type_prefixes[LogType.KILL]}_{date_hour}{KILL_COLUMNS_EXTENSION}")
+    
+    def _kill_events(self, logs: List[Dict[str, Any]]) -> List[KillEvent]:
+        """获取击杀日志的事件记录，没有预先解析的日志在这里解析"""
+        events = []
+        for log in logs:
+            event = log.get('event')
+            if event is None:
+                if self._parser is None:
+                    self._parser = LogParser(self.classifier)
+                event = self._parser.parse(log.get('message', ''))
+            if isinstance(event, KillEvent):
+                events.append(event)
+        return events
+    
+    def save_categorized_logs(self, server_name: str, logs: List[Dict[str, Any]],
+                              written_parts: Optional[set] = None) -> Dict[str, int]:
         """
         按类别保存日志
         
         Args:
             server_name: 服务器名称
             logs: 日志列表
+            written_parts: 已写入的 (小时, 类型) 集合，跳过其中的部分并加入本次写入成功的部分。
+                           失败后用同一个集合重试同一批日志，不会重复写入之前成功的类型和小时
             
         Returns:
-            Dict[str, int]: 各类型保存的日志数量
+            Dict[str, int]: 各类型保存的日志数量（不包括跳过的部分）
+            
+        Raises:
+            IOError: 写入分类文件失败，在第一个失败的文件处停止（之前写入的文件不会回滚，
+                     分类日志没有去重，不传入written_parts重试时这些日志会重复）
         """
         if not logs:
             return {}
         
-        # 分类日志
-        classified_logs = self.classifier.classify_logs(logs)
         save_counts = {}
         
+        try:
+            # 按事件时间所在的小时保存，跨小时的日志分别写入对应文件
+            for timestamp, hour_logs in sorted(partition_by_hour(logs).items()):
+                # 分类日志
+                classified_logs = self.classifier.classify_logs(hour_logs)
+                hour_counts = {}
+                try:
+                    self._save_classified_logs(server_name, classified_logs, timestamp, hour_counts, written_parts)
+                finally:
+                    # 只统计本次写入的部分
+                    self.aggregates.record(server_name, timestamp, hour_counts)
+                for log_type, count in hour_counts.items():
+                    save_counts[log_type] = save_counts.get(log_type, 0) + count
+        finally:
+            self._flush_indexes()
+        
+        return save_counts
+    
+    def _flush_indexes(self):
+        """关闭空闲的文件句柄，写入本次保存修改过的清单、聚合统计和聊天索引"""
+        self.writer_pool.close_idle()
+        
+        try:
+            self.manifests.flush()
+        except Exception as e:
+            print(f"写入分段清单失败: {e}")
+        
+        try:
+            self.aggregates.flush()
+        except Exception as e:
+            print(f"写入聚合统计失败: {e}")
+        
+        if self.chat_index is not None:
+            try:
+                self.chat_index.flush()
+            except Exception as e:
+                print(f"提交聊天索引失败: {e}")
+    
+    def _save_classified_logs(self, server_name: str, classified_logs: Dict[LogType, List[Dict[str, Any]]],
+                              timestamp: datetime, save_counts: Dict[str, int],
+                              written_parts: Optional[set] = None):
+        """
+        保存同一小时内已分类的日志
+        
+        Args:
+            server_name: 服务器名称
+            classified_logs: 按类型分组的日志
+            timestamp: 日志所属的小时
+            save_counts: 各类型保存数量，累加到该字典中
+            written_parts: 已写入的 (小时, 类型) 集合，跳过其中的类型并加入本次写入成功的类型
+            
+        Raises:
+            IOError: 写入分类文件失败（列式击杀文件和聊天索引是附加数据，失败时只打印错误）
+        """
+        hour_key = (timestamp.year, timestamp.month, timestamp.day, timestamp.hour)
+        
         # 为每种类型的日志保存到对应文件
         for log_type, type_logs in classified_logs.items():
             if not type_logs:  # 跳过空的日志类型
                 continue
+            part = (timestamp, log_type.value)
+            if written_parts is not None and part in written_parts:
+                continue
                 
-            file_path = self._get_log_file_path(server_name, log_type)
+            file_path = self._get_log_file_path(server_name, log_type, timestamp)
+            
+            if self.storage_format == "jsonl":
+                # 通过常驻句柄追加，只写入新数据
+                try:
+                    self.writer_pool.append(file_path, type_logs, group=(server_name, log_type), hour_key=hour_key)
+                    self._unsynced_files.add(file_path)
+                    self.manifests.record_append(file_path, type_logs, log_type)
+                    save_counts[log_type.value] = save_counts.get(log_type.value, 0) + len(type_logs)
+                    print(f"保存了 {len(type_logs)} 条{log_type.value}到 {file_path}")
+                except IOError as e:
+                    print(f"保存{log_type.value}失败: {e}")
+                    raise
+            else:
+                self._rewrite_json_segment(file_path, log_type, type_logs, save_counts)
             
+            # 分类文件写入成功后才更新附加数据，重试时不会重复写入
+            self._save_derived_data(server_name, log_type, type_logs, timestamp)
+            if written_parts is not None:
+                written_parts.add(part)
+    
+    def _save_derived_data(self, server_name: str, log_type: LogType, type_logs: List[Dict[str, Any]],
+                           timestamp: datetime):
+        """更新列式击杀文件和聊天索引（附加数据，失败时只打印错误）"""
+        if log_type == LogType.KILL and self.kill_columns:
+            columns_path = self._get_kill_columns_path(server_name, timestamp)
+            try:
+                append_kill_block(columns_path, self._kill_events(type_logs))
+                self._unsynced_files.add(columns_path)
+            except IOError as e:
+                print(f"保存列式击杀文件失败: {e}")
+        
+        if log_type == LogType.CHAT and self.chat_index is not None:
+            try:
+                self.chat_index.record_messages(server_name, type_logs, timestamp)
+            except Exception as e:
+                print(f"更新聊天索引失败: {e}")
+    
+    def _rewrite_json_segment(self, file_path: str, log_type: LogType, type_logs: List[Dict[str, Any]],
+                              save_counts: Dict[str, int]):
+        """
+        json格式：读取现有日志，合并后原子地重写整个分段文件
+        
+        Raises:
+            IOError: 写入失败
+        """
+        # 持有写入器池的锁，封存线程不会在读取和重写之间替换该文件
+        with self.writer_pool.lock:
             # 读取现有日志（如果文件存在）
             existing_logs = []
             if os.path.exists(file_path):
                 try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        existing_logs = json.load(f)
+                    existing_logs = read_segment(file_path)
                 except (json.JSONDecodeError, IOError):
+                    # 保留损坏的文件以便人工恢复，而不是直接覆盖
+                    corrupt_path = f"{file_path}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+                    os.rename(file_path, corrupt_path)
+                    self.manifests.reset_segment(file_path)
+                    print(f"{log_type.value}文件格式错误，已另存为 {corrupt_path}，将重新创建: {file_path}")
                     existing_logs = []
-            
+        
             # 合并新日志
             all_logs = existing_logs + type_logs
-            
-            # 保存到文件
+        
+            # 原子地保存到文件，写入中断不会破坏原文件
             try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(all_logs, f, ensure_ascii=False, indent=2)
-                
-                save_counts[log_type.value] = len(type_logs)
+                write_json_atomic(file_path, [storable_entry(log) for log in all_logs])
+                self._unsynced_files.add(file_path)
+                self.manifests.record_append(file_path, type_logs, log_type)
+            
+                save_counts[log_type.value] = save_counts.get(log_type.value, 0) + len(type_logs)
                 print(f"保存了 {len(type_logs)} 条{log_type.value}到 {file_path}")
-                
+            
             except IOError as e:
                 print(f"保存{log_type.value}失败: {e}")
-        
-        return save_counts
+                raise
     
     def get_categorized_logs(self, server_name: str, log_type: LogType, 
                            date: datetime = None) -> List[Dict[str, Any]]:
@@ -124,16 +324,72 @@ class CategorizedLogManager:
         Returns:
             List[Dict]: 指定类型的日志列表
         """
-        file_path = self._get_log_file_path(server_name, log_type, date)
+        logs = []
         
-        if not os.path.exists(file_path):
-            return []
+        # 同时读取json和jsonl两种格式的文件，已封存的分段自动解压
+        for storage_format in STORAGE_FORMATS:
+            segment_path = self._get_log_file_path(server_name, log_type, date, storage_format, create=False)
+            for file_path in segment_files(segment_path):
+                try:
+                    logs.extend(read_segment(file_path))
+                except (json.JSONDecodeError, IOError, EOFError):
+                    continue
         
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return []
+        return logs
+    
+    def read_range(self, server_name: str, start: datetime, end: datetime,
+                   types: Iterable[LogType] = None) -> Iterator[Dict[str, Any]]:
+        """
+        读取时间范围内的分类日志，只打开与范围重叠的小时文件
+        
+        Args:
+            server_name: 服务器名称
+            start: 开始时间
+            end: 结束时间
+            types: 要读取的日志类型，默认读取所有类型
+            
+        Yields:
+            Dict: 事件时间在范围内的日志条目
+        """
+        if types is None:
+            types = list(LogType)
+        else:
+            types = list(types)
+        
+        start_epoch = start.timestamp()
+        end_epoch = end.timestamp()
+        
+        for hour in iter_hours(start, end):
+            log_dir, _ = self._get_hour_path(server_name, hour, create=False)
+            if not os.path.isdir(log_dir):
+                continue
+            
+            for log_type in types:
+                for log in self.get_categorized_logs(server_name, log_type, hour):
+                    if in_time_range(log, start_epoch, end_epoch):
+                        yield log
+    
+    def read_kill_columns(self, server_name: str, start: datetime, end: datetime) -> Iterator[KillColumns]:
+        """
+        读取时间范围内的列式击杀数据（需要启用kill_columns）
+        
+        Args:
+            server_name: 服务器名称
+            start: 开始时间
+            end: 结束时间
+            
+        Yields:
+            KillColumns: 各块在范围内的列视图，只在迭代到下一个小时文件之前有效
+        """
+        start_epoch = start.timestamp()
+        end_epoch = end.timestamp()
+        
+        for hour in iter_hours(start, end):
+            columns_path = self._get_kill_columns_path(server_name, hour, create=False)
+            if not os.path.exists(columns_path):
+                continue
+            with KillColumnReader(columns_path) as reader:
+                yield from reader.iter_blocks(start_epoch, end_epoch)
     
     def get_log_statistics(self, server_name: str, date: datetime = None) -> Dict[str, int]:
         """
@@ -141,18 +397,41 @@ class CategorizedLogManager:
         
         Args:
             server_name: 服务器名称
-            date: 日期，默认使用当前日期
+            date: 统计该时间所在的小时，默认使用当前时间
             
         Returns:
             Dict[str, int]: 各类型日志的数量统计
         """
-        statistics = {}
+        if date is None:
+            date = datetime.now()
+        hour = date.replace(minute=0, second=0, microsecond=0)
+        return self.aggregates.count(server_name, hour, hour + timedelta(hours=1))
+    
+    def get_range_statistics(self, server_names: Iterable[str], start: datetime, end: datetime) -> Dict[str, Any]:
+        """
+        获取多个服务器在任意时间范围内各类型日志的数量，只读取聚合统计
         
-        for log_type in LogType:
-            logs = self.get_categorized_logs(server_name, log_type, date)
-            statistics[log_type.value] = len(logs)
+        Args:
+            server_names: 服务器名称
+            start: 开始时间
+            end: 结束时间（按整点小时计算）
+            
+        Returns:
+            Dict: {"servers": {服务器: {类型: 数量}}, "total": {类型: 数量}}
+        """
+        return self.aggregates.count_servers(server_names, start, end)
+    
+    def search_chat(self, server_names: Iterable[str], query: str = "", start: datetime = None, end: datetime = None,
+                    channel: str = None, player: str = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        通过聊天索引搜索聊天消息，参数见ChatIndex.search
         
-        return statistics
+        Raises:
+            RuntimeError: 未启用聊天索引
+        """
+        if self.chat_index is None:
+            raise RuntimeError("未启用聊天索引（log_settings.chat_index）")
+        return self.chat_index.search(server_names, query, start, end, channel, player, limit)
     
     def cleanup_old_logs(self, server_name: str, days_to_keep: int = 30):
         """
@@ -163,7 +442,28 @@ class CategorizedLogManager:
             days_to_keep: 保留天数
         """
         # 这里可以实现清理逻辑，删除超过指定天数的日志文件
-        pass
+        # 聊天索引按日期分区，与原始日志使用相同的保留期限
+        if self.chat_index is not None:
+            cutoff = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days_to_keep)
+            self.chat_index.drop_before(server_name, cutoff)
+    
+    def sync(self):
+        """把上次sync之后写入过的分类日志文件同步到磁盘"""
+        with self.writer_pool.lock:
+            unsynced_files, self._unsynced_files = self._unsynced_files, set()
+        try:
+            sync_files(unsynced_files)
+        except OSError:
+            # 同步失败的文件留到下次同步，检查点不会在它们落盘之前删除WAL
+            with self.writer_pool.lock:
+                self._unsynced_files |= unsynced_files
+            raise
+    
+    def close(self):
+        """关闭所有打开的文件句柄"""
+        self.writer_pool.close_all()
+        if self.chat_index is not None:
+            self.chat_index.close()
 
 def main():
     """测试分类日志管理器"""
@@ -0,0 +1,250 @@
+"""
+聊天全文索引
+保存分类日志时为聊天事件建立倒排索引：拉丁文字按单词切分，中日韩文字按单个字和相邻两个字（二元组）切分，
+查询时连续的中文按二元组、单独的一个字按单字查找，先用索引求出同时包含所有词项的消息，
+再按短语、频道、玩家和时间过滤，不需要扫描 chat_*.json 文件。
+
+索引按日期分区，每个服务器每天一个SQLite文件:
+    logs/server1/.chat/2025-10-23.sqlite
+"""
+
+import os
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+from log_classifier import get_event_epoch
+from log_parser import LogParser, ChatEvent
+from partitioned_index import PartitionedIndex
+from segment_io import segment_files, read_segment
+from segment_manifest import list_segments
+
+CHAT_INDEX_DIRECTORY = ".chat"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    epoch INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    sender_id TEXT NOT NULL,
+    sender_team TEXT NOT NULL,
+    text TEXT NOT NULL,
+    UNIQUE (epoch, sender_id, channel, text)
+);
+CREATE INDEX IF NOT EXISTS messages_sender ON messages (sender_id);
+CREATE TABLE IF NOT EXISTS postings (
+    token TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    PRIMARY KEY (token, message_id)
+) WITHOUT ROWID;
+"""
+
+# 按二元组切分的文字：中日韩统一表意文字、假名和谚文
+_CJK_RANGES = (
+    "぀-ヿ"   # 平假名、片假名
+    "㐀-䶿"   # 扩展A
+    "一-鿿"   # 基本区
+    "가-힯"   # 谚文
+    "豈-﫿"   # 兼容表意文字
+)
+_TOKEN_PATTERN = re.compile(f"(?P<cjk>[{_CJK_RANGES}]+)|(?P<word>[^\\W{_CJK_RANGES}]+)")
+
+def normalize_text(text: str) -> str:
+    """统一全角半角和大小写"""
+    return unicodedata.normalize('NFKC', text).casefold()
+
+def tokenize(text: str, unigrams: bool = False) -> List[str]:
+    """
+    切分聊天文本：拉丁文字、数字按单词切分，中日韩文字按二元组切分（单个字作为一个词项）
+
+    Args:
+        text: 聊天文本
+        unigrams: 是否同时输出连续中日韩文字中的每个字（建立索引时使用，单个字的查询才能匹配）
+
+    Returns:
+        List[str]: 按出现顺序排列的词项
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(normalize_text(text)):
+        run = match.group('cjk')
+        if run is None:
+            tokens.append(match.group('word'))
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            if unigrams:
+                tokens.extend(run)
+    return tokens
+
+def parse_query(query: str) -> Tuple[List[str], List[str]]:
+    """
+    解析查询：引号中的内容是必须连续出现的短语，其余部分是必须全部出现的词
+
+    Args:
+        query: 查询文本，例如 '"好 好 学习" noob'
+
+    Returns:
+        Tuple[List[str], List[str]]: (词项, 规范化后的短语)
+    """
+    phrases = [normalize_text(phrase).strip() for phrase in re.findall(r'"([^"]+)"', query)]
+    phrases = [phrase for phrase in phrases if phrase]
+    tokens = tokenize(query.replace('"', ' '))
+    return list(dict.fromkeys(tokens)), phrases
+
+class ChatIndex(PartitionedIndex):
+    """
+    按日期分区的聊天全文索引
+
+    保存聊天日志后调用record_messages添加索引，flush时提交；search按时间倒序返回匹配的消息
+    """
+
+    INDEX_DIRECTORY = CHAT_INDEX_DIRECTORY
+    SCHEMA = _SCHEMA
+    INDEX_NAME = "聊天索引"
+    ITEM_UNIT = "条消息"
+
+    def __init__(self, logs_directory: str = "logs", parser: Optional[LogParser] = None,
+                 max_open_partitions: int = 16):
+        """
+        初始化聊天索引
+
+        Args:
+            logs_directory: 日志基础目录
+            parser: 没有预先解析事件记录的日志使用的解析器，默认在需要时创建
+            max_open_partitions: 最多同时打开的分区数量
+        """
+        super().__init__(logs_directory, parser, max_open_partitions)
+        self.stats.update({
+            'indexed_messages': 0,
+            'searches': 0
+        })
+
+    def record_messages(self, server_name: str, entries: Iterable[Dict[str, Any]], default_time: datetime):
+        """
+        为聊天日志建立索引（调用flush后提交），同一条消息重复保存时只索引一次
+
+        Args:
+            server_name: 服务器名称
+            entries: 聊天日志条目，不是聊天事件的条目会被跳过
+            default_time: 无法确定事件时间时使用的时间
+        """
+        by_date: Dict[str, List[Tuple[int, ChatEvent]]] = {}
+        for entry in entries:
+            event = self._event(entry)
+            if not isinstance(event, ChatEvent):
+                continue
+            epoch = event.epoch if event.epoch is not None else get_event_epoch(entry)
+            epoch = int(epoch if epoch is not None else default_time.timestamp())
+            date = datetime.fromtimestamp(epoch).date().isoformat()
+            by_date.setdefault(date, []).append((epoch, event))
+
+        with self.lock:
+            for date, messages in by_date.items():
+                connection = self._partition(server_name, date, create=True)
+                for epoch, event in messages:
+                    cursor = connection.execute(
+                        "INSERT OR IGNORE INTO messages (epoch, channel, sender, sender_id, sender_team, text)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        (epoch, event.channel or "", event.sender or "", event.sender_id or "",
+                         event.sender_team or "", event.text or "")
+                    )
+                    if not cursor.rowcount:
+                        continue
+                    message_id = cursor.lastrowid
+                    connection.executemany(
+                        "INSERT OR IGNORE INTO postings (token, message_id) VALUES (?, ?)",
+                        [(token, message_id) for token in set(tokenize(event.text or "", unigrams=True))]
+                    )
+                    self.stats['indexed_messages'] += 1
+                self._dirty.add((server_name, date))
+
+    def search(self, server_names: Iterable[str], query: str = "", start: Optional[datetime] = None,
+               end: Optional[datetime] = None, channel: Optional[str] = None, player: Optional[str] = None,
+               limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        搜索聊天消息
+
+        Args:
+            server_names: 要搜索的服务器
+            query: 查询文本，引号中的内容按短语匹配，其余的词必须全部出现；为空时只按条件过滤
+            start: 开始时间，默认为30天前
+            end: 结束时间，默认为当前时间
+            channel: 频道（Team、Unit或All），不区分大小写
+            player: 发送者的玩家ID或名称（名称不区分大小写）
+            limit: 最多返回的消息数量
+
+        Returns:
+            List[Dict]: 按时间倒序排列的消息，包括server、epoch、time、channel、sender、sender_id、sender_team、text
+        """
+        if end is None:
+            end = datetime.now()
+        if start is None:
+            start = end - timedelta(days=30)
+        tokens, phrases = parse_query(query)
+        start_epoch, end_epoch = int(start.timestamp()), int(end.timestamp())
+        server_names = list(server_names)
+        self.stats['searches'] += 1
+
+        conditions = ["m.epoch BETWEEN ? AND ?"]
+        params: List[Any] = [start_epoch, end_epoch]
+        if channel:
+            conditions.append("m.channel = ? COLLATE NOCASE")
+            params.append(channel)
+        if player:
+            conditions.append("(m.sender_id = ? OR m.sender = ? COLLATE NOCASE)")
+            params.extend((player, player))
+        if tokens:
+            # 每个词项都必须出现：按词项求交集
+            conditions.append("m.id IN (" + " INTERSECT ".join(
+                "SELECT message_id FROM postings WHERE token = ?" for _ in tokens) + ")")
+            params.extend(tokens)
+        sql = ("SELECT m.epoch, m.channel, m.sender, m.sender_id, m.sender_team, m.text FROM messages m"
+               f" WHERE {' AND '.join(conditions)} ORDER BY m.epoch DESC")
+
+        results = []
+        # 从最近的日期开始查询，达到数量上限后不再打开更早的分区
+        day = end.date()
+        while day >= start.date() and len(results) < limit:
+            date = day.isoformat()
+            day -= timedelta(days=1)
+            day_results = []
+            for server_name in server_names:
+                with self.lock:
+                    connection = self._partition(server_name, date, create=False)
+                    if connection is None:
+                        continue
+                    rows = connection.execute(sql, params).fetchall()
+                for epoch, channel_name, sender, sender_id, sender_team, text in rows:
+                    if phrases:
+                        normalized = normalize_text(text)
+                        if not all(phrase in normalized for phrase in phrases):
+                            continue
+                    day_results.append({
+                        "server": server_name,
+                        "epoch": epoch,
+                        "time": datetime.fromtimestamp(epoch).isoformat(),
+                        "channel": channel_name,
+                        "sender": sender,
+                        "sender_id": sender_id,
+                        "sender_team": sender_team,
+                        "text": text
+                    })
+            day_results.sort(key=lambda message: message["epoch"], reverse=True)
+            results.extend(day_results)
+        return results[:limit]
+
+    def _rebuild_server(self, server_name: str) -> int:
+        """从聊天日志分段（chat_*，包括已封存的文件）重新生成索引，返回索引的消息数量"""
+        before = self.stats['indexed_messages']
+        for segment_path, segment_hour in list_segments(os.path.join(self.logs_directory, server_name), ("chat",)):
+            entries = []
+            for file_path in segment_files(segment_path):
+                try:
+                    entries.extend(read_segment(file_path))
+                except Exception as e:
+                    self.logger.error(f"重新生成聊天索引时读取分段失败 {file_path}: {e}")
+            self.record_messages(server_name, entries, segment_hour)
+        return self.stats['indexed_messages'] - before
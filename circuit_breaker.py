@@ -0,0 +1,150 @@
+"""
+断路器
+每个服务器和每个API地址各有一个断路器，决定失败后什么时候再次请求：
+    - closed: 正常请求，连续失败达到failure_threshold次后打开
+    - open: 不发出请求，等待退避时间结束（base_delay × 2^(连续打开次数-1)，上限max_delay，带随机抖动）
+    - half_open: 退避结束后只放行一次试探请求，成功则关闭，失败则以加倍的退避时间重新打开
+
+HTTP会话不再自动重试，重试策略只由断路器决定。已经停止的服务器每个退避周期只收到一次请求，
+同一个API地址上的服务器共用地址断路器，代理不可达时所有服务器一起退避。
+"""
+
+import time
+import random
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+class CircuitBreaker:
+    """
+    带指数退避和随机抖动的断路器（线程安全）
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 3, base_delay: float = 10,
+                 max_delay: float = 300, jitter: float = 0.5):
+        """
+        初始化断路器
+
+        Args:
+            name: 名称（服务器名称或API地址）
+            failure_threshold: 连续失败多少次后打开
+            base_delay: 第一次打开的退避时间（秒）
+            max_delay: 退避时间上限（秒）
+            jitter: 随机抖动比例，实际退避时间在 [delay × (1 - jitter), delay] 之间
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.logger = logging.getLogger("CircuitBreaker")
+
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.consecutive_opens = 0
+        self.open_until: Optional[float] = None
+        self._trial_in_flight = False
+
+        # 统计信息
+        self.stats = {
+            'opened': 0,
+            'short_circuited': 0,  # 因断路器打开而没有发出的请求
+            'trials': 0,
+            'successes': 0,
+            'failures': 0
+        }
+
+    def retry_in(self, now: Optional[float] = None) -> float:
+        """
+        距允许下一次请求的秒数，0表示现在可以请求
+
+        Args:
+            now: 当前时间（time.time()）
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._retry_in(now)
+
+    def _retry_in(self, now: float) -> float:
+        if self.state == self.OPEN:
+            return max(0.0, self.open_until - now)
+        if self.state == self.HALF_OPEN and self._trial_in_flight:
+            # 等待试探请求的结果
+            return self.base_delay
+        return 0.0
+
+    def allow(self, now: Optional[float] = None) -> float:
+        """
+        请求前调用：可以请求时返回0（退避结束时转为half_open并占用试探名额），
+        否则返回距下一次允许请求的秒数并计入short_circuited
+
+        Args:
+            now: 当前时间（time.time()）
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            wait = self._retry_in(now)
+            if wait > 0:
+                self.stats['short_circuited'] += 1
+                return wait
+            if self.state == self.OPEN:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = True
+                self.stats['trials'] += 1
+            return 0.0
+
+    def record_success(self):
+        """请求成功，关闭断路器"""
+        with self._lock:
+            self.stats['successes'] += 1
+            if self.state != self.CLOSED:
+                self.logger.info(f"{self.name} 已恢复，断路器关闭")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.consecutive_opens = 0
+            self.open_until = None
+            self._trial_in_flight = False
+
+    def record_failure(self, now: Optional[float] = None) -> bool:
+        """
+        请求失败
+
+        Args:
+            now: 当前时间（time.time()）
+
+        Returns:
+            bool: 断路器是否因这次失败而打开
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self.stats['failures'] += 1
+            self.consecutive_failures += 1
+            self._trial_in_flight = False
+            if self.state == self.CLOSED and self.consecutive_failures < self.failure_threshold:
+                return False
+
+            self.consecutive_opens += 1
+            delay = min(self.base_delay * 2 ** (self.consecutive_opens - 1), self.max_delay)
+            delay *= random.uniform(1 - self.jitter, 1)
+            self.state = self.OPEN
+            self.open_until = now + delay
+            self.stats['opened'] += 1
+            self.logger.warning(f"{self.name} 连续失败 {self.consecutive_failures} 次，断路器打开 {delay:.0f} 秒")
+            return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取断路器状态和统计信息"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update({
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'retry_in': round(self._retry_in(time.time()), 1)
+            })
+        return stats
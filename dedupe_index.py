@@ -0,0 +1,116 @@
+"""
+日志去重索引
+在收集器中为每个服务器维护一个有界的日志指纹索引，在日志进入缓存前丢弃重复条目
+"""
+
+import time
+import hashlib
+from array import array
+from typing import Dict, Any, Optional
+
+def log_fingerprint(timestamp: str, message: str) -> int:
+    """
+    计算日志条目的64位指纹
+
+    与LogManager使用相同的唯一标识（时间戳 + 消息内容）
+
+    Args:
+        timestamp: 日志时间戳
+        message: 日志消息
+
+    Returns:
+        int: 64位无符号整数指纹
+    """
+    data = f"{timestamp}_{message}".encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+class FingerprintIndex:
+    """按时间窗口过期的有界指纹索引"""
+
+    def __init__(self, capacity: int = 20000, window_seconds: float = 600):
+        """
+        初始化指纹索引
+
+        Args:
+            capacity: 最多保存的指纹数量（固定内存上限）
+            window_seconds: 指纹保留时间（秒），应大于拉取的回溯窗口
+        """
+        self.capacity = max(1, int(capacity))
+        self.window_seconds = window_seconds
+
+        # 环形缓冲区：按插入顺序保存指纹及其插入时间
+        self._fingerprints = array('Q', [0]) * self.capacity
+        self._inserted_at = array('d', [0.0]) * self.capacity
+        self._head = 0  # 最旧条目的位置
+        self._size = 0
+        self._members = set()
+
+        # 统计信息
+        self.stats = {
+            'hits': 0,         # 命中（重复日志）
+            'inserts': 0,      # 新指纹
+            'evictions': 0,    # 因容量不足被淘汰
+            'expirations': 0   # 因超出时间窗口过期
+        }
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, fingerprint: int) -> bool:
+        return fingerprint in self._members
+
+    def add(self, fingerprint: int, now: Optional[float] = None) -> bool:
+        """
+        添加指纹
+
+        Args:
+            fingerprint: 日志指纹
+            now: 当前时间，默认为time.time()
+
+        Returns:
+            bool: 新指纹返回True，重复指纹返回False
+        """
+        if now is None:
+            now = time.time()
+
+        self._expire(now)
+
+        if fingerprint in self._members:
+            self.stats['hits'] += 1
+            return False
+
+        if self._size == self.capacity:
+            self._pop_oldest()
+            self.stats['evictions'] += 1
+
+        tail = (self._head + self._size) % self.capacity
+        self._fingerprints[tail] = fingerprint
+        self._inserted_at[tail] = now
+        self._size += 1
+        self._members.add(fingerprint)
+        self.stats['inserts'] += 1
+        return True
+
+    def _expire(self, now: float):
+        """移除超出时间窗口的指纹"""
+        cutoff = now - self.window_seconds
+        while self._size and self._inserted_at[self._head] < cutoff:
+            self._pop_oldest()
+            self.stats['expirations'] += 1
+
+    def _pop_oldest(self):
+        """移除最旧的指纹"""
+        self._members.discard(self._fingerprints[self._head])
+        self._head = (self._head + 1) % self.capacity
+        self._size -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取索引统计信息"""
+        lookups = self.stats['hits'] + self.stats['inserts']
+        hit_rate = self.stats['hits'] / lookups * 100 if lookups else 0
+        return {
+            **self.stats,
+            'size': self._size,
+            'capacity': self.capacity,
+            'hit_rate': f"{hit_rate:.2f}%"
+        }
@@ -12,6 +12,7 @@ from datetime import datetime, timedelta
 import time
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
 
 class HLLHttpClient:
     """HLL RCON HTTP客户端 - 优化版本"""
@@ -55,6 +56,7 @@ class HLLHttpClient:
         self.last_used = None
         self.connection_cache_time = None
         self.connection_cache_duration = 30  # 连接状态缓存30秒
+        self.api_unreachable = False  # 最近一次请求是否因连接错误或超时没有收到响应（供地址断路器判断）
         
         # 设置日志
         self.logger = logging.getLogger(f"HLLHttpClient-{host}:{port}")
@@ -67,20 +69,17 @@ class HLLHttpClient:
             'requests_sent': 0,
             'requests_failed': 0,
             'connection_attempts': 0,
-            'connection_failures': 0
+            'connection_failures': 0,
+            'reconnects': 0,             # 请求失败后重新连接的次数
+            'status_probes_avoided': 0   # 按原来的30秒缓存本应发出的连接状态查询次数
         }
         
     def _create_optimized_session(self) -> requests.Session:
         """创建优化的HTTP会话"""
         session = requests.Session()
         
-        # 配置重试策略
-        retry_strategy = Retry(
-            total=3,  # 总重试次数
-            backoff_factor=0.5,  # 退避因子
-            status_forcelist=[429, 500, 502, 503, 504],  # 需要重试的状态码
-            allowed_methods=["HEAD", "GET", "POST"]  # 允许重试的方法
-        )
+        # 不在会话层重试：会话失效时由_request重新连接一次，其余失败由收集器的断路器决定何时重试
+        retry_strategy = Retry(total=0)
         
         # 配置HTTP适配器
         adapter = HTTPAdapter(
@@ -109,14 +108,14 @@ class HLLHttpClient:
             self.stats['connection_attempts'] += 1
             self.logger.info(f"尝试连接到 {self.host}:{self.port}")
             
-            response = self.session.post(
-                f"{self.api_base_url}/api/v2/connect",
+            response = self._send(
+                "POST",
+                "/api/v2/connect",
                 json={
                     'host': self.host,
                     'port': self.port,
                     'password': self.password
-                },
-                timeout=self.timeout
+                }
             )
             
             if response.status_code == 200:
@@ -194,12 +193,101 @@ class HLLHttpClient:
             return False
     
     def ensure_connection(self) -> bool:
-        """确保连接有效（优化版本）"""
+        """确保连接有效（会查询连接状态，请求本身不再调用，失败时由_request重新连接）"""
         if not self.is_connected():
             self.logger.info("连接已断开，尝试重新连接")
             return self.connect()
         return True
     
+    def _request(self, method: str, path: str, expected_key: Optional[str] = None, **kwargs) -> requests.Response:
+        """
+        发送API请求，不预先查询连接状态，由响应判断会话是否失效
+        
+        会话失效（401）时重新连接一次并重试原请求。连接错误或响应中缺少expected_key时只重试GET请求，
+        其他请求（例如执行踢出、封禁的POST命令）可能已被服务器执行，只有连接在发出请求之前就失败时才重试
+        
+        Args:
+            method: HTTP方法
+            path: API路径
+            expected_key: 成功响应中必须包含的字段
+            **kwargs: 传给requests的参数
+            
+        Returns:
+            requests.Response: 最后一次请求的响应
+            
+        Raises:
+            ConnectionError: 无法建立连接
+            requests.RequestException: 重试后仍然请求失败
+        """
+        self._count_avoided_probe()
+        if not self.connected and not self.connect():
+            raise ConnectionError("无法建立连接")
+        
+        idempotent = method.upper() == "GET"
+        try:
+            response = self._send(method, path, **kwargs)
+            failure = self._session_failure(response, expected_key)
+            if failure is not None and not idempotent and response.status_code != 401:
+                # 请求已被服务器处理，重试可能重复执行命令
+                return response
+        except requests.ConnectionError as e:
+            if not idempotent and not self._request_not_sent(e):
+                raise
+            failure = f"连接错误: {e}"
+        if failure is None:
+            return response
+        
+        # 会话失效或连接断开：重新连接一次并重试原请求
+        self.logger.info(f"{failure}，重新连接后重试")
+        self.connected = False
+        self.stats['reconnects'] += 1
+        if not self.connect():
+            raise ConnectionError("无法重新建立连接")
+        return self._send(method, path, **kwargs)
+    
+    def _send(self, method: str, path: str, **kwargs) -> requests.Response:
+        """发送一次请求，记录API地址是否可达"""
+        try:
+            response = self.session.request(method, f"{self.api_base_url}{path}", timeout=self.timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            self.api_unreachable = True
+            raise
+        self.api_unreachable = False
+        self.last_used = datetime.now()
+        return response
+    
+    @staticmethod
+    def _request_not_sent(error: requests.ConnectionError) -> bool:
+        """连接错误是否发生在请求发出之前（连接被拒绝、建立连接超时），这时重试不会重复执行请求"""
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+    
+    @staticmethod
+    def _session_failure(response: requests.Response, expected_key: Optional[str]) -> Optional[str]:
+        """判断响应是否表示会话失效，返回失败原因，正常时返回None"""
+        if response.status_code == 401:
+            return "会话已失效（401）"
+        if response.status_code != 200 or expected_key is None:
+            return None
+        try:
+            data = response.json()
+        except ValueError:
+            return "响应不是有效的JSON"
+        if not isinstance(data, dict) or expected_key not in data:
+            return f"响应中没有 {expected_key}"
+        return None
+    
+    def _count_avoided_probe(self):
+        """按原来的连接状态缓存时间统计省去的状态查询"""
+        now = datetime.now()
+        if (self.connection_cache_time is None or
+                now - self.connection_cache_time >= timedelta(seconds=self.connection_cache_duration)):
+            if self.connected:
+                self.stats['status_probes_avoided'] += 1
+            self.connection_cache_time = now
+    
     def send_command(self, command: str, **params) -> Optional[str]:
         """
         发送RCON命令（优化版本）
@@ -214,21 +302,11 @@ class HLLHttpClient:
         try:
             self.stats['requests_sent'] += 1
             
-            if not self.ensure_connection():
-                self.logger.error("无法建立连接")
-                self.stats['requests_failed'] += 1
-                return None
-            
-            # 构建请求URL
-            url = f"{self.api_base_url}/api/v2/command/{command}"
-            
             # 发送请求
             if params:
-                response = self.session.post(url, json=params, timeout=self.timeout)
+                response = self._request("POST", f"/api/v2/command/{command}", json=params)
             else:
-                response = self.session.get(url, timeout=self.timeout)
-            
-            self.last_used = datetime.now()
+                response = self._request("GET", f"/api/v2/command/{command}")
             
             if response.status_code == 200:
                 return response.text
@@ -255,19 +333,10 @@ class HLLHttpClient:
         try:
             self.stats['requests_sent'] += 1
             
-            if not self.ensure_connection():
-                self.logger.error("无法建立连接")
-                self.stats['requests_failed'] += 1
-                return None
-            
-            # 使用发现的正确端点
-            response = self.session.get(
-                f"{self.api_base_url}/api/v2/logs?seconds={seconds}",
-                timeout=self.timeout
-            )
+            # 使用发现的正确端点，响应中没有entries时视为会话失效并重试
+            response = self._request("GET", f"/api/v2/logs?seconds={seconds}", expected_key='entries')
             
             if response.status_code == 200:
-                self.last_used = datetime.now()
                 data = response.json()
                 if 'entries' in data:
                     self.logger.debug(f"获取到 {len(data['entries'])} 条日志")
@@ -308,18 +377,9 @@ class HLLHttpClient:
         try:
             self.stats['requests_sent'] += 1
             
-            if not self.ensure_connection():
-                self.logger.error("无法建立连接")
-                self.stats['requests_failed'] += 1
-                return None
-            
-            response = self.session.get(
-                f"{self.api_base_url}/api/v2/players",
-                timeout=self.timeout
-            )
+            response = self._request("GET", "/api/v2/players")
             
             if response.status_code == 200:
-                self.last_used = datetime.now()
                 data = response.json()
                 return data.get('players', [])
             else:
@@ -342,18 +402,9 @@ class HLLHttpClient:
         try:
             self.stats['requests_sent'] += 1
             
-            if not self.ensure_connection():
-                self.logger.error("无法建立连接")
-                self.stats['requests_failed'] += 1
-                return None
-            
-            response = self.session.get(
-                f"{self.api_base_url}/api/v2/commands",
-                timeout=self.timeout
-            )
+            response = self._request("GET", "/api/v2/commands")
             
             if response.status_code == 200:
-                self.last_used = datetime.now()
                 data = response.json()
                 return data.get('commands', [])
             else:
@@ -0,0 +1,675 @@
+#!/usr/bin/env python3
+"""
+HLL RCON V2 原生客户端
+基于asyncio直接通过TCP连接游戏服务器的RCON端口，无需经过HTTP代理
+协议说明见 HLL_RCON_API_中文文档.md
+"""
+
+import json
+import base64
+import struct
+import asyncio
+import logging
+import threading
+from typing import Optional, Dict, Any, List
+from datetime import datetime
+
+# 数据包头部：ID + 内容长度，均为小端无符号32位整数
+HEADER = struct.Struct('<II')
+
+RCON_VERSION = 2
+
+# 只读命令：连接断开时可能已经执行过，重连后重新发送也没有副作用
+# 其他命令（踢人、封禁、换图等）在已经写入断开的连接后不再自动重发，避免执行两次
+READ_ONLY_COMMANDS = frozenset({"ServerConnect", "Login", "GetAdminLog", "ServerInformation"})
+
+def xor_cipher(data: bytes, key: bytes) -> bytes:
+    """
+    使用XOR密钥加密/解密数据
+
+    Args:
+        data: 原始数据
+        key: XOR密钥
+
+    Returns:
+        bytes: 处理后的数据
+    """
+    if not key or not data:
+        return data
+    repeated_key = (key * (len(data) // len(key) + 1))[:len(data)]
+    return (int.from_bytes(data, 'little') ^ int.from_bytes(repeated_key, 'little')).to_bytes(len(data), 'little')
+
+def _get_field(response: Dict[str, Any], name: str, default: Any = None) -> Any:
+    """读取响应字段（服务器返回的字段名大小写不固定）"""
+    if name in response:
+        return response[name]
+    lower_name = name[0].lower() + name[1:]
+    return response.get(lower_name, default)
+
+class RconError(Exception):
+    """RCON请求失败"""
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class _PendingRequest:
+    """等待响应的请求"""
+
+    __slots__ = ('name', 'content_body', 'future', 'generation')
+
+    def __init__(self, name: str, content_body: str, future: asyncio.Future):
+        self.name = name
+        self.content_body = content_body
+        self.future = future
+        self.generation = None  # 发送该请求时的连接代数，None表示尚未发送
+
+class HLLRconClient:
+    """
+    HLL RCON V2 原生asyncio客户端
+
+    同一个TCP连接上可以同时有多个请求在等待响应：每个请求分配唯一的包ID，
+    后台读取任务根据响应中回显的ID把结果交给对应的请求。连接意外断开时会自动重连，
+    重新发送尚未收到响应的只读命令；已经发送的其他命令以ConnectionError结束，不会执行两次。
+    """
+
+    def __init__(self, host: str, port: int, password: str, timeout: float = 30,
+                 max_reconnect_attempts: int = 3):
+        """
+        初始化RCON客户端
+
+        Args:
+            host: HLL服务器地址
+            port: HLL服务器RCON端口
+            password: RCON密码
+            timeout: 连接和单个请求的超时时间（秒）
+            max_reconnect_attempts: 连接意外断开后的最大自动重连次数
+        """
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.max_reconnect_attempts = max_reconnect_attempts
+
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.xor_key: bytes = b""
+        self.auth_token: str = ""
+        self.connected = False
+        self.last_used = None
+
+        # 请求ID -> 等待响应的请求
+        self._pending: Dict[int, _PendingRequest] = {}
+        self._next_request_id = 1
+        self._generation = 0  # 每次建立新连接加一
+        self._reader_task: Optional[asyncio.Task] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._closing = False
+
+        # asyncio原语需要在事件循环中创建
+        self._ready: Optional[asyncio.Event] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+
+        # 设置日志
+        self.logger = logging.getLogger(f"HLLRconClient-{host}:{port}")
+
+        # 性能统计
+        self.stats = {
+            'requests_sent': 0,
+            'requests_failed': 0,
+            'requests_timed_out': 0,
+            'requests_resent': 0,
+            'requests_not_resent': 0,
+            'connection_attempts': 0,
+            'connection_failures': 0,
+            'reconnects': 0
+        }
+
+    def _init_primitives(self):
+        """在当前事件循环中创建asyncio原语"""
+        if self._ready is None:
+            self._ready = asyncio.Event()
+            self._connect_lock = asyncio.Lock()
+            self._write_lock = asyncio.Lock()
+
+    async def connect(self) -> bool:
+        """连接到HLL服务器并登录"""
+        self._init_primitives()
+        async with self._connect_lock:
+            self._closing = False
+            if self.connected:
+                return True
+            return await self._open_session()
+
+    async def _open_session(self) -> bool:
+        """建立TCP连接并完成ServerConnect和Login握手"""
+        try:
+            self.stats['connection_attempts'] += 1
+            self.logger.info(f"尝试连接到 {self.host}:{self.port}")
+            await self._close_stream()
+
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port),
+                timeout=self.timeout
+            )
+            self._generation += 1
+            self.reader, self.writer = reader, writer
+            self.xor_key = b""
+            self.auth_token = ""
+            self._reader_task = asyncio.ensure_future(self._read_loop(reader, self._generation))
+
+            # ServerConnect 是唯一不加密的命令，响应中包含Base64编码的XOR密钥
+            response = await self._handshake("ServerConnect", "")
+            self.xor_key = base64.b64decode(_get_field(response, "ContentBody", ""))
+
+            # 登录获取认证令牌
+            response = await self._handshake("Login", self.password)
+            self.auth_token = _get_field(response, "ContentBody", "")
+
+            self.connected = True
+            self.last_used = datetime.now()
+            self.logger.info("连接成功")
+
+            # 重新发送在旧连接上未收到响应的只读命令，然后放行等待连接的请求
+            await self._resend_pending()
+            self._ready.set()
+            return True
+
+        except Exception as e:
+            self.stats['connection_failures'] += 1
+            self.logger.error(f"连接异常: {e}")
+            await self._close_stream()
+            return False
+
+    async def _handshake(self, name: str, content_body: str) -> Dict[str, Any]:
+        """发送握手请求（不等待连接就绪）"""
+        future = asyncio.get_running_loop().create_future()
+        pending = _PendingRequest(name, content_body, future)
+        request_id = self._register(pending)
+        try:
+            await self._send(request_id, pending)
+            return await asyncio.wait_for(future, timeout=self.timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def disconnect(self) -> bool:
+        """断开连接，尚未完成的请求会以连接错误结束"""
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        await self._close_stream()
+        self._fail_pending(ConnectionError("连接已关闭"))
+        self.logger.info("断开连接成功")
+        return True
+
+    async def _close_stream(self):
+        """关闭TCP连接并清除会话状态"""
+        self.connected = False
+        self.auth_token = ""
+        if self._ready is not None:
+            self._ready.clear()
+
+        reader_task, self._reader_task = self._reader_task, None
+        if reader_task is not None and reader_task is not asyncio.current_task():
+            reader_task.cancel()
+
+        writer, self.writer, self.reader = self.writer, None, None
+        if writer is not None:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def ensure_connection(self) -> bool:
+        """确保连接有效，正在自动重连时等待重连完成"""
+        if self.connected:
+            return True
+        if self._reconnect_task is not None and not self._reconnect_task.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(self._reconnect_task), timeout=self.timeout)
+            except Exception:
+                pass
+            if self.connected:
+                return True
+        self.logger.info("连接已断开，尝试重新连接")
+        return await self.connect()
+
+    def _register(self, pending: _PendingRequest) -> int:
+        """为请求分配一个未被占用的包ID"""
+        request_id = self._next_request_id
+        while request_id in self._pending:
+            request_id = (request_id + 1) & 0xFFFFFFFF or 1
+        self._next_request_id = (request_id + 1) & 0xFFFFFFFF or 1
+        self._pending[request_id] = pending
+        return request_id
+
+    async def _send(self, request_id: int, pending: _PendingRequest):
+        """在当前连接上发送请求（每个请求在每个连接上只发送一次）"""
+        if pending.generation == self._generation:
+            return
+        if self.writer is None:
+            raise ConnectionError("未连接到服务器")
+
+        pending.generation = self._generation
+        body = json.dumps({
+            "AuthToken": self.auth_token,
+            "Version": RCON_VERSION,
+            "Name": pending.name,
+            "ContentBody": pending.content_body
+        }).encode('utf-8')
+        body = xor_cipher(body, self.xor_key)
+
+        async with self._write_lock:
+            self.writer.write(HEADER.pack(request_id, len(body)) + body)
+            await self.writer.drain()
+
+    async def _resend_pending(self):
+        """重连后重新发送尚未收到响应的只读命令，已经发送的其他命令可能已执行，以连接错误结束"""
+        for request_id, pending in list(self._pending.items()):
+            if pending.generation is not None and pending.generation != self._generation \
+                    and not pending.future.done():
+                if pending.name not in READ_ONLY_COMMANDS:
+                    self.stats['requests_not_resent'] += 1
+                    pending.future.set_exception(ConnectionError(
+                        f"{pending.name} 已发送但连接断开，可能已经执行，不自动重发"
+                    ))
+                    continue
+                self.stats['requests_resent'] += 1
+                await self._send(request_id, pending)
+
+    async def _read_loop(self, reader: asyncio.StreamReader, generation: int):
+        """读取响应并按包ID分发给等待的请求"""
+        try:
+            while True:
+                header = await reader.readexactly(HEADER.size)
+                response_id, length = HEADER.unpack(header)
+                payload = await reader.readexactly(length)
+                self._dispatch(response_id, payload)
+        except asyncio.CancelledError:
+            raise
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+            if generation == self._generation and not self._closing:
+                self.logger.warning(f"连接意外断开: {e}")
+                self._on_connection_lost()
+
+    def _dispatch(self, response_id: int, payload: bytes):
+        """把响应交给对应的请求"""
+        pending = self._pending.get(response_id)
+        if pending is None or pending.future.done():
+            self.logger.warning(f"收到未知或已超时请求的响应，ID: {response_id}")
+            return
+
+        try:
+            response = json.loads(xor_cipher(payload, self.xor_key).decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            pending.future.set_exception(RconError(f"{pending.name} 响应解析失败: {e}"))
+            return
+
+        status_code = _get_field(response, "StatusCode", 200)
+        if status_code != 200:
+            pending.future.set_exception(RconError(
+                f"{pending.name} 执行失败: {status_code} - {_get_field(response, 'StatusMessage', '')}",
+                status_code
+            ))
+        else:
+            pending.future.set_result(response)
+
+    def _on_connection_lost(self):
+        """连接意外断开后在后台重连，保留等待中的请求"""
+        self.connected = False
+        self._ready.clear()
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self):
+        """按递增间隔自动重连，全部失败时让等待中的请求以连接错误结束"""
+        for attempt in range(1, self.max_reconnect_attempts + 1):
+            self.stats['reconnects'] += 1
+            async with self._connect_lock:
+                if self._closing or self.connected:
+                    return
+                if await self._open_session():
+                    return
+            await asyncio.sleep(min(2 ** (attempt - 1), self.timeout))
+
+        self.logger.error(f"自动重连失败 ({self.max_reconnect_attempts} 次)")
+        self._fail_pending(ConnectionError("自动重连失败"))
+
+    def _fail_pending(self, error: Exception):
+        """让所有等待中的请求以指定错误结束"""
+        for pending in self._pending.values():
+            if not pending.future.done():
+                pending.future.set_exception(error)
+
+    async def request(self, name: str, content_body: str = "", timeout: float = None) -> Dict[str, Any]:
+        """
+        发送请求并等待响应，可以与其他请求同时进行
+
+        连接断开期间发出的请求会等待重连完成后再发送；已发送但未收到响应的只读命令
+        会在重连后重新发送，其他命令以ConnectionError结束（服务器可能已经执行）。
+
+        Args:
+            name: 命令名称
+            content_body: 请求内容
+            timeout: 该请求的超时时间，默认为客户端的timeout
+
+        Returns:
+            Dict: 解码后的响应
+
+        Raises:
+            RconError: 服务器返回非200状态码
+            asyncio.TimeoutError: 请求超时
+            ConnectionError: 连接关闭或重连失败
+        """
+        self._init_primitives()
+        future = asyncio.get_running_loop().create_future()
+        pending = _PendingRequest(name, content_body, future)
+        request_id = self._register(pending)
+
+        async def send_and_wait():
+            # 等待连接就绪后发送；重连失败时future会直接以错误结束
+            while not future.done():
+                if self._ready.is_set():
+                    await self._send(request_id, pending)
+                    break
+                ready_waiter = asyncio.ensure_future(self._ready.wait())
+                try:
+                    await asyncio.wait({ready_waiter, future}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    ready_waiter.cancel()
+            return await future
+
+        try:
+            return await asyncio.wait_for(send_and_wait(), timeout=timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.stats['requests_timed_out'] += 1
+            raise
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def execute(self, name: str, content: Any = "", timeout: float = None) -> Optional[Any]:
+        """
+        执行RCON命令，认证令牌失效时重新登录一次；连接错误时只重试只读命令
+
+        Args:
+            name: 命令名称
+            content: 命令内容，字典会被编码为JSON字符串
+            timeout: 该请求的超时时间，默认为客户端的timeout
+
+        Returns:
+            响应的ContentBody，失败时返回None
+        """
+        self.stats['requests_sent'] += 1
+        content_body = content if isinstance(content, str) else json.dumps(content)
+
+        for attempt in range(2):
+            try:
+                if not await self.ensure_connection():
+                    self.logger.error("无法建立连接")
+                    break
+
+                response = await self.request(name, content_body, timeout)
+                self.last_used = datetime.now()
+                return _get_field(response, "ContentBody", "")
+
+            except RconError as e:
+                if e.status_code == 401 and attempt == 0:
+                    self.logger.info("认证令牌失效，重新登录")
+                    await self._close_stream()
+                    continue
+                self.logger.error(f"命令执行失败: {e}")
+                break
+            except asyncio.TimeoutError:
+                self.logger.error(f"命令执行超时: {name}")
+                break
+            except (ConnectionError, OSError) as e:
+                self.logger.error(f"发送命令异常: {name}, 错误: {e}")
+                if attempt == 0 and name in READ_ONLY_COMMANDS:
+                    continue
+                break
+            except Exception as e:
+                self.logger.error(f"发送命令异常: {name}, 错误: {e}")
+                break
+
+        self.stats['requests_failed'] += 1
+        return None
+
+    @staticmethod
+    def _decode_content(content: Any) -> Any:
+        """ContentBody可能是JSON字符串，也可能已经是对象"""
+        if isinstance(content, str) and content:
+            return json.loads(content)
+        return content
+
+    async def send_command(self, command: str, **params) -> Optional[str]:
+        """
+        发送RCON命令
+
+        Args:
+            command: 命令名称
+            **params: 命令参数
+
+        Returns:
+            命令响应或None
+        """
+        content = await self.execute(command, params if params else "")
+        if content is None:
+            return None
+        return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+
+    async def get_admin_logs(self, seconds: int = 300) -> Optional[List[Dict[str, Any]]]:
+        """
+        获取管理员日志
+
+        Args:
+            seconds: 获取最近几秒的日志
+
+        Returns:
+            日志列表或None
+        """
+        content = await self.execute("GetAdminLog", {"LogBackTrackTime": int(seconds), "Filters": ""})
+        if content is None:
+            return None
+        try:
+            data = self._decode_content(content)
+        except json.JSONDecodeError as e:
+            self.logger.error(f"解析日志响应失败: {e}")
+            self.stats['requests_failed'] += 1
+            return None
+        entries = data.get('entries', []) if isinstance(data, dict) else []
+        self.logger.debug(f"获取到 {len(entries)} 条日志")
+        return entries
+
+    async def get_players(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        获取玩家列表
+
+        Returns:
+            玩家列表或None
+        """
+        content = await self.execute("ServerInformation", {"Name": "players", "Value": ""})
+        if content is None:
+            return None
+        try:
+            data = self._decode_content(content)
+        except json.JSONDecodeError as e:
+            self.logger.error(f"解析玩家列表失败: {e}")
+            self.stats['requests_failed'] += 1
+            return None
+        return data.get('players', []) if isinstance(data, dict) else []
+
+    async def get_session_info(self) -> Optional[Dict[str, Any]]:
+        """
+        获取当前服务器会话信息（地图、比赛时间、玩家数量等）
+
+        Returns:
+            会话信息字典或None
+        """
+        content = await self.execute("ServerInformation", {"Name": "session", "Value": ""})
+        if content is None:
+            return None
+        try:
+            data = self._decode_content(content)
+        except json.JSONDecodeError as e:
+            self.logger.error(f"解析会话信息失败: {e}")
+            self.stats['requests_failed'] += 1
+            return None
+        return data if isinstance(data, dict) else {}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取性能统计信息"""
+        success_rate = 0
+        if self.stats['requests_sent'] > 0:
+            success_rate = (self.stats['requests_sent'] - self.stats['requests_failed']) / self.stats['requests_sent'] * 100
+
+        connection_success_rate = 0
+        if self.stats['connection_attempts'] > 0:
+            connection_success_rate = (self.stats['connection_attempts'] - self.stats['connection_failures']) / self.stats['connection_attempts'] * 100
+
+        return {
+            **self.stats,
+            'success_rate': f"{success_rate:.2f}%",
+            'connection_success_rate': f"{connection_success_rate:.2f}%",
+            'last_used': self.last_used.isoformat() if self.last_used else None,
+            'connected': self.connected,
+            'in_flight': len(self._pending)
+        }
+
+class HLLRconSyncClient:
+    """
+    RCON客户端的同步包装
+
+    在独立线程中运行事件循环，提供与HLLHttpClient相同的同步接口，
+    以便线程模式的收集器按服务器选择传输方式
+    """
+
+    def __init__(self, host: str, port: int, password: str, timeout: float = 30):
+        self.client = HLLRconClient(host, port, password, timeout)
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True,
+                                        name=f"HLLRconClient-{host}:{port}")
+        self._thread.start()
+
+    def _run(self, coro):
+        """在客户端事件循环中执行协程并等待结果"""
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        return future.result(timeout=self.timeout * 3)
+
+    @property
+    def connected(self) -> bool:
+        return self.client.connected
+
+    def connect(self) -> bool:
+        return self._run(self.client.connect())
+
+    def disconnect(self) -> bool:
+        return self._run(self.client.disconnect())
+
+    def ensure_connection(self) -> bool:
+        return self._run(self.client.ensure_connection())
+
+    def send_command(self, command: str, **params) -> Optional[str]:
+        return self._run(self.client.send_command(command, **params))
+
+    def get_admin_logs(self, seconds: int = 300) -> Optional[List[Dict[str, Any]]]:
+        return self._run(self.client.get_admin_logs(seconds))
+
+    def get_players(self) -> Optional[List[Dict[str, Any]]]:
+        return self._run(self.client.get_players())
+
+    def get_session_info(self) -> Optional[Dict[str, Any]]:
+        return self._run(self.client.get_session_info())
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self.client.get_stats()
+
+    def close(self):
+        """断开连接并停止事件循环"""
+        try:
+            self.disconnect()
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+async def _demo(host: str, port: int, password: str):
+    """测试客户端"""
+    client = HLLRconClient(host, port, password)
+
+    if await client.connect():
+        print("✓ 连接成功")
+
+        # 在同一个连接上同时发出多个请求
+        logs, players, session = await asyncio.gather(
+            client.get_admin_logs(300),
+            client.get_players(),
+            client.get_session_info()
+        )
+
+        if players is not None:
+            print(f"✓ 获取到 {len(players)} 个玩家")
+
+        if session is not None:
+            print(f"✓ 获取到会话信息: {session}")
+
+        if logs:
+            print(f"✓ 获取到 {len(logs)} 条日志")
+            print(f"  最新日志: {logs[-1]['message'][:100]}...")
+        else:
+            print("✗ 未获取到日志")
+
+        stats = client.get_stats()
+        print(f"✓ 性能统计: 请求成功率 {stats['success_rate']}, 连接成功率 {stats['connection_success_rate']}")
+
+        await client.disconnect()
+        print("✓ 断开连接成功")
+    else:
+        print("✗ 连接失败")
+
+async def _demo_with_fake_server():
+    """使用本地模拟RCON服务器测试客户端"""
+    from rcon_fake_server import FakeRconServer
+
+    server = FakeRconServer(password="test", response_delay=0.2)
+    port = await server.start()
+    try:
+        await _demo("127.0.0.1", port, "test")
+    finally:
+        await server.stop()
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    print("测试原生RCON客户端...")
+
+    if "--fake" in sys.argv:
+        asyncio.run(_demo_with_fake_server())
+        sys.exit(0)
+
+    try:
+        with open('config.json', 'r', encoding='utf-8') as f:
+            config = json.load(f)
+
+        # 找到第一个启用的服务器
+        server_config = None
+        for server in config['servers']:
+            if server.get('enabled', False):
+                server_config = server
+                break
+
+        if not server_config:
+            print("未找到启用的服务器配置")
+            sys.exit(1)
+
+        asyncio.run(_demo(server_config['host'], server_config['port'], server_config['password']))
+
+    except Exception as e:
+        print(f"测试失败: {e}")
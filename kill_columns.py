@@ -0,0 +1,435 @@
+"""
+击杀事件列式分段文件
+把解析后的击杀事件按列保存：玩家名称、ID和武器使用字典编码，时间和阵营使用定长列。
+读取时通过mmap直接得到各列的数组视图，统计K/D、武器使用和误杀时不需要为每一行构建字典。
+
+文件由若干个独立的块组成，每次保存追加一个块（块内的行按事件时间排序）：
+    块头（40字节）| epoch(int64) | killer, killer_id, victim, victim_id, weapon(uint32字典下标)
+    | killer_team, victim_team, teamkill(uint8) | 字符串偏移(uint32) | 字符串数据(UTF-8)
+所有数值均为小端序，块长度按8字节对齐。
+"""
+
+import os
+import sys
+import mmap
+import zlib
+import json
+import time
+import array
+import struct
+import bisect
+from collections import Counter
+from typing import Dict, List, Any, Iterator, Iterable, Optional, Tuple
+
+BLOCK_MAGIC = b'HKC1'
+BLOCK_VERSION = 1
+# magic, version, reserved, 行数, 字符串数量, 块体长度, 块体CRC32, 最早事件时间, 最晚事件时间
+BLOCK_HEADER = struct.Struct('<4sHHIIIIqq')
+
+# 阵营使用固定编码，未知阵营编码为0
+TEAMS = ("", "Allies", "Axis")
+_TEAM_CODES = {team: code for code, team in enumerate(TEAMS)}
+
+# 字典编码的列（保存字符串表中的下标）
+STRING_COLUMNS = ('killer', 'killer_id', 'victim', 'victim_id', 'weapon')
+# 单字节列
+BYTE_COLUMNS = ('killer_team', 'victim_team', 'teamkill')
+
+KILL_COLUMNS_EXTENSION = ".kcol"
+
+_NATIVE_LITTLE_ENDIAN = sys.byteorder == 'little'
+
+def _pad(length: int, alignment: int) -> int:
+    """计算对齐到alignment字节需要的填充长度"""
+    return -length % alignment
+
+def encode_kill_block(events: Iterable[Any]) -> Tuple[bytes, int]:
+    """
+    将击杀事件编码为一个列式块
+
+    Args:
+        events: 击杀事件（log_parser.KillEvent），没有事件时间的事件会被跳过
+
+    Returns:
+        Tuple[bytes, int]: (块数据, 写入的行数)，没有可写入的事件时块数据为空
+    """
+    rows = sorted((event for event in events if event.epoch is not None), key=lambda event: event.epoch)
+    if not rows:
+        return b'', 0
+
+    strings: Dict[str, int] = {}
+    columns = {name: array.array('I') for name in STRING_COLUMNS}
+    epochs = array.array('q', (event.epoch for event in rows))
+    bytes_columns = {name: bytearray(len(rows)) for name in BYTE_COLUMNS}
+
+    for row, event in enumerate(rows):
+        for name in STRING_COLUMNS:
+            value = getattr(event, name) or ""
+            index = strings.get(value)
+            if index is None:
+                index = strings[value] = len(strings)
+            columns[name].append(index)
+        bytes_columns['killer_team'][row] = _TEAM_CODES.get(event.killer_team, 0)
+        bytes_columns['victim_team'][row] = _TEAM_CODES.get(event.victim_team, 0)
+        bytes_columns['teamkill'][row] = 1 if event.teamkill else 0
+
+    encoded_strings = [value.encode('utf-8', 'surrogatepass') for value in strings]
+    offsets = array.array('I', [0])
+    for value in encoded_strings:
+        offsets.append(offsets[-1] + len(value))
+
+    numeric = [epochs] + [columns[name] for name in STRING_COLUMNS] + [offsets]
+    if not _NATIVE_LITTLE_ENDIAN:
+        for column in numeric:
+            column.byteswap()
+
+    parts = [epochs.tobytes()]
+    parts.extend(columns[name].tobytes() for name in STRING_COLUMNS)
+    parts.extend(bytes(bytes_columns[name]) for name in BYTE_COLUMNS)
+    parts.append(b'\0' * _pad(3 * len(rows), 4))
+    parts.append(offsets.tobytes())
+    parts.extend(encoded_strings)
+    body = b''.join(parts)
+    body += b'\0' * _pad(len(body), 8)
+
+    header = BLOCK_HEADER.pack(BLOCK_MAGIC, BLOCK_VERSION, 0, len(rows), len(strings), len(body),
+                               zlib.crc32(body), rows[0].epoch, rows[-1].epoch)
+    return header + body, len(rows)
+
+def _iter_block_headers(buffer, size: int) -> Iterator[Tuple[int, tuple]]:
+    """遍历完整有效的块头，遇到残缺或损坏的块时停止"""
+    offset = 0
+    while offset + BLOCK_HEADER.size <= size:
+        header = BLOCK_HEADER.unpack_from(buffer, offset)
+        magic, version, _, _, _, body_len = header[:6]
+        if magic != BLOCK_MAGIC or version != BLOCK_VERSION:
+            return
+        if offset + BLOCK_HEADER.size + body_len > size:
+            return
+        yield offset, header
+        offset += BLOCK_HEADER.size + body_len
+
+def valid_length(file_path: str) -> int:
+    """
+    获取文件中完整块的总长度（末尾可能有写入中断留下的残缺块）
+
+    Args:
+        file_path: 列式文件路径
+
+    Returns:
+        int: 完整块的总字节数，文件不存在时为0
+    """
+    try:
+        f = open(file_path, 'rb')
+    except FileNotFoundError:
+        return 0
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        end = 0
+        # 只读取块头，逐块跳过块体
+        while end + BLOCK_HEADER.size <= size:
+            header = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+            if header[0] != BLOCK_MAGIC or header[1] != BLOCK_VERSION:
+                break
+            block_end = end + BLOCK_HEADER.size + header[5]
+            if block_end > size:
+                break
+            end = block_end
+            f.seek(end)
+    return end
+
+def append_kill_block(file_path: str, events: Iterable[Any]) -> int:
+    """
+    向列式文件追加一个块，追加前截掉上次写入中断留下的残缺块
+
+    Args:
+        file_path: 列式文件路径
+        events: 击杀事件
+
+    Returns:
+        int: 写入的行数
+    """
+    block, rows = encode_kill_block(events)
+    if not rows:
+        return 0
+
+    end = valid_length(file_path)
+    with open(file_path, 'ab') as f:
+        if f.tell() != end:
+            f.truncate(end)
+            f.seek(end)
+        f.write(block)
+        f.flush()
+    return rows
+
+class StringTable:
+    """块内的字符串字典，按下标解码（解码结果会被缓存）"""
+
+    __slots__ = ('_offsets', '_data', '_cache')
+
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self._offsets = offsets
+        self._data = data
+        self._cache: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        value = self._cache.get(index)
+        if value is None:
+            value = bytes(self._data[self._offsets[index]:self._offsets[index + 1]]).decode('utf-8', 'surrogatepass')
+            self._cache[index] = value
+        return value
+
+class KillColumns:
+    """
+    一个块（或块内的一段时间范围）的列数组
+
+    epoch和各字典编码列是只读的数组视图，直接指向mmap中的数据；
+    字符串列保存的是strings中的下标，阵营列保存的是TEAMS中的下标
+    """
+
+    __slots__ = ('epoch', 'killer', 'killer_id', 'victim', 'victim_id', 'weapon',
+                 'killer_team', 'victim_team', 'teamkill', 'strings')
+
+    def __len__(self) -> int:
+        return len(self.epoch)
+
+    def slice(self, start: int, stop: int) -> "KillColumns":
+        """返回行范围[start, stop)的列视图（不复制数据）"""
+        columns = KillColumns()
+        for name in KillColumns.__slots__:
+            value = getattr(self, name)
+            setattr(columns, name, value if name == 'strings' else value[start:stop])
+        return columns
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        """逐行解码为字典（用于调试和导出，统计时应直接使用列数组）"""
+        strings = self.strings
+        for row in range(len(self.epoch)):
+            yield {
+                'epoch': self.epoch[row],
+                'killer': strings[self.killer[row]],
+                'killer_team': TEAMS[self.killer_team[row]],
+                'killer_id': strings[self.killer_id[row]],
+                'victim': strings[self.victim[row]],
+                'victim_team': TEAMS[self.victim_team[row]],
+                'victim_id': strings[self.victim_id[row]],
+                'weapon': strings[self.weapon[row]],
+                'teamkill': bool(self.teamkill[row])
+            }
+
+class KillColumnReader:
+    """通过mmap读取列式击杀文件"""
+
+    def __init__(self, file_path: str, verify: bool = True):
+        """
+        打开列式文件
+
+        Args:
+            file_path: 列式文件路径
+            verify: 是否校验每个块的CRC32（损坏的块会被跳过）
+        """
+        self.file_path = file_path
+        self.verify = verify
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._views: List[memoryview] = []
+
+        self._file = open(file_path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size > 0:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self) -> "KillColumnReader":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _view(self, base: memoryview, start: int, length: int, fmt: str) -> memoryview:
+        """获取一段数据的数组视图，非小端序平台上复制并转换字节序"""
+        view = base[start:start + length]
+        self._views.append(view)
+        if fmt == 'B':
+            return view
+        if not _NATIVE_LITTLE_ENDIAN:
+            values = array.array(fmt, view)
+            values.byteswap()
+            return memoryview(values)
+        view = view.cast(fmt)
+        self._views.append(view)
+        return view
+
+    def _decode_block(self, base: memoryview, offset: int, header: tuple) -> KillColumns:
+        """把一个块解析为列视图"""
+        rows, string_count, body_len = header[3], header[4], header[5]
+        position = offset + BLOCK_HEADER.size
+        columns = KillColumns()
+
+        columns.epoch = self._view(base, position, 8 * rows, 'q')
+        position += 8 * rows
+        for name in STRING_COLUMNS:
+            setattr(columns, name, self._view(base, position, 4 * rows, 'I'))
+            position += 4 * rows
+        for name in BYTE_COLUMNS:
+            setattr(columns, name, self._view(base, position, rows, 'B'))
+            position += rows
+        position += _pad(3 * rows, 4)
+
+        offsets = self._view(base, position, 4 * (string_count + 1), 'I')
+        position += 4 * (string_count + 1)
+        data_end = offset + BLOCK_HEADER.size + body_len
+        columns.strings = StringTable(offsets, self._view(base, position, data_end - position, 'B'))
+        return columns
+
+    def iter_blocks(self, start_epoch: Optional[float] = None,
+                    end_epoch: Optional[float] = None) -> Iterator[KillColumns]:
+        """
+        遍历与时间范围重叠的块，每个块只返回范围内的行
+
+        Args:
+            start_epoch: 开始时间（包含），None表示不限
+            end_epoch: 结束时间（包含），None表示不限
+
+        Yields:
+            KillColumns: 列视图
+        """
+        if self._mmap is None:
+            return
+
+        base = memoryview(self._mmap)
+        self._views.append(base)
+        for offset, header in _iter_block_headers(self._mmap, len(self._mmap)):
+            min_epoch, max_epoch = header[7], header[8]
+            if start_epoch is not None and max_epoch < start_epoch:
+                continue
+            if end_epoch is not None and min_epoch > end_epoch:
+                continue
+            if self.verify:
+                body_start = offset + BLOCK_HEADER.size
+                if zlib.crc32(base[body_start:body_start + header[5]]) != header[6]:
+                    continue
+
+            columns = self._decode_block(base, offset, header)
+            if start_epoch is None and end_epoch is None:
+                yield columns
+                continue
+
+            # 块内的行按时间排序，二分查找范围
+            lo = 0 if start_epoch is None else bisect.bisect_left(columns.epoch, start_epoch)
+            hi = len(columns) if end_epoch is None else bisect.bisect_right(columns.epoch, end_epoch)
+            if lo < hi:
+                if (lo, hi) != (0, len(columns)):
+                    columns = columns.slice(lo, hi)
+                    self._views.extend(getattr(columns, name) for name in STRING_COLUMNS + BYTE_COLUMNS + ('epoch',))
+                yield columns
+
+    def close(self):
+        """释放所有数组视图并关闭文件"""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # 调用方仍持有列视图，映射在最后一个视图释放后由垃圾回收关闭
+                pass
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def aggregate_kills(blocks: Iterable[KillColumns]) -> Dict[str, Any]:
+    """
+    统计击杀数据：每个玩家的击杀/死亡/误杀数量和武器使用次数
+
+    按列计数，每个块只解码出现过的字符串
+
+    Args:
+        blocks: 列视图
+
+    Returns:
+        Dict: {'kills', 'deaths', 'teamkills'（按玩家ID）, 'weapons'（按武器）, 'names'（玩家ID -> 名称）, 'total'}
+    """
+    kills: Counter = Counter()
+    deaths: Counter = Counter()
+    teamkills: Counter = Counter()
+    weapons: Counter = Counter()
+    names: Dict[str, str] = {}
+    total = 0
+
+    for columns in blocks:
+        strings = columns.strings
+        total += len(columns)
+
+        for index, count in Counter(columns.killer_id).items():
+            kills[strings[index]] += count
+        for index, count in Counter(columns.victim_id).items():
+            deaths[strings[index]] += count
+        for index, count in Counter(columns.weapon).items():
+            weapons[strings[index]] += count
+        for killer_id, flag in zip(columns.killer_id, columns.teamkill):
+            if flag:
+                teamkills[strings[killer_id]] += 1
+        for id_column, name_column in ((columns.killer_id, columns.killer), (columns.victim_id, columns.victim)):
+            for id_index, name_index in set(zip(id_column, name_column)):
+                names[strings[id_index]] = strings[name_index]
+
+    return {
+        'kills': kills,
+        'deaths': deaths,
+        'teamkills': teamkills,
+        'weapons': weapons,
+        'names': names,
+        'total': total
+    }
+
+def main():
+    """比较JSON和列式格式的文件大小与统计耗时"""
+    import random
+    import tempfile
+    from log_parser import LogParser
+
+    rng = random.Random(1)
+    players = [(f"player{i}", f"7656119{i:010d}") for i in range(100)]
+    weapons = ["M1 GARAND", "MP40", "KARABINER 98K", "GRENADE", "150MM HOWITZER [sFH 18]", "Thompson"]
+    parser = LogParser()
+    entries = []
+    for i in range(200000):
+        (killer, killer_id), (victim, victim_id) = rng.sample(players, 2)
+        prefix = "TEAM KILL" if rng.random() < 0.03 else "KILL"
+        message = (f"[{i % 90}:{i % 60:02d} min ({1761193883 + i // 50})] {prefix}: {killer}(Allies/{killer_id}) -> "
+                   f"{victim}(Axis/{victim_id}) with {rng.choice(weapons)}")
+        entries.append({"timestamp": "2025-10-23T04:34:21.310Z", "server": "server1", "message": message,
+                        "raw_data": {"timestamp": "2025-10-23T04:34:21.310Z", "message": message},
+                        "event": parser.parse(message)})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "kills.json")
+        columns_path = os.path.join(tmp, "kills" + KILL_COLUMNS_EXTENSION)
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump([{k: v for k, v in entry.items() if k != 'event'} for entry in entries],
+                      f, ensure_ascii=False, indent=2)
+        append_kill_block(columns_path, (entry['event'] for entry in entries))
+
+        start = time.perf_counter()
+        with open(json_path, 'r', encoding='utf-8') as f:
+            json_kills = Counter(parser.parse(entry['message']).killer_id for entry in json.load(f))
+        json_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with KillColumnReader(columns_path) as reader:
+            result = aggregate_kills(reader.iter_blocks())
+        columns_time = time.perf_counter() - start
+
+        assert result['kills'] == json_kills
+        print(f"击杀事件: {len(entries)} 条")
+        print(f"JSON:  {os.path.getsize(json_path) / 1024 / 1024:.1f} MB, 统计击杀 {json_time:.2f}秒")
+        print(f"列式:  {os.path.getsize(columns_path) / 1024 / 1024:.1f} MB, 统计击杀、死亡、武器和误杀 {columns_time:.2f}秒")
+        print(f"武器使用: {dict(result['weapons'].most_common(3))}")
+
+if __name__ == "__main__":
+    main()
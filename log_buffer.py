@@ -0,0 +1,568 @@
+"""
+有上限的日志缓存
+收集器缓存的内存占用按条数和字节数限制，超出上限时把占用最多的服务器缓存溢出到磁盘队列，
+日志文件恢复可写后按原来的顺序先保存溢出的部分，再保存内存中的部分。
+
+每个服务器的缓存是按时间顺序排列的一串分块（内存中的日志列表或磁盘上的溢出文件），新日志只追加到最后一个
+内存分块。保存时在锁内取走当前所有分块（take，之后的新日志进入新的分块），在锁外写入日志文件，
+每保存完一块再在锁内移除（complete），收集线程和状态查询不需要等待磁盘写入。
+溢出也是同样的方式：在锁内选出并封住要溢出的分块，在锁外写入溢出文件，再在锁内换入（释放内存）。
+
+溢出文件使用与预写日志相同的记录格式（长度 + CRC32 + JSON）:
+    logs/.spill/server1/00000001.spill
+
+磁盘也写不下时（例如磁盘已满）丢弃最早的缓存日志并计数，保证进程不会因为日志文件长时间不可写而耗尽内存。
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, List, Callable, Deque, Optional, Tuple
+
+from log_entry import LogEntry
+from write_ahead_log import encode_record, read_records
+
+# LogEntry、解析后的事件记录和时间戳字符串的大致内存占用（消息字符串另计）
+ENTRY_OVERHEAD = 240
+# 无法溢出时丢弃到上限的这个比例以下，避免之后每次追加都重试溢出
+DROP_WATERMARK = 0.9
+# 超出上限时溢出到上限的这个比例以下，使溢出文件较大且不频繁
+SPILL_WATERMARK = 0.5
+# 保存时相邻的分块合并为一批，每批最多的日志条数
+SAVE_BATCH_ENTRIES = 50000
+SPILL_EXTENSION = ".spill"
+
+def estimate_entry_bytes(entry: LogEntry) -> int:
+    """估算一条缓存日志占用的内存字节数"""
+    return ENTRY_OVERHEAD + sys.getsizeof(entry.message)
+
+class InstrumentedLock:
+    """
+    记录等待时间和持有时间的互斥锁，用法与threading.Lock相同
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._acquired_at = 0.0
+
+        # 统计信息（在持有锁时更新）
+        self.stats = {
+            'acquisitions': 0,
+            'contended': 0,
+            'wait_seconds': 0.0,
+            'max_wait_ms': 0.0,
+            'hold_seconds': 0.0,
+            'max_hold_ms': 0.0
+        }
+
+    def acquire(self) -> bool:
+        waited = 0.0
+        if not self._lock.acquire(blocking=False):
+            start = time.perf_counter()
+            self._lock.acquire()
+            waited = time.perf_counter() - start
+            self.stats['contended'] += 1
+        self._acquired_at = time.perf_counter()
+        self.stats['acquisitions'] += 1
+        self.stats['wait_seconds'] += waited
+        self.stats['max_wait_ms'] = max(self.stats['max_wait_ms'], waited * 1000)
+        return True
+
+    def release(self):
+        held = time.perf_counter() - self._acquired_at
+        self.stats['hold_seconds'] += held
+        self.stats['max_hold_ms'] = max(self.stats['max_hold_ms'], held * 1000)
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取锁的等待和持有时间统计"""
+        stats = dict(self.stats)
+        acquisitions = stats['acquisitions'] or 1
+        stats['avg_wait_ms'] = round(stats['wait_seconds'] * 1000 / acquisitions, 4)
+        stats['avg_hold_ms'] = round(stats['hold_seconds'] * 1000 / acquisitions, 4)
+        for key in ('wait_seconds', 'hold_seconds'):
+            stats[key] = round(stats[key], 3)
+        for key in ('max_wait_ms', 'max_hold_ms'):
+            stats[key] = round(stats[key], 3)
+        return stats
+
+class _Chunk:
+    """缓存分块：内存中的日志列表（logs不为None）或磁盘上的溢出文件（seq不为None）"""
+
+    __slots__ = ('logs', 'seq', 'count', 'memory_bytes', 'file_bytes', 'sealed', 'saving', 'spilling',
+                 'written_sinks', 'written_parts')
+
+    def __init__(self, logs: Optional[List[LogEntry]] = None, seq: Optional[int] = None, count: int = 0,
+                 file_bytes: int = 0):
+        self.logs = logs
+        self.seq = seq
+        self.count = count
+        self.memory_bytes = 0
+        self.file_bytes = file_bytes
+        self.sealed = seq is not None  # 不再追加新日志
+        self.saving = False            # 已被保存线程取走
+        self.spilling = False          # 正在锁外写入溢出文件
+        self.written_sinks = set()     # 已成功写入的输出名称（保存失败重试时跳过）
+        self.written_parts = {}        # 输出名称 -> 部分写入失败前已写入的部分（按部分写入的输出重试时跳过）
+
+class ServerBuffer:
+    """
+    单个服务器的缓存：按时间顺序排列的内存分块和溢出分块
+    """
+
+    def __init__(self, server_name: str, spill_directory: str):
+        """
+        初始化服务器缓存，目录中已有的溢出文件（上次运行留下的）排在最前面
+
+        Args:
+            server_name: 服务器名称
+            spill_directory: 该服务器的溢出目录
+        """
+        self.server_name = server_name
+        self.spill_directory = spill_directory
+        self.logger = logging.getLogger("LogBuffer")
+
+        self.chunks: Deque[_Chunk] = deque()
+        self.memory_entries = 0
+        self.memory_bytes = 0
+        self.spilled_entries = 0
+        self.spilled_bytes = 0
+        self._next_seq = 1
+
+        for seq in self._existing_seqs():
+            path = self._chunk_path(seq)
+            records, _, _ = read_records(path)
+            chunk = _Chunk(seq=seq, count=sum(len(entries) for _, entries in records),
+                           file_bytes=os.path.getsize(path))
+            self.chunks.append(chunk)
+            self.spilled_entries += chunk.count
+            self.spilled_bytes += chunk.file_bytes
+            self._next_seq = seq + 1
+
+    def _chunk_path(self, seq: int) -> str:
+        return os.path.join(self.spill_directory, f"{seq:08d}{SPILL_EXTENSION}")
+
+    def _existing_seqs(self) -> List[int]:
+        if not os.path.isdir(self.spill_directory):
+            return []
+        return sorted(
+            int(name[:-len(SPILL_EXTENSION)]) for name in os.listdir(self.spill_directory)
+            if name.endswith(SPILL_EXTENSION) and name[:-len(SPILL_EXTENSION)].isdigit()
+        )
+
+    def __len__(self) -> int:
+        return self.memory_entries + self.spilled_entries
+
+    def __bool__(self) -> bool:
+        return bool(self.chunks)
+
+    def extend(self, logs: List[LogEntry]):
+        """追加新日志到最后一个内存分块"""
+        tail = self.chunks[-1] if self.chunks else None
+        if tail is None or tail.sealed:
+            tail = _Chunk(logs=[])
+            self.chunks.append(tail)
+        size = sum(estimate_entry_bytes(log) for log in logs)
+        tail.logs.extend(logs)
+        tail.count += len(logs)
+        tail.memory_bytes += size
+        self.memory_entries += len(logs)
+        self.memory_bytes += size
+
+    def select_spill(self) -> List[Tuple[_Chunk, int]]:
+        """
+        选出未被保存线程取走的内存分块准备溢出：封住分块（之后的新日志进入新的分块）并按顺序分配溢出文件序号
+
+        Returns:
+            List[Tuple[_Chunk, int]]: 按时间顺序排列的(分块, 序号)，在锁外交给write_spill
+        """
+        selected = []
+        for chunk in self.chunks:
+            if chunk.logs is None or chunk.saving or chunk.spilling or not chunk.logs:
+                continue
+            chunk.sealed = True
+            chunk.spilling = True
+            selected.append((chunk, self._next_seq))
+            self._next_seq += 1
+        return selected
+
+    def write_spill(self, chunk: _Chunk, seq: int) -> int:
+        """
+        把select_spill选出的分块写入溢出文件（不需要持有锁，分块已封住，日志不会再变化）
+
+        Returns:
+            int: 溢出文件的字节数
+
+        Raises:
+            OSError: 写入失败
+        """
+        os.makedirs(self.spill_directory, exist_ok=True)
+        path = self._chunk_path(seq)
+        temp_path = path + ".tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(encode_record(self.server_name, [log.raw_data for log in chunk.logs]))
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return os.path.getsize(path)
+
+    def finish_spill(self, chunk: _Chunk, seq: int, file_bytes: Optional[int]) -> int:
+        """
+        写入溢出文件后换入分块，释放内存；写入期间分块被保存线程取走（或已保存）时删除溢出文件，
+        日志仍由保存线程从内存写入
+
+        Args:
+            chunk: select_spill选出的分块
+            seq: 分配的序号
+            file_bytes: write_spill返回的字节数，None表示没有写入（失败的分块留在内存中）
+
+        Returns:
+            int: 溢出的日志条数
+        """
+        chunk.spilling = False
+        if file_bytes is None:
+            return 0
+        if chunk.saving or not self.holds(chunk):
+            try:
+                os.remove(self._chunk_path(seq))
+            except FileNotFoundError:
+                pass
+            return 0
+
+        self.memory_entries -= chunk.count
+        self.memory_bytes -= chunk.memory_bytes
+        chunk.logs = None
+        chunk.seq = seq
+        chunk.memory_bytes = 0
+        chunk.file_bytes = file_bytes
+        self.spilled_entries += chunk.count
+        self.spilled_bytes += chunk.file_bytes
+        return chunk.count
+
+    def drop_memory(self, count: int) -> int:
+        """
+        从最早的内存分块开始丢弃count条日志（溢出也失败时的最后手段），不丢弃保存线程正在写入和正在溢出的分块
+
+        Returns:
+            int: 实际丢弃的条数
+        """
+        dropped_total = 0
+        for chunk in self.chunks:
+            if dropped_total >= count:
+                break
+            if chunk.logs is None or chunk.saving or chunk.spilling:
+                continue
+            dropped = chunk.logs[:count - dropped_total]
+            del chunk.logs[:len(dropped)]
+            size = sum(estimate_entry_bytes(log) for log in dropped)
+            chunk.count -= len(dropped)
+            chunk.memory_bytes -= size
+            self.memory_entries -= len(dropped)
+            self.memory_bytes -= size
+            dropped_total += len(dropped)
+        return dropped_total
+
+    def drop_oldest_spilled(self) -> int:
+        """
+        删除最早的未被取走的溢出文件
+
+        Returns:
+            int: 丢弃的日志条数
+        """
+        for chunk in self.chunks:
+            if chunk.seq is not None and not chunk.saving:
+                self._remove(chunk)
+                return chunk.count
+        return 0
+
+    def discard_spilled(self) -> int:
+        """删除所有溢出文件（启用预写日志时由WAL重放代替），返回丢弃的条数"""
+        dropped = 0
+        for chunk in [chunk for chunk in self.chunks if chunk.seq is not None]:
+            self._remove(chunk)
+            dropped += chunk.count
+        return dropped
+
+    def _remove(self, chunk: _Chunk):
+        """移除分块并更新计数，溢出分块同时删除文件"""
+        self.chunks.remove(chunk)
+        if chunk.seq is None:
+            self.memory_entries -= chunk.count
+            self.memory_bytes -= chunk.memory_bytes
+            return
+        self.spilled_entries -= chunk.count
+        self.spilled_bytes -= chunk.file_bytes
+        try:
+            os.remove(self._chunk_path(chunk.seq))
+        except FileNotFoundError:
+            pass
+
+    def seal(self) -> Optional[_Chunk]:
+        """
+        之后的新日志进入新的分块
+
+        Returns:
+            Optional[_Chunk]: 当前最后一个分块，它被保存（移出缓存）后之前的日志都已保存
+        """
+        if not self.chunks:
+            return None
+        self.chunks[-1].sealed = True
+        return self.chunks[-1]
+
+    def holds(self, chunk: _Chunk) -> bool:
+        """分块是否仍在缓存中（未保存）"""
+        return any(c is chunk for c in self.chunks)
+
+    def take(self) -> List[_Chunk]:
+        """
+        取走当前所有分块交给保存线程，之后的新日志进入新的分块
+
+        Returns:
+            List[_Chunk]: 按时间顺序排列的分块
+        """
+        for chunk in self.chunks:
+            chunk.sealed = True
+            chunk.saving = True
+        return list(self.chunks)
+
+    def load(self, chunk: _Chunk, restore: Callable[[str, Dict[str, Any]], LogEntry]) -> List[LogEntry]:
+        """
+        读取被取走的分块中的日志（不需要持有锁）
+
+        Args:
+            chunk: take返回的分块
+            restore: 由服务器名称和原始API条目重建LogEntry的函数
+
+        Returns:
+            List[LogEntry]: 日志列表
+        """
+        if chunk.logs is not None:
+            return chunk.logs
+        path = self._chunk_path(chunk.seq)
+        records, _, torn = read_records(path)
+        if torn:
+            self.logger.warning(f"溢出文件 {path} 有残缺的记录，已跳过")
+        return [restore(self.server_name, entry) for _, entries in records for entry in entries]
+
+    def complete(self, chunk: _Chunk):
+        """分块已保存，从缓存中移除"""
+        self._remove(chunk)
+
+    def release(self, chunks: List[_Chunk]):
+        """保存失败，归还未保存的分块（保持原来的位置，下次保存时重试）"""
+        for chunk in chunks:
+            chunk.saving = False
+
+class LogCache:
+    """
+    所有服务器的缓存，内存总量超出上限时溢出到磁盘
+
+    不是线程安全的，除load和enforce_budget外的方法调用方都需要持有收集器的cache_lock
+    """
+
+    def __init__(self, spill_directory: str, restore: Callable[[str, Dict[str, Any]], LogEntry],
+                 max_entries: int = 500000, max_bytes: int = 256 * 1024 * 1024, max_spill_bytes: int = 0):
+        """
+        初始化缓存
+
+        Args:
+            spill_directory: 溢出文件的根目录（每个服务器一个子目录）
+            restore: 由服务器名称和原始API条目重建LogEntry的函数
+            max_entries: 内存中最多缓存的日志条数（所有服务器合计）
+            max_bytes: 内存中最多缓存的日志字节数（估算值，所有服务器合计）
+            max_spill_bytes: 溢出文件最多占用的字节数，超出时丢弃最早的溢出文件，0表示不限制
+        """
+        self.spill_directory = spill_directory
+        self.restore = restore
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_spill_bytes = max_spill_bytes
+        self.logger = logging.getLogger("LogBuffer")
+        self.buffers: Dict[str, ServerBuffer] = {}
+        self._spilling = False  # 是否有线程正在溢出（同一时间只有一个，保持溢出文件的顺序）
+
+        # 统计信息
+        self.stats = {
+            'spills': 0,
+            'spilled_total': 0,
+            'spill_errors': 0,
+            'dropped_entries': 0
+        }
+
+    def add_server(self, server_name: str) -> ServerBuffer:
+        """添加服务器缓存，上次运行留下的溢出文件会在之后的保存中先被保存"""
+        buffer = ServerBuffer(server_name, os.path.join(self.spill_directory, server_name))
+        if buffer.spilled_entries:
+            self.logger.info(f"发现 {server_name} 上次运行留下的 {buffer.spilled_entries} 条溢出日志")
+        self.buffers[server_name] = buffer
+        return buffer
+
+    def __getitem__(self, server_name: str) -> ServerBuffer:
+        return self.buffers[server_name]
+
+    def __contains__(self, server_name: str) -> bool:
+        return server_name in self.buffers
+
+    def items(self):
+        return self.buffers.items()
+
+    def values(self):
+        return self.buffers.values()
+
+    @property
+    def memory_entries(self) -> int:
+        return sum(buffer.memory_entries for buffer in self.buffers.values())
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(buffer.memory_bytes for buffer in self.buffers.values())
+
+    @property
+    def spilled_bytes(self) -> int:
+        return sum(buffer.spilled_bytes for buffer in self.buffers.values())
+
+    def extend(self, server_name: str, logs: List[LogEntry]) -> bool:
+        """
+        追加新日志
+
+        Args:
+            server_name: 服务器名称
+            logs: 新日志
+
+        Returns:
+            bool: 内存是否超出上限，超出时调用方释放锁后调用enforce_budget
+        """
+        self.buffers[server_name].extend(logs)
+        return self._over_budget()
+
+    def load(self, server_name: str, chunk: _Chunk) -> List[LogEntry]:
+        """读取被取走的分块中的日志（不需要持有锁）"""
+        return self.buffers[server_name].load(chunk, self.restore)
+
+    def _over_budget(self, ratio: float = 1.0) -> bool:
+        return self.memory_entries > self.max_entries * ratio or self.memory_bytes > self.max_bytes * ratio
+
+    def enforce_budget(self, lock: InstrumentedLock):
+        """
+        内存超出上限时按占用从大到小溢出服务器缓存，直到低于上限的SPILL_WATERMARK，溢出失败时丢弃最早的日志
+
+        在锁内选出要溢出的分块，在锁外写入溢出文件，再在锁内换入，写入期间收集线程和写入管道不需要等待；
+        其他线程正在溢出时直接返回
+
+        Args:
+            lock: 保护缓存的锁（调用时不能持有）
+        """
+        with lock:
+            if self._spilling or not self._over_budget():
+                return
+            self._spilling = True
+            plan = self._select_spill()
+
+        # 溢出文件大小，没有写入的分块留在内存中
+        written: Dict[int, int] = {}
+        failed: set = set()
+        try:
+            for buffer, selected in plan:
+                try:
+                    for chunk, seq in selected:
+                        written[id(chunk)] = buffer.write_spill(chunk, seq)
+                except OSError as e:
+                    # 之后的分块不再写入，保持溢出文件的顺序
+                    failed.add(buffer.server_name)
+                    self.logger.error(f"{buffer.server_name} 缓存溢出失败: {e}")
+        finally:
+            with lock:
+                self._spilling = False
+                for buffer, selected in plan:
+                    count = sum(buffer.finish_spill(chunk, seq, written.get(id(chunk))) for chunk, seq in selected)
+                    if buffer.server_name in failed:
+                        self.stats['spill_errors'] += 1
+                    if count:
+                        self.stats['spills'] += 1
+                        self.stats['spilled_total'] += count
+                        self.logger.warning(f"缓存超出上限，{buffer.server_name} 的 {count} 条日志已溢出到磁盘")
+
+                if self.max_spill_bytes:
+                    self._enforce_spill_budget()
+
+                # 磁盘也写不下时只能丢弃最早的日志
+                if self._over_budget():
+                    self._drop_oldest()
+
+    def _select_spill(self) -> List[Tuple[ServerBuffer, List[Tuple[_Chunk, int]]]]:
+        """按内存占用从大到小选出要溢出的分块，直到剩余的内存低于上限的SPILL_WATERMARK（调用时持有锁）"""
+        memory_entries = self.memory_entries
+        memory_bytes = self.memory_bytes
+        plan = []
+        for buffer in sorted(self.buffers.values(), key=lambda b: b.memory_bytes, reverse=True):
+            if (memory_entries <= self.max_entries * SPILL_WATERMARK
+                    and memory_bytes <= self.max_bytes * SPILL_WATERMARK):
+                break
+            selected = buffer.select_spill()
+            if not selected:
+                continue
+            memory_entries -= sum(chunk.count for chunk, _ in selected)
+            memory_bytes -= sum(chunk.memory_bytes for chunk, _ in selected)
+            plan.append((buffer, selected))
+        return plan
+
+    def _drop_oldest(self):
+        """从内存占用最多的服务器开始丢弃最早的日志，直到低于上限的DROP_WATERMARK"""
+        max_entries = int(self.max_entries * DROP_WATERMARK)
+        max_bytes = int(self.max_bytes * DROP_WATERMARK)
+        for buffer in sorted(self.buffers.values(), key=lambda b: b.memory_bytes, reverse=True):
+            if not self._over_budget(DROP_WATERMARK):
+                break
+            excess = max(self.memory_entries - max_entries, 0)
+            if self.memory_bytes > max_bytes and buffer.memory_entries:
+                average = buffer.memory_bytes / buffer.memory_entries
+                excess = max(excess, int((self.memory_bytes - max_bytes) / average) + 1)
+            dropped = buffer.drop_memory(excess)
+            if dropped:
+                self.stats['dropped_entries'] += dropped
+                self.logger.error(f"缓存超出上限且无法溢出，丢弃 {buffer.server_name} 最早的 {dropped} 条日志")
+
+    def _enforce_spill_budget(self):
+        """溢出文件超出上限时丢弃最早的溢出文件"""
+        while self.spilled_bytes > self.max_spill_bytes:
+            buffer = max(self.buffers.values(), key=lambda b: b.spilled_bytes)
+            dropped = buffer.drop_oldest_spilled()
+            if not dropped:
+                break
+            self.stats['dropped_entries'] += dropped
+            self.logger.error(f"溢出文件超出上限，丢弃 {buffer.server_name} 最早的 {dropped} 条日志")
+
+    def discard_spilled(self) -> int:
+        """删除所有溢出文件，返回丢弃的条数"""
+        return sum(buffer.discard_spilled() for buffer in self.buffers.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存压力统计"""
+        memory_entries = self.memory_entries
+        memory_bytes = self.memory_bytes
+        stats = dict(self.stats)
+        stats.update({
+            'memory_entries': memory_entries,
+            'memory_bytes': memory_bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'pressure': round(max(memory_entries / self.max_entries if self.max_entries else 0,
+                                  memory_bytes / self.max_bytes if self.max_bytes else 0), 3),
+            'spilled_entries': sum(buffer.spilled_entries for buffer in self.buffers.values()),
+            'spilled_bytes': self.spilled_bytes
+        })
+        return stats
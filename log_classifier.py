@@ -4,9 +4,57 @@ HLL日志分类器
 """
 
 import re
-from typing import Dict, List, Any
+from datetime import datetime
+from typing import Dict, List, Any, Optional
 from enum import Enum
 
+# 日志前缀中的事件时间，例如: [2:58 min (1761193883)]
+EVENT_EPOCH_PATTERN = re.compile(r'^\[[^\]]*?\((\d+)\)\]')
+
+def extract_event_epoch(message: str) -> Optional[int]:
+    """
+    从日志消息前缀中提取事件的Unix时间戳
+    
+    Args:
+        message: 日志消息
+        
+    Returns:
+        Optional[int]: 事件时间戳，无法解析时返回None
+    """
+    match = EVENT_EPOCH_PATTERN.match(message)
+    if match:
+        return int(match.group(1))
+    return None
+
+def get_event_epoch(log_entry: Dict[str, Any]) -> Optional[float]:
+    """
+    获取日志条目的事件时间
+    
+    优先使用收集时解析的事件记录或消息前缀中的时间戳，其次使用条目的timestamp字段（ISO 8601格式）
+    
+    Args:
+        log_entry: 日志条目字典
+        
+    Returns:
+        Optional[float]: 事件的Unix时间戳，无法确定时返回None
+    """
+    # 收集时已解析的事件记录
+    event = log_entry.get('event')
+    if event is not None and event.epoch is not None:
+        return event.epoch
+    
+    epoch = extract_event_epoch(log_entry.get('message', '') or log_entry.get('Message', ''))
+    if epoch is not None:
+        return epoch
+    
+    timestamp = log_entry.get('timestamp', '') or log_entry.get('Timestamp', '')
+    if timestamp:
+        try:
+            return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp()
+        except (ValueError, AttributeError):
+            pass
+    return None
+
 class LogType(Enum):
     """日志类型枚举"""
     KILL = "击杀日志"
@@ -16,56 +64,312 @@ class LogType(Enum):
     TEAM_SWITCH = "选阵营日志"
     OTHER = "其他日志"
 
+# 默认分类规则，按优先级排列：一条日志同时匹配多个类型时归入靠前的类型
+# keywords 为日志前缀 "] " 之后的事件关键字（第一个单词），用于直接定位候选类型
+DEFAULT_RULES = [
+    {
+        "type": "KILL",
+        "patterns": [
+            r'KILL:.*->.*with',  # 普通击杀
+            r'TEAM KILL:.*->.*with',  # 友军误伤
+        ],
+        "keywords": ["KILL", "TEAM"]
+    },
+    {
+        "type": "CHAT",
+        "patterns": [
+            r'CHAT\[.*\]\[.*\]:',  # 聊天消息
+        ],
+        "keywords": ["CHAT"]
+    },
+    {
+        "type": "PLAYER_CONNECTION",
+        "patterns": [
+            r'CONNECTED.*\(',  # 玩家连接
+            r'DISCONNECTED.*\(',  # 玩家断开
+        ],
+        "keywords": ["CONNECTED", "DISCONNECTED"]
+    },
+    {
+        "type": "MATCH_STATUS",
+        "patterns": [
+            r'MATCH.*START',  # 比赛开始
+            r'MATCH.*END',  # 比赛结束
+            r'ROUND.*START',  # 回合开始
+            r'ROUND.*END',  # 回合结束
+            r'GAME.*START',  # 游戏开始
+            r'GAME.*END',  # 游戏结束
+            r'VICTORY',  # 胜利
+            r'DEFEAT',  # 失败
+            r'WIN',  # 获胜
+        ],
+        "keywords": ["MATCH"]
+    },
+    {
+        "type": "TEAM_SWITCH",
+        "patterns": [
+            r'TEAMSWITCH.*\(.*>.*\)',  # 队伍切换
+        ],
+        "keywords": ["TEAMSWITCH"]
+    }
+]
+
+# re.IGNORECASE会把这些字符与ASCII字母i/s/k视为相同，而只转换ASCII字母大小写的匹配不会，
+# 要确认某个类型不匹配时，含有这些字符或换行的消息按优先级逐条正则匹配以保证结果一致
+_LEGACY_ONLY_PATTERN = re.compile('[\u0130\u0131\u017f\u212a]')
+
+# 日志前缀之后的事件关键字（在小写文本上匹配）
+_EVENT_KEYWORD_PATTERN = re.compile(rb'[a-z]+')
+
+_REGEX_SPECIAL_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+def literal_chain(pattern: str) -> Optional[List[bytes]]:
+    """
+    把形如 "字面量.*字面量.*字面量" 的正则表达式拆成字面量序列
+
+    这样的正则表达式在单行文本中能否（忽略大小写）匹配，等价于各字面量能否在转为小写的文本中按顺序依次找到。
+    只处理ASCII字面量，非ASCII字母的大小写规则交给原始正则表达式处理。
+
+    Args:
+        pattern: 正则表达式
+
+    Returns:
+        Optional[List[bytes]]: 小写的字面量列表，无法拆分时返回None
+    """
+    chain = []
+    for part in pattern.split('.*'):
+        literal = []
+        i = 0
+        while i < len(part):
+            char = part[i]
+            if char == '\\':
+                if i + 1 >= len(part) or part[i + 1].isalnum():
+                    return None  # \d、\w等字符类
+                literal.append(part[i + 1])
+                i += 2
+            elif char in _REGEX_SPECIAL_CHARS:
+                return None
+            else:
+                literal.append(char)
+                i += 1
+        literal = ''.join(literal)
+        if not literal or not literal.isascii():
+            return None
+        chain.append(literal.lower().encode('ascii'))
+    return chain
+
+def _chain_implies(chain: List[bytes], other: List[bytes]) -> bool:
+    """判断文本匹配chain时是否一定匹配other（other的字面量按顺序出现在chain的各个字面量之内）"""
+    joined = b'\n'.join(chain)
+    position = 0
+    for literal in other:
+        if b'\n' in literal:
+            return False
+        position = joined.find(literal, position)
+        if position < 0:
+            return False
+        position += len(literal)
+    return True
+
+def _minimal_literals(literals) -> List[bytes]:
+    """去掉包含其他字面量的字面量（较短的出现时较长的不必再查找）"""
+    return sorted(
+        literal for literal in literals
+        if not any(other != literal and other in literal for other in literals)
+    )
+
+def _literal_alternation(literals) -> Optional[re.Pattern]:
+    """把字面量编译为一个在小写文本上查找的组合正则"""
+    literals = _minimal_literals(literals)
+    if not literals:
+        return None
+    return re.compile(b'|'.join(re.escape(literal) for literal in literals))
+
 class LogClassifier:
     """日志分类器"""
     
-    def __init__(self):
-        """初始化分类器，定义各种日志类型的匹配模式"""
-        self.patterns = {
-            LogType.KILL: [
-                r'KILL:.*->.*with',  # 普通击杀
-                r'TEAM KILL:.*->.*with',  # 友军误伤
-            ],
-            LogType.CHAT: [
-                r'CHAT\[.*\]\[.*\]:',  # 聊天消息
-            ],
-            LogType.PLAYER_CONNECTION: [
-                r'CONNECTED.*\(',  # 玩家连接
-                r'DISCONNECTED.*\(',  # 玩家断开
-            ],
-            LogType.MATCH_STATUS: [
-                r'MATCH.*START',  # 比赛开始
-                r'MATCH.*END',  # 比赛结束
-                r'ROUND.*START',  # 回合开始
-                r'ROUND.*END',  # 回合结束
-                r'GAME.*START',  # 游戏开始
-                r'GAME.*END',  # 游戏结束
-                r'VICTORY',  # 胜利
-                r'DEFEAT',  # 失败
-                r'WIN',  # 获胜
-            ],
-            LogType.TEAM_SWITCH: [
-                r'TEAMSWITCH.*\(.*>.*\)',  # 队伍切换
-            ]
-        }
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None):
+        """
+        初始化分类器，定义各种日志类型的匹配模式
+        
+        Args:
+            rules: 分类规则列表（按优先级排列），每条规则包含type（LogType名称）、
+                   patterns（正则表达式列表）和可选的keywords（事件关键字列表），默认使用DEFAULT_RULES
+        """
+        if rules is None:
+            rules = DEFAULT_RULES
+        
+        self.patterns: Dict[LogType, List[str]] = {}
+        self.keywords: Dict[LogType, List[str]] = {}
+        for rule in rules:
+            log_type = LogType[rule["type"]]
+            if log_type == LogType.OTHER:
+                raise ValueError("OTHER是未匹配日志的默认类型，不能配置规则")
+            self.patterns.setdefault(log_type, []).extend(rule.get("patterns", []))
+            self.keywords.setdefault(log_type, []).extend(rule.get("keywords", []))
         
         # 编译正则表达式以提高性能
         self.compiled_patterns = {}
         for log_type, patterns in self.patterns.items():
             self.compiled_patterns[log_type] = [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+        
+        # 每个类型的匹配器: (类型, 小写文本上区分大小写的正则列表, 原始消息上的正则列表)
+        # 能拆成字面量序列的模式在小写文本上匹配（可以利用字面量前缀快速查找），其余保留原始正则
+        self._matchers = []
+        # 每个类型的必要字面量：消息中不含任何一个时该类型一定不匹配，None表示无法判断
+        type_guards = []
+        for log_type, patterns in self.patterns.items():
+            chains = []
+            regexes = []
+            for pattern, compiled in zip(patterns, self.compiled_patterns[log_type]):
+                chain = literal_chain(pattern)
+                if chain is not None:
+                    chains.append(chain)
+                else:
+                    regexes.append(compiled)
+            # 去掉被同类型其他模式蕴含的模式，例如 "TEAM KILL:.*->.*with" 匹配时 "KILL:.*->.*with" 一定匹配
+            chains = [
+                chain for i, chain in enumerate(chains)
+                if not any(j != i and _chain_implies(chain, other) and (other != chain or j < i)
+                           for j, other in enumerate(chains))
+            ]
+            text_regexes = [re.compile(b'.*'.join(re.escape(literal) for literal in chain)) for chain in chains]
+            self._matchers.append((log_type, text_regexes, regexes))
+            type_guards.append({max(chain, key=len) for chain in chains} if not regexes else None)
+        
+        # 优先级最高的类型总是最先检查，其余类型通过事件关键字定位:
+        # 事件关键字 -> (候选类型位置, 更高优先级类型的必要字面量组合正则)
+        self._dispatch: Dict[bytes, tuple] = {}
+        for index in range(1, len(self._matchers)):
+            higher_guards = type_guards[1:index]
+            if any(guards is None for guards in higher_guards):
+                break  # 无法快速排除更高优先级的类型，按优先级逐个检查
+            guard_regex = _literal_alternation({guard for guards in higher_guards for guard in guards})
+            for keyword in self.keywords.get(self._matchers[index][0], []):
+                self._dispatch.setdefault(keyword.lower().encode('utf-8'), (index, guard_regex))
+        
+        # 未知关键字的日志先用一个组合正则判断是否可能属于其余任何类型：
+        # 所有模式都能拆成字面量时组合各类型的必要字面量，在小写文本上查找；否则组合全部原始模式
+        other_guards = type_guards[1:]
+        if all(guards is not None for guards in other_guards):
+            self._combined_pattern = _literal_alternation({guard for guards in other_guards for guard in guards})
+            self._combined_on_text = True
+        else:
+            other_patterns = [pattern for patterns in list(self.patterns.values())[1:] for pattern in patterns]
+            self._combined_pattern = re.compile('|'.join(f'(?:{pattern})' for pattern in other_patterns), re.IGNORECASE)
+            self._combined_on_text = False
+        
+        # 统计信息
+        self.stats = {
+            'fallback': 0,     # 未知关键字，使用组合正则
+            'legacy': 0        # 含特殊字符或换行，逐条正则匹配
+        }
     
     def classify_log(self, log_entry: Dict[str, Any]) -> LogType:
         """
         分类单条日志
         
+        先检查优先级最高的类型（最常见的击杀日志），其余类型读取日志前缀之后的事件关键字直接定位候选类型；
+        为保证与按优先级逐条匹配的结果一致，先用组合正则确认更高优先级的类型不可能匹配。
+        
+        收集时已解析的条目（包含event字段）直接使用解析时的分类结果。
+        
         Args:
             log_entry: 日志条目字典，包含message字段
             
         Returns:
             LogType: 日志类型
         """
-        message = log_entry.get('message', '')
+        event = log_entry.get('event')
+        if event is not None:
+            return event.log_type
+        return self.classify_message(log_entry.get('message', ''))
+    
+    def classify_message(self, message: str) -> LogType:
+        """
+        分类日志消息
+        
+        Args:
+            message: 日志消息
+            
+        Returns:
+            LogType: 日志类型
+        """
+        if not self._matchers:
+            return LogType.OTHER
+        
+        if '\n' in message:
+            self.stats['legacy'] += 1
+            return self._classify_message_legacy(message)
+        
+        # 只转换ASCII字母的大小写；UTF-8中多字节字符的字节不会与ASCII字面量混淆
+        text = message.encode('utf-8', 'surrogatepass').lower()
+        
+        # 匹配成功的结果一定与逐条正则匹配相同
+        if self._type_matches(0, text, message):
+            return self._matchers[0][0]
+        
+        # 要确认某个类型不匹配时，消息中不能含有正则会视为i/s/k的特殊字符
+        if not message.isascii() and _LEGACY_ONLY_PATTERN.search(message):
+            self.stats['legacy'] += 1
+            return self._classify_message_legacy(message)
+        
+        plan = None
+        prefix_end = text.find(b'] ')
+        if prefix_end >= 0:
+            keyword_match = _EVENT_KEYWORD_PATTERN.match(text, prefix_end + 2)
+            if keyword_match:
+                plan = self._dispatch.get(keyword_match.group())
+        
+        if plan is None:
+            self.stats['fallback'] += 1
+            if self._combined_pattern is None or not self._combined_pattern.search(text if self._combined_on_text else message):
+                return LogType.OTHER
+            return self._scan(text, message, 1)
+        
+        index, guard_regex = plan
+        if guard_regex is not None and guard_regex.search(text):
+            # 可能匹配更高优先级的类型
+            return self._scan(text, message, 1)
+        
+        if self._type_matches(index, text, message):
+            return self._matchers[index][0]
+        return self._scan(text, message, index + 1)
+    
+    def _type_matches(self, index: int, text: bytes, message: str) -> bool:
+        """检查消息是否匹配某个类型的任一模式"""
+        _, text_regexes, regexes = self._matchers[index]
+        for regex in text_regexes:
+            if regex.search(text):
+                return True
+        for regex in regexes:
+            if regex.search(message):
+                return True
+        return False
+    
+    def _scan(self, text: bytes, message: str, start: int) -> LogType:
+        """从指定位置开始按优先级检查各种日志类型"""
+        for index in range(start, len(self._matchers)):
+            if self._type_matches(index, text, message):
+                return self._matchers[index][0]
+        
+        # 如果没有匹配到任何模式，归类为其他
+        return LogType.OTHER
+    
+    def classify_log_legacy(self, log_entry: Dict[str, Any]) -> LogType:
+        """
+        按优先级逐条正则匹配分类单条日志（原始实现，用于校验和基准测试）
         
+        Args:
+            log_entry: 日志条目字典，包含message字段
+            
+        Returns:
+            LogType: 日志类型
+        """
+        return self._classify_message_legacy(log_entry.get('message', ''))
+    
+    def _classify_message_legacy(self, message: str) -> LogType:
+        """按优先级逐条正则匹配"""
         # 按优先级检查各种日志类型
         for log_type, patterns in self.compiled_patterns.items():
             for pattern in patterns:
@@ -103,13 +407,12 @@ class LogClassifier:
         Returns:
             Dict[str, int]: 各类型日志的数量统计
         """
-        classified_logs = self.classify_logs(logs)
-        statistics = {}
+        counts = {log_type: 0 for log_type in LogType}
         
-        for log_type, log_list in classified_logs.items():
-            statistics[log_type.value] = len(log_list)
+        for log_entry in logs:
+            counts[self.classify_log(log_entry)] += 1
         
-        return statistics
+        return {log_type.value: count for log_type, count in counts.items()}
     
     def filter_logs_by_type(self, logs: List[Dict[str, Any]], log_type: LogType) -> List[Dict[str, Any]]:
         """
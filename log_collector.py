@@ -1,25 +1,52 @@
+import os
+import math
 import time
+import heapq
+import random
 import threading
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Any, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 
 from hll_http_client import HLLHttpClient
+from hll_rcon_client import HLLRconSyncClient
 from log_manager import LogManager
 from categorized_log_manager import CategorizedLogManager
+from log_classifier import extract_event_epoch
+from dedupe_index import FingerprintIndex, log_fingerprint
+from adaptive_interval import AdaptiveInterval, detect_match_state
+from log_parser import LogParser
+from log_entry import LogEntry
+from segment_sealer import SegmentSealer
+from write_ahead_log import WriteAheadLog, encode_record
+from log_buffer import LogCache, InstrumentedLock
+from writer_pipeline import WriterPipeline
+from circuit_breaker import CircuitBreaker
 
 class LogCollector:
     """HLL日志收集器"""
     
     def __init__(self, config: Dict[str, Any]):
         self.config = config
-        self.log_manager = LogManager(config.get("log_settings", {}).get("logs_directory", "logs"))
-        self.categorized_log_manager = CategorizedLogManager()
-        self.clients: Dict[str, HLLHttpClient] = {}  # 只使用HTTP客户端
+        self.categorized_log_manager = CategorizedLogManager(
+            config.get("log_settings", {}).get("logs_directory", "logs"),
+            storage_format=config.get("log_settings", {}).get("storage_format", "json"),
+            classifier_rules=config.get("log_settings", {}).get("classifier_rules"),
+            kill_columns=config.get("log_settings", {}).get("kill_columns", False),
+            chat_index=config.get("log_settings", {}).get("chat_index", False)
+        )
+        self.log_manager = LogManager(
+            config.get("log_settings", {}).get("logs_directory", "logs"),
+            storage_format=config.get("log_settings", {}).get("storage_format", "json"),
+            classifier=self.categorized_log_manager.classifier,
+            player_index=config.get("log_settings", {}).get("player_index", False)
+        )
+        # 每条日志在收集时解析一次，与分类存储使用同一个分类器
+        self.log_parser = LogParser(self.categorized_log_manager.classifier)
+        self.clients: Dict[str, Any] = {}  # HTTP客户端或原生RCON客户端
         self.running = False
         self.collection_thread = None
-        self.save_thread = None
         self.logger = logging.getLogger("LogCollector")
         
         # 配置参数
@@ -27,40 +54,202 @@ class LogCollector:
         self.save_interval = config.get("log_settings", {}).get("save_interval", 3600)
         self.max_retries = config.get("log_settings", {}).get("max_retries", 3)
         self.retry_delay = config.get("log_settings", {}).get("retry_delay", 10)
+        self.max_retry_delay = config.get("log_settings", {}).get("max_retry_delay", 300)
         
-        # 内存中的日志缓存
-        self.log_cache: Dict[str, List[Dict[str, Any]]] = {}
-        self.cache_lock = threading.Lock()
+        # 调度参数：每个服务器独立的下次拉取时间，带随机抖动避免所有服务器同时拉取
+        self.schedule_jitter = config.get("log_settings", {}).get("schedule_jitter", 0.1)
+        self.collection_workers = config.get("log_settings", {}).get("collection_workers", 32)
+        
+        # 自适应拉取间隔参数
+        self.adaptive_interval = config.get("log_settings", {}).get("adaptive_interval", False)
+        self.min_collection_interval = config.get("log_settings", {}).get("min_collection_interval", self.collection_interval)
+        self.max_collection_interval = config.get("log_settings", {}).get("max_collection_interval", 60)
+        self.target_events_per_poll = config.get("log_settings", {}).get("target_events_per_poll", 20)
+        self.busy_player_count = config.get("log_settings", {}).get("busy_player_count", 60)
+        self.player_refresh_interval = config.get("log_settings", {}).get("player_refresh_interval", 60)
+        self.poll_intervals: Dict[str, AdaptiveInterval] = {}
+        
+        # 调度状态：(到期时间, 服务器名称) 小顶堆，每个服务器同一时间只有一项
+        self._schedule: List[Tuple[float, str]] = []
+        self._schedule_lock = threading.Lock()
+        self._schedule_event = threading.Event()
+        self._collection_executor: Optional[ThreadPoolExecutor] = None
+        self.poll_states: Dict[str, Dict[str, Any]] = {}
+        
+        # 断路器：每个服务器一个，HTTP服务器另外按API地址共用一个，失败后的重试时间只由断路器决定
+        self.server_breakers: Dict[str, CircuitBreaker] = {}
+        self.host_breakers: Dict[Tuple[str, int], CircuitBreaker] = {}
+        
+        # 增量拉取参数：回溯窗口 = 距上次成功拉取的时间 + 重叠时间
+        self.backtrack_overlap = config.get("log_settings", {}).get("backtrack_overlap", 10)
+        self.max_backtrack_seconds = config.get("log_settings", {}).get("max_backtrack_seconds", 180)
+        
+        # 每个服务器的拉取游标（已见过的最新事件时间及其指纹）
+        self.log_cursors: Dict[str, Dict[str, Any]] = {}
+        
+        # 分段封存：已结束小时的分段在后台线程中压缩
+        self.segment_sealer: Optional[SegmentSealer] = None
+        if config.get("log_settings", {}).get("seal_segments", False):
+            # 封存延迟至少覆盖一次最大回溯和一个保存周期，迟到的日志不会写入已封存的小时
+            min_seal_delay = self.max_backtrack_seconds + self.save_interval + 60
+            self.segment_sealer = SegmentSealer(
+                config.get("log_settings", {}).get("logs_directory", "logs"),
+                [self.log_manager.writer_pool, self.categorized_log_manager.writer_pool],
+                compression=config.get("log_settings", {}).get("seal_compression", "gzip"),
+                seal_delay=max(config.get("log_settings", {}).get("seal_delay", 900), min_seal_delay),
+                scan_interval=config.get("log_settings", {}).get("seal_scan_interval", 600),
+                manifest_stores=[self.log_manager.manifests, self.categorized_log_manager.manifests]
+            )
+        
+        # 每个服务器的去重索引（固定容量，按时间窗口过期）
+        self.dedupe_capacity = config.get("log_settings", {}).get("dedupe_capacity", 20000)
+        self.dedupe_window_seconds = config.get("log_settings", {}).get("dedupe_window_seconds", 600)
+        self.dedupe_indexes: Dict[str, FingerprintIndex] = {}
+        
+        # 内存中的日志缓存（超出上限时溢出到磁盘）
+        self.log_cache = LogCache(
+            os.path.join(config.get("log_settings", {}).get("logs_directory", "logs"), ".spill"),
+            self._restore_entry,
+            max_entries=config.get("log_settings", {}).get("cache_max_entries", 500000),
+            max_bytes=config.get("log_settings", {}).get("cache_max_bytes", 256 * 1024 * 1024),
+            max_spill_bytes=config.get("log_settings", {}).get("cache_max_spill_bytes", 0)
+        )
+        # cache_lock只保护缓存结构（追加、取走、移除分块），不在持有时做磁盘写入
+        self.cache_lock = InstrumentedLock("cache_lock")
+        
+        # 写入管道：每个服务器的缓存达到批次大小或最早的日志等待了save_interval秒后写入日志文件
+        self.writer = WriterPipeline(
+            self.log_cache,
+            self.cache_lock,
+            max_batch_entries=config.get("log_settings", {}).get("writer_max_batch_entries", 5000),
+            max_batch_age=self.save_interval,
+            workers=config.get("log_settings", {}).get("writer_workers", 4),
+            after_flush=self._maybe_checkpoint_wal
+        )
+        self.writer.register_sink("raw", self._write_raw_logs)
+        self.writer.register_sink("categorized", self._write_categorized_logs, partial=True)
+        
+        # 预写日志：缓存中的日志同时写入WAL，崩溃重启后重放
+        self.wal: Optional[WriteAheadLog] = None
+        self.wal_fsync = config.get("log_settings", {}).get("wal_fsync", True)
+        if config.get("log_settings", {}).get("write_ahead_log", False):
+            self.wal = WriteAheadLog(
+                os.path.join(config.get("log_settings", {}).get("logs_directory", "logs"), ".wal"),
+                sync_interval=config.get("log_settings", {}).get("wal_sync_interval", 0.05),
+                sync_bytes=config.get("log_settings", {}).get("wal_sync_bytes", 1024 * 1024),
+                fsync=self.wal_fsync
+            )
+        # WAL检查点：rotate时记录每个服务器缓存的最后一个分块，这些分块都写入后删除之前的WAL文件
+        self._wal_barrier: Optional[Tuple[int, Dict[str, Any]]] = None
+        self._checkpoint_lock = threading.Lock()
         
         # 初始化客户端
         self._initialize_clients()
     
     def _initialize_clients(self):
-        """初始化HTTP客户端"""
+        """初始化客户端（按服务器配置的transport选择HTTP或原生RCON）"""
         servers = self.config.get("servers", [])
         api_config = self.config.get("api_config", {})
         
         for server in servers:
             if server.get("enabled", True):
                 server_name = server["name"]
-                
-                # 获取服务器特定的API配置，如果没有则使用全局配置
-                api_host = server.get("api_host")
-                api_port = server.get("api_port")
-                
-                # 使用HTTP客户端
-                client = HLLHttpClient(
-                    host=server["host"],
-                    port=server["port"],
-                    password=server["password"],
-                    api_host=api_host,
-                    api_port=api_port,
-                    api_config=api_config
-                )
-                self.logger.info(f"初始化HTTP客户端: {server_name} (API: {client.api_host}:{client.api_port})")
+                client = self._create_client(server_name, server, api_config)
                 
                 self.clients[server_name] = client
-                self.log_cache[server_name] = []
+                self.log_cache.add_server(server_name)
+                self.log_cursors[server_name] = {
+                    "last_epoch": None,       # 已见过的最新事件时间
+                    "boundary_ids": set(),    # 最新事件时间上已见过的日志指纹
+                    "last_poll": None         # 上次成功拉取的开始时间
+                }
+                self.dedupe_indexes[server_name] = FingerprintIndex(
+                    capacity=self.dedupe_capacity,
+                    window_seconds=self.dedupe_window_seconds
+                )
+                self.poll_intervals[server_name] = self._create_poll_interval()
+                self.poll_states[server_name] = {
+                    "consecutive_failures": 0,  # 连续失败次数
+                    "next_due": None,           # 下次拉取时间
+                    "last_success": None        # 上次成功拉取的时间
+                }
+                self.server_breakers[server_name] = self._create_breaker(server_name)
+                if isinstance(client, HLLHttpClient):
+                    host_key = self._host_key(client)
+                    if host_key not in self.host_breakers:
+                        self.host_breakers[host_key] = self._create_breaker(f"{host_key[0]}:{host_key[1]}")
+    
+    def _create_breaker(self, name: str) -> CircuitBreaker:
+        """创建断路器，连续失败max_retries次后打开，退避时间从retry_delay开始加倍，上限为max_retry_delay"""
+        return CircuitBreaker(
+            name,
+            failure_threshold=self.max_retries,
+            base_delay=self.retry_delay,
+            max_delay=self.max_retry_delay
+        )
+    
+    @staticmethod
+    def _host_key(client: Any) -> Tuple[str, int]:
+        """获取客户端实际连接的地址（HTTP客户端为API地址）"""
+        if isinstance(client, HLLHttpClient):
+            return client.api_host, client.api_port
+        return client.host, client.port
+    
+    def _create_poll_interval(self) -> AdaptiveInterval:
+        """创建自适应拉取间隔，间隔上限保证加上抖动和重叠时间后不超过最大回溯时间"""
+        backtrack_limit = (self.max_backtrack_seconds - self.backtrack_overlap) / (1 + self.schedule_jitter)
+        return AdaptiveInterval(
+            min_interval=self.min_collection_interval,
+            max_interval=self.max_collection_interval,
+            target_events_per_poll=self.target_events_per_poll,
+            busy_player_count=self.busy_player_count,
+            backtrack_limit=max(1.0, backtrack_limit)
+        )
+    
+    def _get_poll_interval(self, server_name: str) -> float:
+        """获取服务器当前的拉取间隔"""
+        if not self.adaptive_interval:
+            return self.collection_interval
+        return self.poll_intervals[server_name].interval
+    
+    def _create_client(self, server_name: str, server: Dict[str, Any], api_config: Dict[str, Any]) -> Any:
+        """
+        根据服务器配置创建客户端
+        
+        Args:
+            server_name: 服务器名称
+            server: 服务器配置
+            api_config: 全局API配置
+            
+        Returns:
+            HLLHttpClient或HLLRconSyncClient
+        """
+        if server.get("transport", "http") == "rcon":
+            # 直接连接游戏服务器的RCON端口
+            client = HLLRconSyncClient(
+                host=server["host"],
+                port=server["port"],
+                password=server["password"],
+                timeout=api_config.get("timeout", 30)
+            )
+            self.logger.info(f"初始化RCON客户端: {server_name} ({client.host}:{client.port})")
+            return client
+        
+        # 获取服务器特定的API配置，如果没有则使用全局配置
+        api_host = server.get("api_host")
+        api_port = server.get("api_port")
+        
+        # 使用HTTP客户端
+        client = HLLHttpClient(
+            host=server["host"],
+            port=server["port"],
+            password=server["password"],
+            api_host=api_host,
+            api_port=api_port,
+            api_config=api_config
+        )
+        self.logger.info(f"初始化HTTP客户端: {server_name} (API: {client.api_host}:{client.api_port})")
+        return client
     
     def start(self):
         """启动日志收集"""
@@ -71,13 +260,26 @@ class LogCollector:
         self.running = True
         self.logger.info("启动日志收集器")
         
+        # 重放上次运行未保存的预写日志（溢出文件中的日志也在WAL中，不再单独保存）
+        if self.wal is not None:
+            with self.cache_lock:
+                self.log_cache.discard_spilled()
+            self._replay_wal(self.wal.open())
+        
         # 启动收集线程
         self.collection_thread = threading.Thread(target=self._collection_loop, daemon=True)
         self.collection_thread.start()
         
-        # 启动保存线程
-        self.save_thread = threading.Thread(target=self._save_loop, daemon=True)
-        self.save_thread.start()
+        # 启动写入管道，上次运行留下的溢出日志按等待时间写入
+        self.writer.start()
+        with self.cache_lock:
+            pending = {server_name: len(buffer) for server_name, buffer in self.log_cache.items() if buffer}
+        for server_name, count in pending.items():
+            self.writer.notify(server_name, count)
+        
+        # 启动封存线程
+        if self.segment_sealer is not None:
+            self.segment_sealer.start()
     
     def stop(self):
         """停止日志收集"""
@@ -86,186 +288,535 @@ class LogCollector:
         
         self.logger.info("停止日志收集器")
         self.running = False
+        self._schedule_event.set()
         
         # 等待线程结束
         if self.collection_thread:
             self.collection_thread.join(timeout=10)
-        if self.save_thread:
-            self.save_thread.join(timeout=10)
+        if self.segment_sealer is not None:
+            self.segment_sealer.stop()
         
         # 保存剩余的缓存日志
-        self._save_all_cached_logs()
+        self.writer.stop()
+        if self.wal is not None:
+            self._maybe_checkpoint_wal(blocking=True)
+            self.wal.close()
+        
+        # 关闭分段文件句柄
+        self.log_manager.close()
+        self.categorized_log_manager.close()
         
         # 断开所有连接
-        for client in self.clients.values():
-            client.disconnect()
+        self._close_clients()
         
         self.logger.info("日志收集器已停止")
     
+    def _close_clients(self):
+        """断开所有客户端连接"""
+        for client in self.clients.values():
+            if isinstance(client, HLLRconSyncClient):
+                client.close()
+            else:
+                client.disconnect()
+    
     def _collection_loop(self):
-        """日志收集主循环"""
-        self.logger.info(f"开始日志收集循环，间隔: {self.collection_interval}秒")
+        """
+        日志收集调度循环
         
-        while self.running:
-            try:
-                start_time = time.time()
-                
-                # 并行收集所有服务器的日志
-                self._collect_logs_from_all_servers()
-                
-                # 计算睡眠时间
-                elapsed_time = time.time() - start_time
-                sleep_time = max(0, self.collection_interval - elapsed_time)
-                
-                if sleep_time > 0:
-                    time.sleep(sleep_time)
-                else:
-                    self.logger.warning(f"日志收集耗时 {elapsed_time:.2f}秒，超过间隔时间")
-                    
-            except Exception as e:
-                self.logger.error(f"日志收集循环出错: {e}")
-                time.sleep(self.collection_interval)
-    
-    def _collect_logs_from_all_servers(self):
-        """并行收集所有服务器的日志"""
-        if not self.clients:
-            return
+        每个服务器有独立的下次拉取时间，到期后提交到长期存在的线程池执行。
+        某个服务器拉取缓慢或失败只会推迟它自己的下次拉取，不影响其他服务器。
+        """
+        workers = max(1, min(self.collection_workers, len(self.clients)))
+        self.logger.info(f"开始日志收集循环，间隔: {self.collection_interval}秒，工作线程: {workers}")
         
-        # 使用线程池并行处理
-        with ThreadPoolExecutor(max_workers=len(self.clients)) as executor:
-            future_to_server = {
-                executor.submit(self._collect_server_logs, server_name, client): server_name
-                for server_name, client in self.clients.items()
-            }
-            
-            for future in as_completed(future_to_server):
-                server_name = future_to_server[future]
+        self._collection_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hll-poll")
+        
+        # 首次拉取时间在一个间隔内随机分布
+        now = time.time()
+        for server_name in self.clients:
+            self._schedule_poll(server_name, now + random.uniform(0, self.collection_interval))
+        
+        try:
+            while self.running:
                 try:
-                    logs = future.result(timeout=30)  # 30秒超时
-                    if logs:
-                        with self.cache_lock:
-                            self.log_cache[server_name].extend(logs)
-                        self.logger.debug(f"收集到 {len(logs)} 条日志 from {server_name}")
+                    wait_time = self._submit_due_polls()
+                    self._schedule_event.wait(timeout=wait_time)
+                    self._schedule_event.clear()
                 except Exception as e:
-                    self.logger.error(f"收集服务器 {server_name} 日志失败: {e}")
+                    self.logger.error(f"日志收集循环出错: {e}")
+                    time.sleep(self.collection_interval)
+        finally:
+            self._collection_executor.shutdown(wait=True)
+    
+    def _schedule_poll(self, server_name: str, due_time: float):
+        """安排服务器的下次拉取"""
+        with self._schedule_lock:
+            heapq.heappush(self._schedule, (due_time, server_name))
+            self.poll_states[server_name]["next_due"] = due_time
+        self._schedule_event.set()
     
-    def _collect_server_logs(self, server_name: str, client: HLLHttpClient) -> List[Dict[str, Any]]:
-        """收集单个服务器的日志"""
-        retry_count = 0
+    def _submit_due_polls(self) -> float:
+        """
+        提交所有到期的拉取任务
         
-        while retry_count < self.max_retries:
-            try:
-                # 确保连接有效
-                if not client.ensure_connection():
-                    raise Exception("无法建立连接")
-                
-                # HTTP客户端获取日志
-                logs = client.get_admin_logs(seconds=180)  # 获取3分钟的日志
-                if logs is not None:
-                    # 转换格式以保持一致性
-                    formatted_logs = []
-                    for log_entry in logs:
-                        formatted_logs.append({
-                            'timestamp': log_entry.get('timestamp', ''),
-                            'server': server_name,
-                            'message': log_entry.get('message', ''),
-                            'raw_data': log_entry
-                        })
-                    logs = formatted_logs
-                    self.logger.debug(f"HTTP客户端收集到 {server_name} 的 {len(logs)} 条日志")
-                    return logs
-                else:
-                    raise Exception("获取日志返回None")
-                    
-            except Exception as e:
-                retry_count += 1
-                self.logger.warning(f"收集 {server_name} 日志失败 (尝试 {retry_count}/{self.max_retries}): {e}")
-                
-                if retry_count < self.max_retries:
-                    # 增加重试间隔，给服务器更多恢复时间
-                    sleep_time = self.retry_delay * retry_count  # 递增延迟
-                    self.logger.info(f"等待 {sleep_time} 秒后重试...")
-                    time.sleep(sleep_time)
-                else:
-                    # 重置连接状态
-                    client.disconnect()
-                    self.logger.error(f"收集 {server_name} 日志最终失败，已断开连接")
+        Returns:
+            float: 距下一个拉取任务到期的秒数
+        """
+        due_servers = []
+        with self._schedule_lock:
+            now = time.time()
+            while self._schedule and self._schedule[0][0] <= now:
+                due_servers.append(heapq.heappop(self._schedule)[1])
+            wait_time = self._schedule[0][0] - now if self._schedule else self.collection_interval
         
-        return []
+        # 服务器出队后直到本次拉取结束才会重新入队，因此不会同时有两个拉取任务
+        for server_name in due_servers:
+            self._collection_executor.submit(self._poll_server_once, server_name)
+        
+        return max(0.0, min(wait_time, self.collection_interval))
     
-    def _save_loop(self):
-        """日志保存主循环"""
-        self.logger.info(f"开始日志保存循环，间隔: {self.save_interval}秒")
+    def _poll_server_once(self, server_name: str):
+        """拉取一次服务器日志并安排下次拉取"""
+        client = self.clients[server_name]
+        start_time = time.time()
+        success = False
+        
+        # 断路器打开时不发出请求，直接安排到退避结束
+        wait = self._breaker_wait(server_name, client, start_time)
+        if wait > 0:
+            if self.running:
+                self._schedule_poll(server_name, start_time + wait)
+            return
         
-        last_save_time = time.time()
+        try:
+            logs = self._collect_server_logs(server_name, client)
+            if logs:
+                lsn = self._cache_logs(server_name, logs)
+                if lsn is not None and self.wal_fsync:
+                    self.wal.wait_durable(lsn)
+                self.logger.debug(f"收集到 {len(logs)} 条日志 from {server_name}")
+            success = True
+        except Exception as e:
+            self.logger.warning(f"收集 {server_name} 日志失败: {e}")
         
-        while self.running:
+        if success and self._players_due(server_name):
             try:
-                current_time = time.time()
-                
-                # 检查是否到了保存时间或者有新日志需要保存
-                should_save = current_time - last_save_time >= self.save_interval
-                
-                # 如果有缓存的日志，也触发保存
-                with self.cache_lock:
-                    has_cached_logs = any(logs for logs in self.log_cache.values())
-                
-                if should_save or has_cached_logs:
-                    self._save_all_cached_logs()
-                    last_save_time = current_time
-                
-                # 每5秒检查一次（更频繁）
-                time.sleep(5)
-                
+                self._record_players(server_name, client.get_players())
+            except Exception as e:
+                self.logger.debug(f"获取 {server_name} 玩家数量失败: {e}")
+        
+        opened = self._record_breakers(server_name, client, success)
+        delay = self._next_poll_delay(server_name, success, start_time)
+        if opened:
+            try:
+                client.disconnect()
             except Exception as e:
-                self.logger.error(f"日志保存循环出错: {e}")
-                time.sleep(5)
+                self.logger.error(f"断开 {server_name} 连接失败: {e}")
+        
+        if self.running:
+            self._schedule_poll(server_name, time.time() + delay)
     
-    def _save_all_cached_logs(self):
-        """保存所有缓存的日志"""
+    def _next_poll_delay(self, server_name: str, success: bool, start_time: float) -> float:
+        """
+        计算距下次拉取的时间
+        
+        成功时保持该服务器当前的拉取间隔（从本次拉取开始计时）；失败时断路器未打开则retry_delay秒后重试，
+        已打开则等到断路器的退避时间结束。两种情况都加入随机抖动。
+        
+        Args:
+            server_name: 服务器名称
+            success: 本次拉取是否成功
+            start_time: 本次拉取的开始时间
+            
+        Returns:
+            float: 距下次拉取的秒数
+        """
+        state = self.poll_states[server_name]
+        now = time.time()
+        elapsed = now - start_time
+        
+        interval = self._get_poll_interval(server_name)
+        
+        if success:
+            state["consecutive_failures"] = 0
+            state["last_success"] = now
+            base_delay = interval
+            if elapsed > base_delay:
+                self.logger.warning(f"{server_name} 日志收集耗时 {elapsed:.2f}秒，超过间隔时间")
+            base_delay -= elapsed
+        else:
+            state["consecutive_failures"] += 1
+            failures = state["consecutive_failures"]
+            base_delay = self.server_breakers[server_name].retry_in(now) or self.retry_delay
+            self.logger.info(f"{server_name} 连续失败 {failures} 次，{base_delay:.0f} 秒后重试")
+        
+        jitter = random.uniform(-1, 1) * self.schedule_jitter * interval
+        return max(0.0, base_delay + jitter)
+    
+    def _players_due(self, server_name: str) -> bool:
+        """判断是否需要刷新服务器的玩家数量（仅自适应间隔模式）"""
+        return self.adaptive_interval and self.poll_intervals[server_name].players_due(self.player_refresh_interval)
+    
+    def _record_players(self, server_name: str, players: Optional[List[Dict[str, Any]]]):
+        """记录玩家数量，获取失败时保持原值"""
+        if players is not None:
+            self.poll_intervals[server_name].record_players(len(players))
+    
+    def _breaker_wait(self, server_name: str, client: Any, now: float) -> float:
+        """
+        拉取前检查服务器和API地址的断路器
+        
+        Returns:
+            float: 0表示可以拉取，否则为距断路器允许请求的秒数
+        """
+        # 服务器断路器只由该服务器的拉取使用，先检查它，避免占用地址断路器的试探名额后又不发出请求
+        server_breaker = self.server_breakers[server_name]
+        if server_breaker.retry_in(now) > 0:
+            return server_breaker.allow(now)
+        host_breaker = self.host_breakers.get(self._host_key(client))
+        if host_breaker is not None:
+            wait = host_breaker.allow(now)
+            if wait > 0:
+                return wait
+        return server_breaker.allow(now)
+    
+    def _record_breakers(self, server_name: str, client: Any, success: bool) -> bool:
+        """
+        把拉取结果记录到断路器，API地址不可达（连接错误、超时）时地址断路器也记一次失败
+        
+        Returns:
+            bool: 服务器断路器是否因这次失败而打开（打开时重置连接）
+        """
+        now = time.time()
+        host_breaker = self.host_breakers.get(self._host_key(client))
+        if host_breaker is not None:
+            if not success and getattr(client, "api_unreachable", False):
+                host_breaker.record_failure(now)
+            else:
+                host_breaker.record_success()
+        
+        server_breaker = self.server_breakers[server_name]
+        if success:
+            server_breaker.record_success()
+            return False
+        return server_breaker.record_failure(now)
+    
+    def _collect_server_logs(self, server_name: str, client: Any) -> List[LogEntry]:
+        """
+        拉取一次单个服务器的日志（只返回没有收集过的新日志）
+        
+        失败时直接抛出异常，由调度器按该服务器自己的退避时间安排重试；
+        不预先检查连接，客户端在请求失败时自行重新连接并重试
+        """
+        # 根据距上次成功拉取的时间确定回溯窗口
+        poll_started = time.time()
+        seconds = self._get_backtrack_seconds(server_name, poll_started)
+        
+        # 获取日志
+        logs = client.get_admin_logs(seconds=seconds)
+        if logs is None:
+            raise Exception("获取日志返回None")
+        return self._ingest_logs(server_name, logs, poll_started, seconds)
+    
+    def _ingest_logs(self, server_name: str, entries: List[Dict[str, Any]], poll_started: float,
+                     seconds: int) -> List[LogEntry]:
+        """
+        处理一次拉取的结果：按游标过滤、去重并转换格式
+        
+        Args:
+            server_name: 服务器名称
+            entries: API返回的原始日志条目
+            poll_started: 本次拉取的开始时间
+            seconds: 本次拉取的回溯秒数
+            
+        Returns:
+            List[LogEntry]: 可以进入缓存的新日志
+        """
+        fetched_count = len(entries)
+        last_poll = self.log_cursors[server_name]["last_poll"]
+        entries = self._advance_cursor(server_name, entries, poll_started)
+        entries = self._drop_duplicates(server_name, entries)
+        
+        # 更新自适应间隔的观测数据
+        poll_interval = self.poll_intervals[server_name]
+        poll_interval.record_fetch(len(entries), poll_started - last_poll if last_poll is not None else seconds)
+        poll_interval.record_match_state(detect_match_state([entry.get('message', '') for entry in entries]))
+        
+        # 转换为紧凑的缓存条目（保存时还原为原来的字典格式）
+        formatted_logs = [
+            LogEntry.from_api_entry(server_name, entry, self.log_parser.parse(entry.get('message', '')))
+            for entry in entries
+        ]
+        self.logger.debug(f"收集到 {server_name} 的 {len(formatted_logs)}/{fetched_count} 条新日志 (回溯 {seconds} 秒)")
+        return formatted_logs
+    
+    def _get_backtrack_seconds(self, server_name: str, now: float) -> int:
+        """
+        计算本次拉取的回溯时间
+        
+        Args:
+            server_name: 服务器名称
+            now: 当前时间
+            
+        Returns:
+            int: 回溯秒数，首次拉取或超过上限时使用max_backtrack_seconds
+        """
+        last_poll = self.log_cursors[server_name]["last_poll"]
+        if last_poll is None:
+            return self.max_backtrack_seconds
+        
+        elapsed = max(0.0, now - last_poll)
+        seconds = int(math.ceil(elapsed)) + self.backtrack_overlap
+        return max(1, min(seconds, self.max_backtrack_seconds))
+    
+    def _advance_cursor(self, server_name: str, entries: List[Dict[str, Any]], poll_started: float) -> List[Dict[str, Any]]:
+        """
+        按游标过滤日志并推进游标
+        
+        早于游标的条目可能是迟到或乱序的日志，时间在去重窗口（dedupe_window_seconds）之内的交给去重索引判断，
+        只丢弃更早的（去重索引已经不记得它们，无法区分是否收集过）
+        
+        Args:
+            server_name: 服务器名称
+            entries: API返回的原始日志条目
+            poll_started: 本次拉取的开始时间
+            
+        Returns:
+            List[Dict]: 游标之后的日志条目和游标之前的迟到条目
+        """
+        cursor = self.log_cursors[server_name]
+        last_epoch = cursor["last_epoch"]
+        boundary_ids = cursor["boundary_ids"]
+        
+        newest_epoch = last_epoch
+        newest_ids = set(boundary_ids)
+        new_entries = []
+        
+        for entry in entries:
+            epoch = extract_event_epoch(entry.get('message', ''))
+            if epoch is None:
+                # 无法解析事件时间的条目交由下游去重
+                new_entries.append(entry)
+                continue
+            
+            # 与LogManager使用相同的唯一标识
+            log_id = f"{entry.get('timestamp', '')}_{entry.get('message', '')}"
+            
+            if last_epoch is not None:
+                if epoch < last_epoch - self.dedupe_window_seconds or (epoch == last_epoch and log_id in boundary_ids):
+                    continue
+            
+            new_entries.append(entry)
+            
+            if newest_epoch is None or epoch > newest_epoch:
+                newest_epoch = epoch
+                newest_ids = {log_id}
+            elif epoch == newest_epoch:
+                newest_ids.add(log_id)
+        
+        cursor["last_epoch"] = newest_epoch
+        cursor["boundary_ids"] = newest_ids
+        cursor["last_poll"] = poll_started
+        
+        return new_entries
+    
+    def _drop_duplicates(self, server_name: str, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        通过去重索引丢弃已经收集过的日志
+        
+        Args:
+            server_name: 服务器名称
+            entries: API返回的原始日志条目
+            
+        Returns:
+            List[Dict]: 未见过的日志条目
+        """
+        index = self.dedupe_indexes[server_name]
+        now = time.time()
+        unique_entries = []
+        
+        for entry in entries:
+            fingerprint = log_fingerprint(entry.get('timestamp', ''), entry.get('message', ''))
+            if index.add(fingerprint, now):
+                unique_entries.append(entry)
+        
+        return unique_entries
+    
+    def _cache_logs(self, server_name: str, logs: List[LogEntry]) -> Optional[int]:
+        """
+        把新日志加入缓存，启用预写日志时同时写入WAL
+        
+        Args:
+            server_name: 服务器名称
+            logs: 新日志
+            
+        Returns:
+            Optional[int]: WAL记录序号（调用方在锁外等待其同步到磁盘），未启用时为None
+        """
+        record = encode_record(server_name, [log.raw_data for log in logs]) if self.wal is not None else None
         with self.cache_lock:
-            for server_name, logs in self.log_cache.items():
-                if logs:
-                    try:
-                        # 保存原始日志
-                        self.log_manager.save_logs(server_name, logs)
-                        self.logger.info(f"保存了 {len(logs)} 条缓存日志 for {server_name}")
-                        
-                        # 保存分类日志
-                        save_counts = self.categorized_log_manager.save_categorized_logs(server_name, logs)
-                        if save_counts:
-                            self.logger.info(f"分类保存完成 for {server_name}: {save_counts}")
-                        
-                        logs.clear()  # 清空缓存
-                    except Exception as e:
-                        self.logger.error(f"保存 {server_name} 缓存日志失败: {e}")
+            # 与缓存在同一把锁下写入，检查点的rotate不会把这批日志分到错误的WAL文件
+            lsn = self.wal.append_encoded(record) if record is not None else None
+            over_budget = self.log_cache.extend(server_name, logs)
+            pending = len(self.log_cache[server_name])
+        if over_budget:
+            # 溢出文件在锁外写入
+            self.log_cache.enforce_budget(self.cache_lock)
+        self.writer.notify(server_name, pending)
+        return lsn
+    
+    def _save_all_cached_logs(self):
+        """立即写入所有缓存的日志（不等待批次大小或等待时间），全部写入后删除旧的WAL文件"""
+        self.writer.flush_all()
+        self._maybe_checkpoint_wal(blocking=True)
+    
+    def _write_raw_logs(self, server_name: str, logs: List[LogEntry]):
+        """写入管道的原始日志输出"""
+        self.log_manager.save_logs(server_name, logs)
+        self.logger.info(f"保存了 {len(logs)} 条缓存日志 for {server_name}")
+    
+    def _write_categorized_logs(self, server_name: str, logs: List[LogEntry], written_parts: set):
+        """写入管道的分类日志输出，按 (小时, 类型) 记录已写入的部分，部分失败后重试时跳过"""
+        save_counts = self.categorized_log_manager.save_categorized_logs(server_name, logs, written_parts)
+        if save_counts:
+            self.logger.info(f"分类保存完成 for {server_name}: {save_counts}")
+    
+    def _maybe_checkpoint_wal(self, blocking: bool = False):
+        """
+        检查是否可以删除旧的WAL文件（写入管道每写入一个服务器后调用）
+        
+        检查点开始时在cache_lock内rotate并封住每个服务器缓存的最后一个分块，之后的日志进入新的WAL文件和
+        新的分块；这些分块都写入（移出缓存）后，旧WAL文件中的日志都已保存，同步日志文件后删除，并开始下一个检查点
+        
+        Args:
+            blocking: 其他线程正在检查时是否等待（停止和强制保存时），否则直接返回
+        """
+        if self.wal is None or not self._checkpoint_lock.acquire(blocking=blocking):
+            return
+        try:
+            while True:
+                with self.cache_lock:
+                    started = self._wal_barrier is None
+                    if started:
+                        self._wal_barrier = (
+                            self.wal.rotate(),
+                            {server_name: buffer.seal() for server_name, buffer in self.log_cache.items()}
+                        )
+                    checkpoint, tails = self._wal_barrier
+                    if any(tail is not None and self.log_cache[server_name].holds(tail)
+                           for server_name, tail in tails.items()):
+                        return
+                    self._wal_barrier = None
+                self._checkpoint_wal(checkpoint)
+                if started:
+                    return
+        finally:
+            self._checkpoint_lock.release()
+    
+    def _checkpoint_wal(self, checkpoint: int):
+        """日志文件同步到磁盘后删除序号小于checkpoint的WAL文件"""
+        try:
+            if self.wal_fsync:
+                self.log_manager.sync()
+                self.categorized_log_manager.sync()
+            self.wal.discard_before(checkpoint)
+        except OSError as e:
+            self.logger.error(f"预写日志检查点失败，保留WAL文件: {e}")
+    
+    def _restore_entry(self, server_name: str, raw_entry: Dict[str, Any]) -> LogEntry:
+        """由API返回的原始条目重建缓存条目（WAL重放和读取溢出文件时使用）"""
+        return LogEntry.from_api_entry(server_name, raw_entry, self.log_parser.parse(raw_entry.get('message', '')))
+    
+    def _replay_wal(self, before_seq: int):
+        """
+        把上次运行未保存的预写日志重放到缓存并保存
+        
+        原始日志中已保存过的条目会被LogManager去重；分类日志没有去重，只有在保存完成后、
+        删除WAL文件前崩溃时才会出现重复。保存失败的日志留在缓存中由写入管道重试，全部保存后才删除旧的WAL文件
+        
+        Args:
+            before_seq: WAL.open返回的序号
+        """
+        replayed = 0
+        for server_name, entries in self.wal.replay(before_seq):
+            with self.cache_lock:
+                if server_name not in self.log_cache:
+                    self.log_cache.add_server(server_name)
+                over_budget = self.log_cache.extend(
+                    server_name, [self._restore_entry(server_name, entry) for entry in entries]
+                )
+            if over_budget:
+                self.log_cache.enforce_budget(self.cache_lock)
+            replayed += len(entries)
+        
+        if replayed:
+            self.logger.info(f"从预写日志重放 {replayed} 条日志")
+            self._save_all_cached_logs()
+        else:
+            self._checkpoint_wal(before_seq)
     
     def get_status(self) -> Dict[str, Any]:
         """获取收集器状态"""
         status = {
             "running": self.running,
             "servers": {},
-            "cache_status": {}
+            "cache_status": {},
+            "parser": self.log_parser.get_stats()
         }
+        if self.segment_sealer is not None:
+            status["sealer"] = self.segment_sealer.get_stats()
+        if self.log_manager.player_index is not None:
+            status["player_index"] = self.log_manager.player_index.get_stats()
+        if self.categorized_log_manager.chat_index is not None:
+            status["chat_index"] = self.categorized_log_manager.chat_index.get_stats()
+        if self.wal is not None:
+            status["wal"] = self.wal.get_stats()
+        if self.host_breakers:
+            status["host_breakers"] = {
+                f"{host}:{port}": breaker.get_stats() for (host, port), breaker in self.host_breakers.items()
+            }
         
         # 服务器连接状态
         for server_name, client in self.clients.items():
             status["servers"][server_name] = {
                 "connected": client.connected,
                 "host": client.host,
-                "port": client.port
+                "port": client.port,
+                "cursor_epoch": self.log_cursors[server_name]["last_epoch"],
+                "consecutive_failures": self.poll_states[server_name]["consecutive_failures"],
+                "next_poll_in": self._seconds_until_next_poll(server_name),
+                "poll_interval": round(self._get_poll_interval(server_name), 1),
+                "dedupe": self.dedupe_indexes[server_name].get_stats(),
+                "client": client.get_stats(),
+                "breaker": self.server_breakers[server_name].get_stats()
             }
+            if self.adaptive_interval:
+                status["servers"][server_name]["adaptive_interval"] = self.poll_intervals[server_name].get_stats()
         
-        # 缓存状态
+        # 缓存状态（锁内只复制计数，读取日志文件信息在锁外进行）
         with self.cache_lock:
-            for server_name, logs in self.log_cache.items():
+            status["cache"] = self.log_cache.get_stats()
+            for server_name, buffer in self.log_cache.items():
                 status["cache_status"][server_name] = {
-                    "cached_logs": len(logs),
-                    "log_file_info": self.log_manager.get_current_log_file_info(server_name)
+                    "cached_logs": len(buffer),
+                    "spilled_logs": buffer.spilled_entries
                 }
+        for server_name, cache_status in status["cache_status"].items():
+            cache_status["log_file_info"] = self.log_manager.get_current_log_file_info(server_name)
+        status["writer"] = self.writer.get_stats()
+        status["locks"] = {
+            "cache_lock": self.cache_lock.get_stats()
+        }
         
         return status
     
+    def _seconds_until_next_poll(self, server_name: str) -> Optional[float]:
+        """距服务器下次拉取的秒数，未安排时返回None"""
+        next_due = self.poll_states[server_name]["next_due"]
+        if next_due is None:
+            return None
+        return round(max(0.0, next_due - time.time()), 1)
+    
     def force_save(self):
         """强制保存所有缓存日志"""
         self.logger.info("强制保存缓存日志")
@@ -287,10 +838,21 @@ class LogCollector:
             stats["total_size"] += server_stats["total_size"]
             stats["total_logs"] += server_stats["total_logs"]
         
+        # 今天和最近7天的分类数量，从聚合统计读取
+        now = datetime.now()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        stats["categories"] = {
+            "today": self.categorized_log_manager.get_range_statistics(self.clients.keys(), today, now),
+            "last_7_days": self.categorized_log_manager.get_range_statistics(
+                self.clients.keys(), today - timedelta(days=6), now
+            )
+        }
+        
         return stats
     
     def cleanup_old_logs(self, days_to_keep: int = 30):
         """清理旧日志"""
         self.logger.info(f"开始清理 {days_to_keep} 天前的旧日志")
         for server_name in self.clients.keys():
-            self.log_manager.cleanup_old_logs(server_name, days_to_keep)
\ No newline at end of file
+            self.log_manager.cleanup_old_logs(server_name, days_to_keep)
+            self.categorized_log_manager.cleanup_old_logs(server_name, days_to_keep)
\ No newline at end of file
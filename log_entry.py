@@ -0,0 +1,184 @@
+"""
+紧凑的缓存日志条目
+收集器缓存中的每条日志使用一个__slots__对象：服务器名称驻留共享，
+原始API条目只有timestamp和message时不再单独保存一份（需要时按原样重建）
+"""
+
+import sys
+from typing import Dict, Any, Optional, List
+
+# 字典键 -> 属性名
+_FIELDS = {
+    'timestamp': 'timestamp',
+    'server': 'server',
+    'message': 'message',
+    'event': 'event',
+    'CollectedAt': 'collected_at'
+}
+
+class LogEntry:
+    """
+    缓存中的日志条目
+
+    提供与原来的日志字典兼容的get/[]/in接口，保存时通过to_dict转换为原来的字典格式
+    """
+
+    __slots__ = ('timestamp', 'server', 'message', 'event', 'collected_at', '_raw')
+
+    def __init__(self, timestamp: str, server: str, message: str, raw_data: Optional[Dict[str, Any]] = None,
+                 event: Any = None):
+        """
+        初始化日志条目
+
+        Args:
+            timestamp: 日志时间戳
+            server: 服务器名称
+            message: 日志消息
+            raw_data: API返回的原始条目
+            event: 解析后的事件记录（只在内存中使用）
+        """
+        self.timestamp = timestamp
+        self.server = sys.intern(server)
+        self.message = message
+        self.event = event
+        self.collected_at: Optional[str] = None
+
+        # 原始条目只包含这两个字段且内容相同时不保存，需要时重建
+        if (raw_data is not None and len(raw_data) == 2 and tuple(raw_data) == ('timestamp', 'message')
+                and raw_data['timestamp'] is timestamp and raw_data['message'] is message):
+            self._raw = None
+        else:
+            self._raw = raw_data
+
+    @classmethod
+    def from_api_entry(cls, server: str, api_entry: Dict[str, Any], event: Any = None) -> "LogEntry":
+        """
+        由API返回的日志条目创建
+
+        Args:
+            server: 服务器名称
+            api_entry: API返回的原始条目
+            event: 解析后的事件记录
+
+        Returns:
+            LogEntry: 日志条目
+        """
+        return cls(api_entry.get('timestamp', ''), server, api_entry.get('message', ''), api_entry, event)
+
+    @property
+    def raw_data(self) -> Dict[str, Any]:
+        """API返回的原始条目"""
+        if self._raw is not None:
+            return self._raw
+        return {'timestamp': self.timestamp, 'message': self.message}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """与dict.get兼容的读取接口"""
+        if key == 'raw_data':
+            return self.raw_data
+        attr = _FIELDS.get(key)
+        if attr is None:
+            return default
+        value = getattr(self, attr)
+        if value is None and attr in ('event', 'collected_at'):
+            return default
+        return value
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        attr = _FIELDS.get(key)
+        if attr is None:
+            raise KeyError(f"LogEntry不支持字段: {key}")
+        setattr(self, attr, value)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        转换为保存到文件的字典格式（不包含event）
+
+        Returns:
+            Dict: 与原来的缓存日志字典相同的结构
+        """
+        result = {
+            'timestamp': self.timestamp,
+            'server': self.server,
+            'message': self.message,
+            'raw_data': self.raw_data
+        }
+        if self.collected_at is not None:
+            result['CollectedAt'] = self.collected_at
+        return result
+
+    def __repr__(self) -> str:
+        return f"LogEntry(server={self.server!r}, timestamp={self.timestamp!r}, message={self.message!r})"
+
+_MISSING = object()
+
+def measure_entry_memory(count: int = 100000) -> Dict[str, Any]:
+    """
+    测量缓存中每条日志占用的内存（原来的嵌套字典 vs LogEntry）
+
+    使用模拟的API条目，两种表示都包含解析后的事件记录（事件记录和消息字符串不计入）
+
+    Args:
+        count: 测量的条目数量
+
+    Returns:
+        Dict: 每条日志的字节数
+    """
+    import tracemalloc
+    from log_parser import LogParser
+
+    parser = LogParser()
+    templates = [
+        "[2:58 min ({epoch})] KILL: esc—5(Allies/76561198287323037) -> ICE Tea(Axis/76561199130443107) with M1 GARAND",
+        "[2:47 min ({epoch})] CHAT[Team][mrgeorge06824(Axis/02339d3b7647c9bfd89cca2ce1fa9813)]: KKKKK",
+        "[2:49 min ({epoch})] CONNECTED 美术特长生 (76561199404917656)",
+    ]
+    messages = [templates[i % len(templates)].format(epoch=1761193883 + i) for i in range(count)]
+    events = [parser.parse(message) for message in messages]
+    timestamp = "2025-10-23T04:34:21.310Z"
+    server_name = "server1"
+
+    def fetch() -> List[Dict[str, Any]]:
+        # 模拟API响应解析出的条目，缓存之外没有其他引用
+        return [{"timestamp": timestamp, "message": message} for message in messages]
+
+    def measure(build) -> float:
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            cache: List[Any] = build(fetch())
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+        del cache
+        return size / count
+
+    dict_bytes = measure(lambda api_entries: [
+        {
+            'timestamp': entry.get('timestamp', ''),
+            'server': server_name,
+            'message': entry.get('message', ''),
+            'raw_data': entry,
+            'event': event
+        }
+        for entry, event in zip(api_entries, events)
+    ])
+    compact_bytes = measure(lambda api_entries: [
+        LogEntry.from_api_entry(server_name, entry, event) for entry, event in zip(api_entries, events)
+    ])
+
+    return {
+        'entries': count,
+        'dict_bytes_per_entry': round(dict_bytes, 1),
+        'compact_bytes_per_entry': round(compact_bytes, 1)
+    }
@@ -1,31 +1,74 @@
 import os
 import json
 import logging
-from datetime import datetime
-from typing import List, Dict, Any
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Tuple, Set, Iterator, Optional
 from pathlib import Path
 
+from dedupe_index import log_fingerprint
+from log_classifier import LogClassifier
+from segment_manifest import ManifestStore
+from player_index import PlayerIndex
+from segment_io import (
+    STORAGE_FORMATS, SEALED_EXTENSIONS, segment_extension, segment_files, read_segment,
+    write_json_atomic, storable_entry, encode_jsonl_lines, partition_by_hour, iter_hours, in_time_range,
+    SegmentWriterPool, sync_files
+)
+
 class LogManager:
     """日志文件管理器"""
     
-    def __init__(self, logs_directory: str = "logs"):
+    def __init__(self, logs_directory: str = "logs", storage_format: str = "json", classifier: LogClassifier = None,
+                 player_index: bool = False):
+        """
+        Args:
+            logs_directory: 日志目录
+            storage_format: 存储格式，json（整个文件重写）或jsonl（只追加新记录）
+            classifier: 统计各类型数量使用的分类器，默认使用内置规则
+            player_index: 是否在保存时建立玩家索引（玩家ID -> 日志位置）
+        """
+        if storage_format not in STORAGE_FORMATS:
+            raise ValueError(f"不支持的存储格式: {storage_format}")
+        
         self.logs_directory = Path(logs_directory)
+        self.storage_format = storage_format
         self.logger = logging.getLogger("LogManager")
         self.current_log_files = {}  # 存储当前打开的日志文件句柄
         
+        # jsonl格式下每个服务器当前分段的日志指纹，用于去重而无需重读文件
+        self._segment_ids: Dict[str, Dict[Path, Set[int]]] = {}
+        
+        # jsonl格式下保持打开的分段追加句柄
+        self.writer_pool = SegmentWriterPool()
+        
+        # 上次sync之后写入过的分段文件
+        self._unsynced_files: Set[str] = set()
+        
+        # 分段清单，统计和状态只读取清单
+        self.manifests = ManifestStore("raw", ("hll_logs",), classifier)
+        
+        # 玩家索引，按玩家ID查询时只读取索引指向的日志行
+        self.player_index: Optional[PlayerIndex] = PlayerIndex(logs_directory) if player_index else None
+        
         # 确保日志目录存在
         self.logs_directory.mkdir(exist_ok=True)
     
-    def get_log_file_path(self, server_name: str, timestamp: datetime = None) -> Path:
+    def get_log_file_path(self, server_name: str, timestamp: datetime = None, storage_format: str = None,
+                          create: bool = True) -> Path:
         """获取日志文件路径
         
         Args:
             server_name: 服务器名称
             timestamp: 时间戳，默认为当前时间
+            storage_format: 存储格式，默认为当前配置的格式
+            create: 是否创建目录
             
         Returns:
             日志文件路径
         """
+        if storage_format is None:
+            storage_format = self.storage_format
+        
         if timestamp is None:
             timestamp = datetime.now()
             
@@ -37,63 +80,121 @@ class LogManager:
         
         # 构建目录路径：logs/server1/25_10/23
         log_dir = self.logs_directory / server_name / year_month
-        log_dir.mkdir(parents=True, exist_ok=True)
+        if create:
+            log_dir.mkdir(parents=True, exist_ok=True)
         
         # 构建文件路径：logs/server1/25_10/23/hll_logs_2025-10-23_14.json
         hour = timestamp.strftime("%H")
-        filename = f"hll_logs_{timestamp.strftime('%Y-%m-%d')}_{hour}.json"
+        filename = f"hll_logs_{timestamp.strftime('%Y-%m-%d')}_{hour}{segment_extension(storage_format)}"
         
         return log_dir / day / filename
     
     def save_logs(self, server_name: str, logs: List[Dict[str, Any]], timestamp: datetime = None) -> int:
         """保存日志到文件
         
+        未指定时间戳时，每条日志按其事件时间（消息前缀中的时间戳或timestamp字段）
+        保存到对应小时的文件中
+        
         Args:
             server_name: 服务器名称
             logs: 日志数据列表
-            timestamp: 时间戳，默认为当前时间
+            timestamp: 时间戳，指定时所有日志保存到该时间对应的文件
             
         Returns:
             保存的新日志数量
+            
+        Raises:
+            Exception: 写入分段文件失败（已写入的小时不会回滚，重试时由去重跳过）
         """
         if not logs:
             return 0
             
-        if timestamp is None:
-            timestamp = datetime.now()
+        saved_count = 0
+        try:
+            if timestamp is not None:
+                saved_count = self._save_segment(server_name, logs, timestamp)
+            else:
+                for hour, hour_logs in sorted(partition_by_hour(logs).items()):
+                    saved_count += self._save_segment(server_name, hour_logs, hour)
+        finally:
+            self._flush_manifests()
+        return saved_count
+    
+    def _flush_manifests(self):
+        """写入本次保存修改过的清单和玩家索引"""
+        try:
+            self.manifests.flush()
+        except Exception as e:
+            self.logger.error(f"写入分段清单失败: {e}")
+        
+        if self.player_index is not None:
+            try:
+                self.player_index.flush()
+            except Exception as e:
+                self.logger.error(f"提交玩家索引失败: {e}")
+    
+    def _save_segment(self, server_name: str, logs: List[Dict[str, Any]], timestamp: datetime) -> int:
+        """保存日志到时间戳对应的小时文件
+        
+        Args:
+            server_name: 服务器名称
+            logs: 日志数据列表
+            timestamp: 时间戳
             
+        Returns:
+            保存的新日志数量
+        """
         log_file_path = self.get_log_file_path(server_name, timestamp)
         
         # 确保目录存在
         log_file_path.parent.mkdir(parents=True, exist_ok=True)
         
+        if self.storage_format == "jsonl":
+            hour_key = (timestamp.year, timestamp.month, timestamp.day, timestamp.hour)
+            return self._append_logs(server_name, log_file_path, logs, hour_key)
+        
+        # 持有写入器池的锁，封存线程不会在读取和重写之间替换该文件
+        with self.writer_pool.lock:
+            return self._rewrite_segment(server_name, log_file_path, logs)
+    
+    def _rewrite_segment(self, server_name: str, log_file_path: Path, logs: List[Dict[str, Any]]) -> int:
+        """以json格式合并并重写分段文件
+        
+        Args:
+            server_name: 服务器名称
+            log_file_path: 分段文件路径
+            logs: 日志数据列表
+            
+        Returns:
+            保存的新日志数量
+        """
         try:
             # 读取现有日志（如果文件存在）
             existing_logs = []
             if log_file_path.exists():
-                with open(log_file_path, 'r', encoding='utf-8') as f:
-                    try:
-                        existing_logs = json.load(f)
-                    except json.JSONDecodeError:
-                        self.logger.warning(f"日志文件格式错误，将重新创建: {log_file_path}")
-                        existing_logs = []
+                try:
+                    existing_logs = read_segment(log_file_path)
+                except json.JSONDecodeError:
+                    # 保留损坏的文件以便人工恢复，而不是直接覆盖
+                    corrupt_path = log_file_path.with_name(
+                        f"{log_file_path.name}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+                    )
+                    log_file_path.rename(corrupt_path)
+                    self.manifests.reset_segment(str(log_file_path))
+                    if self.player_index is not None:
+                        self.player_index.reset_segment(server_name, str(log_file_path))
+                    self.logger.warning(f"日志文件格式错误，已另存为 {corrupt_path}，将重新创建: {log_file_path}")
+                    existing_logs = []
             
             # 合并新日志（避免重复）
             existing_log_ids = set()
             if existing_logs:
                 for log in existing_logs:
-                    # 使用时间戳和消息内容作为唯一标识（兼容大小写）
-                    timestamp = log.get('timestamp', '') or log.get('Timestamp', '')
-                    message = log.get('message', '') or log.get('Message', '')
-                    log_id = f"{timestamp}_{message}"
-                    existing_log_ids.add(log_id)
+                    existing_log_ids.add(self._get_log_id(log))
             
             new_logs = []
             for log in logs:
-                # 使用时间戳和消息内容作为唯一标识（兼容大小写）
-                timestamp = log.get('timestamp', '') or log.get('Timestamp', '')
-                message = log.get('message', '') or log.get('Message', '')
-                log_id = f"{timestamp}_{message}"
+                log_id = self._get_log_id(log)
                 if log_id not in existing_log_ids:
                     new_logs.append(log)
                     existing_log_ids.add(log_id)
@@ -104,11 +205,16 @@ class LogManager:
                 for log in new_logs:
                     log['CollectedAt'] = current_time.isoformat()
                 
-                # 合并并保存
+                # 合并并原子地保存，写入中断不会破坏原文件
                 all_logs = existing_logs + new_logs
-                
-                with open(log_file_path, 'w', encoding='utf-8') as f:
-                    json.dump(all_logs, f, ensure_ascii=False, indent=2)
+                write_json_atomic(log_file_path, [storable_entry(log) for log in all_logs])
+                self._unsynced_files.add(str(log_file_path))
+                self.manifests.record_append(str(log_file_path), new_logs)
+                if self.player_index is not None:
+                    self.player_index.record_append(
+                        server_name, str(log_file_path), new_logs,
+                        [(len(existing_logs) + index, 0) for index in range(len(new_logs))]
+                    )
                 
                 self.logger.info(f"保存了 {len(new_logs)} 条新日志到 {log_file_path}")
                 return len(new_logs)
@@ -118,7 +224,178 @@ class LogManager:
                 
         except Exception as e:
             self.logger.error(f"保存日志失败 {log_file_path}: {e}")
-            return 0
+            raise
+    
+    def _append_logs(self, server_name: str, log_file_path: Path, logs: List[Dict[str, Any]], hour_key: Tuple) -> int:
+        """以jsonl格式追加日志
+        
+        Args:
+            server_name: 服务器名称
+            log_file_path: 当前分段文件路径
+            logs: 日志数据列表
+            hour_key: 分段所属的小时
+            
+        Returns:
+            保存的新日志数量
+        """
+        try:
+            segment_ids = self._get_segment_ids(server_name, log_file_path)
+            
+            new_logs = []
+            for log in logs:
+                fingerprint = log_fingerprint(*self._get_log_key(log))
+                if fingerprint not in segment_ids:
+                    new_logs.append(log)
+                    segment_ids.add(fingerprint)
+            
+            if not new_logs:
+                self.logger.debug(f"没有新日志需要保存到 {log_file_path}")
+                return 0
+            
+            # 添加收集时间戳
+            current_time = datetime.now()
+            for log in new_logs:
+                log['CollectedAt'] = current_time.isoformat()
+            
+            # 一次缓冲写入追加到分段末尾
+            if self.player_index is None:
+                self.writer_pool.append(log_file_path, new_logs, group=server_name, hour_key=hour_key)
+            else:
+                # 逐行编码以得到每条日志在文件中的偏移量
+                lines = encode_jsonl_lines(new_logs)
+                offset, _ = self.writer_pool.append_lines(log_file_path, lines, group=server_name, hour_key=hour_key)
+                positions = []
+                for line in lines:
+                    positions.append((offset, len(line)))
+                    offset += len(line)
+                self.player_index.record_append(server_name, str(log_file_path), new_logs, positions)
+            self._unsynced_files.add(str(log_file_path))
+            self.writer_pool.close_idle()
+            self.manifests.record_append(str(log_file_path), new_logs)
+            
+            self.logger.info(f"保存了 {len(new_logs)} 条新日志到 {log_file_path}")
+            return len(new_logs)
+            
+        except Exception as e:
+            # 写入失败时丢弃指纹缓存，下次从文件重新加载
+            self._segment_ids.get(server_name, {}).pop(log_file_path, None)
+            self.logger.error(f"保存日志失败 {log_file_path}: {e}")
+            raise
+    
+    def _get_segment_ids(self, server_name: str, log_file_path: Path) -> Set[int]:
+        """获取分段已保存日志的指纹集合，首次写入分段时从文件加载一次
+        
+        每个服务器只保留最近使用的两个分段（当前小时和跨小时的上一小时）
+        """
+        server_segments = self._segment_ids.setdefault(server_name, {})
+        segment_ids = server_segments.get(log_file_path)
+        if segment_ids is not None:
+            return segment_ids
+        
+        segment_ids = set()
+        for file_path in segment_files(log_file_path):
+            for log in read_segment(file_path):
+                segment_ids.add(log_fingerprint(*self._get_log_key(log)))
+        
+        while len(server_segments) >= 2:
+            server_segments.pop(next(iter(server_segments)))
+        server_segments[log_file_path] = segment_ids
+        return segment_ids
+    
+    @staticmethod
+    def _get_log_key(log: Dict[str, Any]) -> Tuple[str, str]:
+        """获取日志的时间戳和消息内容（兼容大小写）"""
+        timestamp = log.get('timestamp', '') or log.get('Timestamp', '')
+        message = log.get('message', '') or log.get('Message', '')
+        return timestamp, message
+    
+    def _get_log_id(self, log: Dict[str, Any]) -> str:
+        """使用时间戳和消息内容作为唯一标识"""
+        timestamp, message = self._get_log_key(log)
+        return f"{timestamp}_{message}"
+    
+    def load_logs(self, server_name: str, timestamp: datetime = None) -> List[Dict[str, Any]]:
+        """读取指定小时的日志，自动识别json和jsonl格式，已封存的分段自动解压
+        
+        Args:
+            server_name: 服务器名称
+            timestamp: 时间戳，默认为当前时间
+            
+        Returns:
+            日志数据列表
+        """
+        logs = []
+        for storage_format in STORAGE_FORMATS:
+            log_file_path = self.get_log_file_path(server_name, timestamp, storage_format, create=False)
+            for file_path in segment_files(log_file_path):
+                try:
+                    logs.extend(read_segment(file_path))
+                except Exception as e:
+                    self.logger.error(f"读取日志文件失败 {file_path}: {e}")
+        return logs
+    
+    def read_range(self, server_name: str, start: datetime, end: datetime) -> Iterator[Dict[str, Any]]:
+        """读取时间范围内的日志，只打开与范围重叠的小时文件
+        
+        Args:
+            server_name: 服务器名称
+            start: 开始时间
+            end: 结束时间
+            
+        Yields:
+            事件时间在范围内的日志条目
+        """
+        start_epoch = start.timestamp()
+        end_epoch = end.timestamp()
+        
+        for hour in iter_hours(start, end):
+            for log in self.load_logs(server_name, hour):
+                if in_time_range(log, start_epoch, end_epoch):
+                    yield log
+    
+    def find_player_logs(self, server_name: str, player_id: str, start: datetime, end: datetime) -> Iterator[Dict[str, Any]]:
+        """按时间顺序读取玩家在时间范围内的击杀、聊天和进出日志，只读取玩家索引指向的日志行
+        
+        Args:
+            server_name: 服务器名称
+            player_id: 玩家ID（Steam ID或EOS ID）
+            start: 开始时间
+            end: 结束时间
+            
+        Yields:
+            与该玩家相关的日志条目
+            
+        Raises:
+            RuntimeError: 未启用玩家索引
+        """
+        if self.player_index is None:
+            raise RuntimeError("未启用玩家索引（log_settings.player_index）")
+        return self.player_index.lookup(server_name, player_id, start, end)
+    
+    def _iter_log_files(self, directory: Path, recursive: bool = False):
+        """遍历目录下的原始日志文件（json和jsonl格式，包括已封存的压缩文件）"""
+        glob = directory.rglob if recursive else directory.glob
+        for storage_format in STORAGE_FORMATS:
+            for sealed in ("",) + SEALED_EXTENSIONS:
+                yield from glob(f"hll_logs_*{segment_extension(storage_format)}{sealed}")
+    
+    def sync(self):
+        """把上次sync之后写入过的分段文件同步到磁盘"""
+        with self.writer_pool.lock:
+            unsynced_files, self._unsynced_files = self._unsynced_files, set()
+        try:
+            sync_files(unsynced_files)
+        except OSError:
+            # 同步失败的文件留到下次同步，检查点不会在它们落盘之前删除WAL
+            with self.writer_pool.lock:
+                self._unsynced_files |= unsynced_files
+            raise
+    
+    def close(self):
+        """关闭所有打开的文件句柄"""
+        self.writer_pool.close_all()
+        if self.player_index is not None:
+            self.player_index.close()
     
     def get_current_log_file_info(self, server_name: str) -> Dict[str, Any]:
         """获取当前日志文件信息
@@ -130,27 +407,21 @@ class LogManager:
             包含文件路径、大小等信息的字典
         """
         current_time = datetime.now()
-        log_file_path = self.get_log_file_path(server_name, current_time)
+        log_file_path = self.get_log_file_path(server_name, current_time, create=False)
         
-        info = {
+        # 只读取清单，不解析日志文件
+        manifest = None
+        try:
+            manifest = self.manifests.get_segment(str(log_file_path))
+        except Exception as e:
+            self.logger.error(f"读取分段清单失败 {log_file_path}: {e}")
+        
+        return {
             "path": str(log_file_path),
-            "exists": log_file_path.exists(),
-            "size": 0,
-            "log_count": 0
+            "exists": manifest is not None,
+            "size": manifest["bytes"] if manifest else 0,
+            "log_count": manifest["entries"] if manifest else 0
         }
-        
-        if log_file_path.exists():
-            try:
-                info["size"] = log_file_path.stat().st_size
-                
-                with open(log_file_path, 'r', encoding='utf-8') as f:
-                    logs = json.load(f)
-                    info["log_count"] = len(logs) if isinstance(logs, list) else 0
-                    
-            except Exception as e:
-                self.logger.error(f"读取日志文件信息失败 {log_file_path}: {e}")
-        
-        return info
     
     def cleanup_old_logs(self, server_name: str, days_to_keep: int = 30):
         """清理旧日志文件
@@ -178,7 +449,7 @@ class LogManager:
                         continue
                     
                     # 遍历日志文件
-                    for log_file in day_dir.glob("*.json"):
+                    for log_file in self._iter_log_files(day_dir):
                         try:
                             # 从文件名提取日期
                             file_date_str = log_file.stem.split('_')[2]  # hll_logs_2025-10-23_14.json
@@ -187,6 +458,7 @@ class LogManager:
                             # 检查是否超过保留期限
                             if (current_time - file_date).days > days_to_keep:
                                 log_file.unlink()
+                                self.manifests.remove_segment(str(log_file))
                                 deleted_count += 1
                                 self.logger.info(f"删除旧日志文件: {log_file}")
                                 
@@ -207,6 +479,11 @@ class LogManager:
                 except:
                     pass
             
+            # 按日期删除玩家索引分区
+            if self.player_index is not None:
+                cutoff = current_time.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days_to_keep)
+                self.player_index.drop_before(server_name, cutoff)
+            
             if deleted_count > 0:
                 self.logger.info(f"清理完成，删除了 {deleted_count} 个旧日志文件")
                 
@@ -226,42 +503,24 @@ class LogManager:
             "total_files": 0,
             "total_size": 0,
             "total_logs": 0,
-            "date_range": {"start": None, "end": None}
+            "date_range": {"start": None, "end": None},
+            "log_types": {}
         }
         
         try:
-            server_log_dir = self.logs_directory / server_name
-            if not server_log_dir.exists():
-                return stats
-            
-            dates = []
-            
-            # 遍历所有日志文件
-            for log_file in server_log_dir.rglob("*.json"):
-                stats["total_files"] += 1
-                stats["total_size"] += log_file.stat().st_size
-                
-                try:
-                    # 从文件名提取日期
-                    file_date_str = log_file.stem.split('_')[2]
-                    file_date = datetime.strptime(file_date_str, "%Y-%m-%d")
-                    dates.append(file_date)
-                    
-                    # 统计日志条数
-                    with open(log_file, 'r', encoding='utf-8') as f:
-                        logs = json.load(f)
-                        if isinstance(logs, list):
-                            stats["total_logs"] += len(logs)
-                            
-                except Exception as e:
-                    self.logger.error(f"读取日志文件统计失败 {log_file}: {e}")
+            # 只读取每个月的汇总清单，缺少清单的历史分段在第一次统计时重建
+            summary, dates = self.manifests.summarize(str(self.logs_directory / server_name))
+            stats["total_files"] = summary["files"]
+            stats["total_size"] = summary["bytes"]
+            stats["total_logs"] = summary["entries"]
+            stats["log_types"] = summary["types"]
             
             # 设置日期范围
             if dates:
-                stats["date_range"]["start"] = min(dates).strftime("%Y-%m-%d")
-                stats["date_range"]["end"] = max(dates).strftime("%Y-%m-%d")
+                stats["date_range"]["start"] = min(dates)
+                stats["date_range"]["end"] = max(dates)
             
         except Exception as e:
             self.logger.error(f"获取日志统计失败: {e}")
         
-        return stats
\ No newline at end of file
+        return stats
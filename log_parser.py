@@ -0,0 +1,333 @@
+"""
+HLL日志结构化解析器
+在收集时把每条日志解析一次，生成按事件类型区分的紧凑记录（使用__slots__），
+分类、存储、索引和统计都直接使用解析结果，不再各自用正则表达式重新解析消息
+"""
+
+import re
+import sys
+from typing import Dict, Any, Optional
+
+from log_classifier import LogClassifier, LogType
+
+# 日志前缀，例如: [2:58 min (1761193883)]
+PREFIX_PATTERN = re.compile(r'^\[(?P<relative>[^\]]*?)\s*\((?P<epoch>\d+)\)\]\s*')
+
+# 击杀: KILL: 击杀者(阵营/ID) -> 被击杀者(阵营/ID) with 武器
+KILL_PATTERN = re.compile(
+    r'^(?P<team_kill>TEAM )?KILL: (?P<killer>.+?)\((?P<killer_team>[^/()]*)/(?P<killer_id>[^()]*)\)'
+    r' -> (?P<victim>.+?)\((?P<victim_team>[^/()]*)/(?P<victim_id>[^()]*)\) with (?P<weapon>.*)$',
+    re.DOTALL
+)
+
+# 聊天: CHAT[频道][发送者(阵营/ID)]: 内容
+CHAT_PATTERN = re.compile(
+    r'^CHAT\[(?P<channel>[^\]]*)\]\[(?P<sender>.+?)\((?P<sender_team>[^/()]*)/(?P<sender_id>[^()]*)\)\]: ?(?P<text>.*)$',
+    re.DOTALL
+)
+
+# 玩家进出: CONNECTED 名称 (ID) / DISCONNECTED 名称 (ID)
+CONNECTION_PATTERN = re.compile(r'^(?P<verb>DISCONNECTED|CONNECTED) (?P<name>.+) \((?P<player_id>[^()]*)\)\s*$')
+
+# 选阵营: TEAMSWITCH 名称 (原阵营 > 新阵营)
+TEAM_SWITCH_PATTERN = re.compile(r'^TEAMSWITCH (?P<name>.+) \((?P<from_team>[^()>]*?) > (?P<to_team>[^()]*)\)\s*$')
+
+# 比赛开始/结束: MATCH START 地图 / MATCH ENDED `地图` ALLIED (2 - 3) AXIS
+MATCH_START_PATTERN = re.compile(r'^MATCH START (?P<map_name>.*?)\s*$')
+MATCH_END_PATTERN = re.compile(
+    r'^MATCH ENDED\s+`?(?P<map_name>[^`]*?)`?\s+ALLIED \((?P<allied_score>\d+) - (?P<axis_score>\d+)\) AXIS'
+)
+
+_intern = sys.intern
+
+def parse_relative_time(relative: str) -> Optional[int]:
+    """
+    解析前缀中的相对时间（对局已进行的时间）
+
+    支持 "58 sec"、"2:58 min"、"1:02:03 hours" 等格式
+
+    Args:
+        relative: 相对时间文本
+
+    Returns:
+        Optional[int]: 秒数，无法解析时返回None
+    """
+    value, _, unit = relative.strip().partition(' ')
+    try:
+        parts = [float(part) for part in value.split(':')]
+    except ValueError:
+        return None
+
+    if len(parts) == 1:
+        multiplier = {'min': 60, 'hours': 3600, 'hour': 3600}.get(unit, 1)
+        return int(parts[0] * multiplier)
+
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + part
+    return int(seconds)
+
+class LogEvent:
+    """日志事件记录基类（也用于无法进一步解析的日志）"""
+
+    __slots__ = ('log_type', 'epoch', 'relative_seconds')
+
+    def __init__(self, log_type: LogType, epoch: Optional[int], relative_seconds: Optional[int]):
+        self.log_type = log_type
+        self.epoch = epoch
+        self.relative_seconds = relative_seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典（用于导出和调试）"""
+        result = {'log_type': self.log_type.name}
+        for cls in reversed(type(self).__mro__):
+            for name in getattr(cls, '__slots__', ()):
+                if name != 'log_type':
+                    result[name] = getattr(self, name)
+        return result
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{key}={value!r}" for key, value in self.to_dict().items())
+        return f"{type(self).__name__}({fields})"
+
+class KillEvent(LogEvent):
+    """击杀事件"""
+
+    __slots__ = ('killer', 'killer_team', 'killer_id', 'victim', 'victim_team', 'victim_id', 'weapon', 'teamkill')
+
+    def __init__(self, log_type, epoch, relative_seconds, killer: str, killer_team: str, killer_id: str,
+                 victim: str, victim_team: str, victim_id: str, weapon: str, teamkill: bool):
+        super().__init__(log_type, epoch, relative_seconds)
+        self.killer = killer
+        self.killer_team = killer_team
+        self.killer_id = killer_id
+        self.victim = victim
+        self.victim_team = victim_team
+        self.victim_id = victim_id
+        self.weapon = weapon
+        self.teamkill = teamkill
+
+class ChatEvent(LogEvent):
+    """聊天事件"""
+
+    __slots__ = ('channel', 'sender', 'sender_team', 'sender_id', 'text')
+
+    def __init__(self, log_type, epoch, relative_seconds, channel: str, sender: str, sender_team: str,
+                 sender_id: str, text: str):
+        super().__init__(log_type, epoch, relative_seconds)
+        self.channel = channel
+        self.sender = sender
+        self.sender_team = sender_team
+        self.sender_id = sender_id
+        self.text = text
+
+class ConnectionEvent(LogEvent):
+    """玩家连接/断开事件"""
+
+    __slots__ = ('connected', 'name', 'player_id')
+
+    def __init__(self, log_type, epoch, relative_seconds, connected: bool, name: str, player_id: str):
+        super().__init__(log_type, epoch, relative_seconds)
+        self.connected = connected
+        self.name = name
+        self.player_id = player_id
+
+class TeamSwitchEvent(LogEvent):
+    """选阵营事件"""
+
+    __slots__ = ('name', 'from_team', 'to_team')
+
+    def __init__(self, log_type, epoch, relative_seconds, name: str, from_team: str, to_team: str):
+        super().__init__(log_type, epoch, relative_seconds)
+        self.name = name
+        self.from_team = from_team
+        self.to_team = to_team
+
+class MatchEvent(LogEvent):
+    """比赛开始/结束事件"""
+
+    __slots__ = ('started', 'map_name', 'allied_score', 'axis_score')
+
+    def __init__(self, log_type, epoch, relative_seconds, started: bool, map_name: str,
+                 allied_score: Optional[int] = None, axis_score: Optional[int] = None):
+        super().__init__(log_type, epoch, relative_seconds)
+        self.started = started
+        self.map_name = map_name
+        self.allied_score = allied_score
+        self.axis_score = axis_score
+
+class LogParser:
+    """日志结构化解析器"""
+
+    def __init__(self, classifier: Optional[LogClassifier] = None):
+        """
+        初始化解析器
+
+        Args:
+            classifier: 日志分类器，应与分类存储使用同一个实例以保证分类规则一致
+        """
+        self.classifier = classifier if classifier is not None else LogClassifier()
+
+        # 统计信息
+        self.stats = {
+            'parsed': 0,      # 解析为具体事件类型
+            'unparsed': 0     # 只得到分类和时间
+        }
+
+    def parse_entry(self, log_entry: Dict[str, Any]) -> LogEvent:
+        """
+        解析日志条目
+
+        Args:
+            log_entry: 日志条目字典，包含message字段
+
+        Returns:
+            LogEvent: 事件记录
+        """
+        return self.parse(log_entry.get('message', ''))
+
+    def parse(self, message: str) -> LogEvent:
+        """
+        解析日志消息
+
+        分类结果与LogClassifier一致；消息格式与该类型的已知格式不符时返回LogEvent基类
+
+        Args:
+            message: 日志消息
+
+        Returns:
+            LogEvent: 事件记录
+        """
+        log_type = self.classifier.classify_message(message)
+
+        epoch = None
+        relative_seconds = None
+        body = message
+        prefix = PREFIX_PATTERN.match(message)
+        if prefix:
+            epoch = int(prefix.group('epoch'))
+            relative_seconds = parse_relative_time(prefix.group('relative'))
+            body = message[prefix.end():]
+
+        event = self._parse_body(log_type, epoch, relative_seconds, body)
+        if event is None:
+            self.stats['unparsed'] += 1
+            return LogEvent(log_type, epoch, relative_seconds)
+
+        self.stats['parsed'] += 1
+        return event
+
+    @staticmethod
+    def _parse_body(log_type: LogType, epoch: Optional[int], relative_seconds: Optional[int],
+                    body: str) -> Optional[LogEvent]:
+        """按分类结果解析前缀之后的内容，重复出现的名称、ID、阵营和武器会被驻留以共享内存"""
+        if log_type == LogType.KILL:
+            match = KILL_PATTERN.match(body)
+            if match:
+                return KillEvent(
+                    log_type, epoch, relative_seconds,
+                    killer=_intern(match.group('killer')),
+                    killer_team=_intern(match.group('killer_team')),
+                    killer_id=_intern(match.group('killer_id')),
+                    victim=_intern(match.group('victim')),
+                    victim_team=_intern(match.group('victim_team')),
+                    victim_id=_intern(match.group('victim_id')),
+                    weapon=_intern(match.group('weapon')),
+                    teamkill=match.group('team_kill') is not None
+                )
+
+        elif log_type == LogType.CHAT:
+            match = CHAT_PATTERN.match(body)
+            if match:
+                return ChatEvent(
+                    log_type, epoch, relative_seconds,
+                    channel=_intern(match.group('channel')),
+                    sender=_intern(match.group('sender')),
+                    sender_team=_intern(match.group('sender_team')),
+                    sender_id=_intern(match.group('sender_id')),
+                    text=match.group('text')
+                )
+
+        elif log_type == LogType.PLAYER_CONNECTION:
+            match = CONNECTION_PATTERN.match(body)
+            if match:
+                return ConnectionEvent(
+                    log_type, epoch, relative_seconds,
+                    connected=match.group('verb') == 'CONNECTED',
+                    name=_intern(match.group('name')),
+                    player_id=_intern(match.group('player_id'))
+                )
+
+        elif log_type == LogType.TEAM_SWITCH:
+            match = TEAM_SWITCH_PATTERN.match(body)
+            if match:
+                return TeamSwitchEvent(
+                    log_type, epoch, relative_seconds,
+                    name=_intern(match.group('name')),
+                    from_team=_intern(match.group('from_team')),
+                    to_team=_intern(match.group('to_team'))
+                )
+
+        elif log_type == LogType.MATCH_STATUS:
+            match = MATCH_START_PATTERN.match(body)
+            if match:
+                return MatchEvent(log_type, epoch, relative_seconds, started=True,
+                                  map_name=_intern(match.group('map_name')))
+            match = MATCH_END_PATTERN.match(body)
+            if match:
+                return MatchEvent(log_type, epoch, relative_seconds, started=False,
+                                  map_name=_intern(match.group('map_name')),
+                                  allied_score=int(match.group('allied_score')),
+                                  axis_score=int(match.group('axis_score')))
+
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取解析统计信息"""
+        return dict(self.stats)
+
+def main():
+    """测试解析器功能，并比较事件记录与原始日志字典的内存占用"""
+    import json
+    import tracemalloc
+
+    parser = LogParser()
+
+    test_logs = [
+        "[2:58 min (1761193883)] KILL: esc—5(Allies/76561198287323037) -> ICE Tea(Axis/76561199130443107) with M1 GARAND",
+        "[2:33 min (1761193907)] TEAM KILL: 於罔yu(Axis/9cd56a1d6578e8d911076b0933b3d1b6) -> World's End Dancehall(Axis/76561199244154157) with 150MM HOWITZER [sFH 18]",
+        "[2:47 min (1761193893)] CHAT[Team][mrgeorge06824(Axis/02339d3b7647c9bfd89cca2ce1fa9813)]: KKKKK",
+        "[2:49 min (1761193891)] CONNECTED 美术特长生 (76561199404917656)",
+        "[2:46 min (1761192274)] DISCONNECTED 晟循 (76561199887669374)",
+        "[2:55 min (1761193886)] TEAMSWITCH javito (None > Allies)",
+        "[1:02:03 hours (1761193900)] MATCH ENDED `CARENTAN Warfare` ALLIED (2 - 3) AXIS",
+        "[58 sec (1761193901)] KICK: [javito] has been kicked. [Idle]",
+    ]
+
+    print("=== 日志解析测试结果 ===")
+    for message in test_logs:
+        print(parser.parse(message))
+
+    # 内存占用比较：原始日志字典 vs 事件记录
+    count = 100000
+    messages = [test_logs[i % 6].replace("(17611", f"({i % 100}17611") for i in range(count)]
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    dicts = [{'timestamp': '2025-10-23T04:34:21.310Z', 'message': message,
+              'raw_data': {'timestamp': '2025-10-23T04:34:21.310Z', 'message': message}} for message in messages]
+    dict_bytes = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+
+    before = tracemalloc.take_snapshot()
+    events = [parser.parse(message) for message in messages]
+    event_bytes = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+    tracemalloc.stop()
+
+    print(f"\n=== 内存占用（{count}条，不含消息字符串本身） ===")
+    print(f"日志字典: {dict_bytes / count:.0f} 字节/条")
+    print(f"事件记录: {event_bytes / count:.0f} 字节/条")
+    print(json.dumps(parser.get_stats(), ensure_ascii=False))
+    del dicts, events
+
+if __name__ == "__main__":
+    main()
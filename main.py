@@ -6,14 +6,19 @@ Hell Let Loose 日志收集器主程序
 
 import os
 import sys
+import re
 import json
+import time
 import signal
 import logging
 import argparse
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from log_collector import LogCollector
+from async_log_collector import AsyncLogCollector
+from log_classifier import LogClassifier
+from segment_io import COMPRESSION_EXTENSIONS, available_compressions
 
 class HLLLogCollectorApp:
     """HLL日志收集器应用程序"""
@@ -107,6 +112,10 @@ class HLLLogCollectorApp:
                 if field not in server:
                     print(f"错误: 服务器 {i+1} 缺少必需字段: {field}")
                     return False
+            
+            if server.get("transport", "http") not in ("http", "rcon"):
+                print(f"错误: 服务器 {i+1} 的 transport 必须是 http 或 rcon")
+                return False
         
         # 检查日志设置
         log_settings = self.config.get("log_settings", {})
@@ -115,6 +124,33 @@ class HLLLogCollectorApp:
             print("错误: collection_interval 必须大于等于1秒")
             return False
         
+        if log_settings.get("adaptive_interval", False):
+            min_interval = log_settings.get("min_collection_interval", collection_interval)
+            max_interval = log_settings.get("max_collection_interval", 60)
+            if min_interval < 1 or max_interval < min_interval:
+                print("错误: 需要满足 1 <= min_collection_interval <= max_collection_interval")
+                return False
+        
+        if log_settings.get("collector_mode", "thread") not in ("thread", "asyncio"):
+            print("错误: collector_mode 必须是 thread 或 asyncio")
+            return False
+        
+        classifier_rules = log_settings.get("classifier_rules")
+        if classifier_rules is not None:
+            try:
+                LogClassifier(classifier_rules)
+            except (KeyError, ValueError, TypeError, re.error) as e:
+                print(f"错误: classifier_rules 无效: {e}")
+                return False
+        
+        if log_settings.get("seal_segments", False):
+            seal_compression = log_settings.get("seal_compression", "gzip")
+            if seal_compression not in COMPRESSION_EXTENSIONS:
+                print(f"错误: seal_compression 必须是 {', '.join(COMPRESSION_EXTENSIONS)} 之一")
+                return False
+            if seal_compression not in available_compressions():
+                print("警告: 未安装zstandard，seal_compression 将使用 gzip")
+        
         save_interval = log_settings.get("save_interval", 3600)
         if save_interval < 60:
             print("错误: save_interval 必须大于等于60秒")
@@ -129,7 +165,10 @@ class HLLLogCollectorApp:
             self.logger.info("启动HLL日志收集器")
             
             # 创建并启动收集器
-            self.collector = LogCollector(self.config)
+            if self.config.get("log_settings", {}).get("collector_mode", "thread") == "asyncio":
+                self.collector = AsyncLogCollector(self.config)
+            else:
+                self.collector = LogCollector(self.config)
             self.collector.start()
             
             # 显示启动信息
@@ -165,9 +204,16 @@ class HLLLogCollectorApp:
             print(f"  - {server['name']}: {server['host']}:{server['port']}")
         
         log_settings = self.config.get("log_settings", {})
-        print(f"收集间隔: {log_settings.get('collection_interval', 5)}秒")
+        print(f"收集模式: {log_settings.get('collector_mode', 'thread')}")
+        if log_settings.get("adaptive_interval", False):
+            print(f"收集间隔: 自适应 {log_settings.get('min_collection_interval', log_settings.get('collection_interval', 5))}"
+                  f"-{log_settings.get('max_collection_interval', 60)}秒")
+        else:
+            print(f"收集间隔: {log_settings.get('collection_interval', 5)}秒")
         print(f"保存间隔: {log_settings.get('save_interval', 3600)}秒")
         print(f"日志目录: {log_settings.get('logs_directory', 'logs')}")
+        if log_settings.get("seal_segments", False):
+            print(f"分段封存: {log_settings.get('seal_compression', 'gzip')}")
         print("="*60)
         print("按 Ctrl+C 停止程序")
         print("输入 'status' 查看状态，'stats' 查看统计信息，'help' 查看帮助")
@@ -219,7 +265,23 @@ class HLLLogCollectorApp:
         print("\n服务器连接状态:")
         for server_name, server_status in status["servers"].items():
             conn_status = "已连接" if server_status["connected"] else "未连接"
-            print(f"  {server_name}: {conn_status} ({server_status['host']}:{server_status['port']})")
+            print(f"  {server_name}: {conn_status} ({server_status['host']}:{server_status['port']})"
+                  f" 拉取间隔: {server_status['poll_interval']}秒")
+            client_stats = server_status.get("client", {})
+            if "status_probes_avoided" in client_stats:
+                print(f"    重新连接: {client_stats['reconnects']} 次, 省去状态查询: {client_stats['status_probes_avoided']} 次")
+            breaker = server_status.get("breaker")
+            if breaker and breaker["state"] != "closed":
+                print(f"    断路器: {breaker['state']}, {breaker['retry_in']}秒后重试, 已跳过 {breaker['short_circuited']} 次请求")
+            adaptive = server_status.get("adaptive_interval")
+            if adaptive:
+                print(f"    日志速率: {adaptive['event_rate']}/秒, 玩家: {adaptive['player_count']}, "
+                      f"比赛状态: {adaptive['match_state']}")
+        
+        for host, breaker in status.get("host_breakers", {}).items():
+            if breaker["state"] != "closed":
+                print(f"  API地址 {host}: 断路器 {breaker['state']}, {breaker['retry_in']}秒后重试, "
+                      f"已跳过 {breaker['short_circuited']} 次请求")
         
         print("\n缓存状态:")
         for server_name, cache_status in status["cache_status"].items():
@@ -228,6 +290,44 @@ class HLLLogCollectorApp:
             print(f"  {server_name}: {cached_logs} 条缓存日志")
             print(f"    当前日志文件: {log_file_info['log_count']} 条记录, {log_file_info['size']} 字节")
         
+        sealer = status.get("sealer")
+        if sealer:
+            print(f"\n分段封存: 已封存 {sealer['sealed_files']} 个文件 ({sealer['compression']}), "
+                  f"{sealer['bytes_before']} -> {sealer['bytes_after']} 字节")
+        
+        player_index = status.get("player_index")
+        if player_index:
+            print(f"玩家索引: {player_index['postings_added']} 个索引项, {player_index['lookups']} 次查询")
+        
+        chat_index = status.get("chat_index")
+        if chat_index:
+            print(f"聊天索引: {chat_index['indexed_messages']} 条消息, {chat_index['searches']} 次搜索")
+        
+        cache = status.get("cache")
+        if cache:
+            print(f"缓存: 内存 {cache['memory_entries']} 条 ({cache['memory_bytes'] / 1024 / 1024:.1f}MB, "
+                  f"压力 {cache['pressure']:.0%}), 溢出 {cache['spilled_entries']} 条, 丢弃 {cache['dropped_entries']} 条")
+        
+        writer = status.get("writer")
+        if writer:
+            print(f"写入管道: {writer['batches']} 批 {writer['entries_written']} 条 (平均 {writer['avg_batch_entries']} 条/批), "
+                  f"触发 按大小 {writer['flushes_by_size']} 次/按时间 {writer['flushes_by_age']} 次/强制 "
+                  f"{writer['flushes_forced']} 次, 失败 {writer['failed_flushes']} 次")
+            for sink_name, sink_stats in writer["sinks"].items():
+                print(f"  {sink_name}: {sink_stats['writes']} 次写入, {sink_stats['entries']} 条, "
+                      f"耗时 {sink_stats['seconds']}秒, 失败 {sink_stats['failures']} 次")
+        
+        for lock_name, lock_stats in status.get("locks", {}).items():
+            print(f"{lock_name}: {lock_stats['acquisitions']} 次获取, {lock_stats['contended']} 次等待 "
+                  f"(平均 {lock_stats['avg_wait_ms']}ms, 最长 {lock_stats['max_wait_ms']}ms), "
+                  f"最长持有 {lock_stats['max_hold_ms']}ms")
+        
+        wal = status.get("wal")
+        if wal:
+            print(f"预写日志: {wal['records']} 条记录, {wal['fsyncs']} 次fsync "
+                  f"(平均 {wal.get('avg_fsync_ms', 0)}ms, 最长 {wal['max_fsync_ms']}ms), "
+                  f"未同步 {wal['unsynced_records']} 条, 重放 {wal['replayed_records']} 条")
+        
         print("-"*40 + "\n")
     
     def _show_statistics(self):
@@ -254,6 +354,12 @@ class HLLLogCollectorApp:
             if server_stats["date_range"]["start"]:
                 print(f"    日期范围: {server_stats['date_range']['start']} ~ {server_stats['date_range']['end']}")
         
+        categories = stats.get("categories")
+        if categories:
+            print("\n分类统计（所有服务器）:")
+            for log_type, count in categories["today"]["total"].items():
+                print(f"  {log_type}: 今天 {count} 条, 最近7天 {categories['last_7_days']['total'][log_type]} 条")
+        
         print("-"*40 + "\n")
     
     def _force_save(self):
@@ -289,6 +395,92 @@ class HLLLogCollectorApp:
         except KeyboardInterrupt:
             print("操作已取消")
     
+    def rebuild_aggregates(self):
+        """从原始日志重新生成分类聚合统计（收集器停止时运行）"""
+        from aggregate_store import AggregateStore
+        from log_classifier import LogClassifier
+        
+        log_settings = self.config.get("log_settings", {})
+        store = AggregateStore(log_settings.get("logs_directory", "logs"))
+        classifier = LogClassifier(log_settings.get("classifier_rules"))
+        server_names = [server["name"] for server in self.config.get("servers", []) if server.get("name")] or None
+        
+        print("正在从原始日志重新生成聚合统计...")
+        start_time = time.time()
+        rebuilt = store.rebuild(server_names, classifier)
+        for server_name, count in rebuilt.items():
+            print(f"  {server_name}: {count} 条日志")
+        print(f"完成，用时 {time.time() - start_time:.1f} 秒")
+    
+    def rebuild_player_index(self):
+        """从原始日志重新生成玩家索引（收集器停止时运行）"""
+        from player_index import PlayerIndex
+        
+        index = PlayerIndex(self.config.get("log_settings", {}).get("logs_directory", "logs"))
+        server_names = [server["name"] for server in self.config.get("servers", []) if server.get("name")] or None
+        
+        print("正在从原始日志重新生成玩家索引...")
+        start_time = time.time()
+        rebuilt = index.rebuild(server_names)
+        index.close()
+        for server_name, count in rebuilt.items():
+            print(f"  {server_name}: {count} 个索引项")
+        print(f"完成，用时 {time.time() - start_time:.1f} 秒")
+    
+    def find_player(self, player_id: str, days: int = 7, server_name: str = None):
+        """输出玩家最近几天的击杀、聊天和进出日志"""
+        from player_index import PlayerIndex
+        
+        index = PlayerIndex(self.config.get("log_settings", {}).get("logs_directory", "logs"))
+        server_names = [server_name] if server_name else [
+            server["name"] for server in self.config.get("servers", []) if server.get("name")
+        ]
+        end = datetime.now()
+        start = end - timedelta(days=days)
+        
+        found = 0
+        for name in server_names:
+            for log in index.lookup(name, player_id, start, end):
+                print(f"[{name}] {log.get('message', '')}")
+                found += 1
+        index.close()
+        print(f"共 {found} 条日志（最近 {days} 天）")
+    
+    def rebuild_chat_index(self):
+        """从聊天日志重新生成聊天索引（收集器停止时运行）"""
+        from chat_index import ChatIndex
+        
+        index = ChatIndex(self.config.get("log_settings", {}).get("logs_directory", "logs"))
+        server_names = [server["name"] for server in self.config.get("servers", []) if server.get("name")] or None
+        
+        print("正在从聊天日志重新生成聊天索引...")
+        start_time = time.time()
+        rebuilt = index.rebuild(server_names)
+        index.close()
+        for server_name, count in rebuilt.items():
+            print(f"  {server_name}: {count} 条消息")
+        print(f"完成，用时 {time.time() - start_time:.1f} 秒")
+    
+    def search_chat(self, query: str, days: int = 7, server_name: str = None, channel: str = None,
+                    player: str = None, limit: int = 100):
+        """输出最近几天匹配的聊天消息（按时间倒序）"""
+        from chat_index import ChatIndex
+        
+        index = ChatIndex(self.config.get("log_settings", {}).get("logs_directory", "logs"))
+        server_names = [server_name] if server_name else [
+            server["name"] for server in self.config.get("servers", []) if server.get("name")
+        ]
+        end = datetime.now()
+        
+        start_time = time.time()
+        messages = index.search(server_names, query, end - timedelta(days=days), end, channel, player, limit)
+        elapsed = time.time() - start_time
+        index.close()
+        for message in messages:
+            print(f"[{message['server']}] {message['time']} [{message['channel']}] "
+                  f"{message['sender']}({message['sender_id']}): {message['text']}")
+        print(f"共 {len(messages)} 条消息（最近 {days} 天，用时 {elapsed * 1000:.0f} 毫秒）")
+    
     def _show_help(self):
         """显示帮助信息"""
         print("\n" + "-"*40)
@@ -307,9 +499,35 @@ def main():
     parser = argparse.ArgumentParser(description="Hell Let Loose 日志收集器")
     parser.add_argument("-c", "--config", default="config.json", help="配置文件路径")
     parser.add_argument("--test", action="store_true", help="测试配置并退出")
+    parser.add_argument("--measure-cache", type=int, nargs="?", const=100000, metavar="N",
+                        help="测量缓存中每条日志占用的内存（默认10万条）并退出")
+    parser.add_argument("--rebuild-aggregates", action="store_true",
+                        help="从原始日志重新生成分类聚合统计并退出")
+    parser.add_argument("--rebuild-player-index", action="store_true",
+                        help="从原始日志重新生成玩家索引并退出")
+    parser.add_argument("--player", metavar="PLAYER_ID",
+                        help="输出玩家（Steam ID或EOS ID）相关的日志并退出")
+    parser.add_argument("--rebuild-chat-index", action="store_true",
+                        help="从聊天日志重新生成聊天索引并退出")
+    parser.add_argument("--search", metavar="QUERY",
+                        help='搜索聊天消息并退出，引号中的内容按短语匹配，例如 --search \'"gg wp"\'')
+    parser.add_argument("--channel", help="--search 只搜索指定频道（Team、Unit或All）")
+    parser.add_argument("--sender", help="--search 只搜索指定玩家（ID或名称）发送的消息")
+    parser.add_argument("--limit", type=int, default=100, help="--search 最多输出的消息数量（默认100）")
+    parser.add_argument("--days", type=int, default=7, help="--player/--search 查询最近几天的日志（默认7天）")
+    parser.add_argument("--server", help="--player/--search 只查询指定的服务器")
     
     args = parser.parse_args()
     
+    # 内存测量模式不需要配置文件
+    if args.measure_cache:
+        from log_entry import measure_entry_memory
+        result = measure_entry_memory(args.measure_cache)
+        print(f"缓存日志条目内存占用（{result['entries']} 条）:")
+        print(f"  原格式（嵌套字典）: {result['dict_bytes_per_entry']} 字节/条")
+        print(f"  紧凑格式（LogEntry）: {result['compact_bytes_per_entry']} 字节/条")
+        sys.exit(0)
+    
     # 创建应用程序实例
     app = HLLLogCollectorApp(args.config)
     
@@ -330,6 +548,26 @@ def main():
             print("配置测试通过")
             sys.exit(0)
         
+        if args.rebuild_aggregates:
+            app.rebuild_aggregates()
+            sys.exit(0)
+        
+        if args.rebuild_player_index:
+            app.rebuild_player_index()
+            sys.exit(0)
+        
+        if args.player:
+            app.find_player(args.player, args.days, args.server)
+            sys.exit(0)
+        
+        if args.rebuild_chat_index:
+            app.rebuild_chat_index()
+            sys.exit(0)
+        
+        if args.search is not None:
+            app.search_chat(args.search, args.days, args.server, args.channel, args.sender, args.limit)
+            sys.exit(0)
+        
         # 启动应用程序
         app.start()
         
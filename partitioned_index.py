@@ -0,0 +1,190 @@
+"""
+按日期分区的SQLite索引
+玩家索引和聊天索引共用的分区管理：每个服务器每天一个SQLite文件，最多同时打开max_open_partitions个连接
+（按最近使用顺序关闭），修改过的分区在flush时提交，清理旧日志时按日期删除整个分区:
+    logs/server1/<索引目录>/2025-10-23.sqlite
+
+子类只需定义索引目录、表结构、写入和查询，以及从日志分段重新生成一个服务器的索引
+"""
+
+import os
+import shutil
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional, Iterable, Tuple
+
+from log_parser import LogParser, LogEvent
+
+PARTITION_EXTENSION = ".sqlite"
+
+class PartitionedIndex:
+    """
+    按日期分区的SQLite索引基类（线程安全，所有分区操作都持有self.lock）
+    """
+
+    # 子类定义：服务器目录下的索引目录、每个分区的表结构、日志中使用的索引名称和索引项单位
+    INDEX_DIRECTORY = ""
+    SCHEMA = ""
+    INDEX_NAME = "索引"
+    ITEM_UNIT = "个索引项"
+
+    def __init__(self, logs_directory: str = "logs", parser: Optional[LogParser] = None,
+                 max_open_partitions: int = 16):
+        """
+        初始化索引
+
+        Args:
+            logs_directory: 日志基础目录
+            parser: 没有预先解析事件记录的日志使用的解析器，默认在需要时创建
+            max_open_partitions: 最多同时打开的分区数量
+        """
+        self.logs_directory = str(logs_directory)
+        self.parser = parser
+        self.max_open_partitions = max(1, max_open_partitions)
+        self.lock = threading.RLock()
+        self.logger = logging.getLogger(type(self).__name__)
+
+        # (服务器, 日期) -> 数据库连接，按最近使用顺序排列
+        self._partitions: "OrderedDict[Tuple[str, str], sqlite3.Connection]" = OrderedDict()
+        self._dirty: set = set()
+
+        # 统计信息（子类添加自己的计数）
+        self.stats = {
+            'dropped_partitions': 0
+        }
+
+    def _partition_path(self, server_name: str, date: str) -> str:
+        return os.path.join(self.logs_directory, server_name, self.INDEX_DIRECTORY, date + PARTITION_EXTENSION)
+
+    def _partition(self, server_name: str, date: str, create: bool) -> Optional[sqlite3.Connection]:
+        """获取分区的数据库连接，create为False且分区不存在时返回None"""
+        key = (server_name, date)
+        connection = self._partitions.get(key)
+        if connection is not None:
+            self._partitions.move_to_end(key)
+            return connection
+
+        partition_path = self._partition_path(server_name, date)
+        if not create and not os.path.exists(partition_path):
+            return None
+        os.makedirs(os.path.dirname(partition_path), exist_ok=True)
+
+        while len(self._partitions) >= self.max_open_partitions:
+            self._close_partition(next(iter(self._partitions)))
+
+        connection = sqlite3.connect(partition_path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(self.SCHEMA)
+        self._partitions[key] = connection
+        return connection
+
+    def _close_partition(self, key: Tuple[str, str]):
+        connection = self._partitions.pop(key, None)
+        if connection is None:
+            return
+        try:
+            if key in self._dirty:
+                connection.commit()
+            connection.close()
+        except sqlite3.Error as e:
+            self.logger.error(f"关闭{self.INDEX_NAME}分区失败 {key}: {e}")
+        self._dirty.discard(key)
+
+    def _event(self, entry: Dict[str, Any]) -> LogEvent:
+        """获取日志条目的事件记录，没有预先解析的日志在这里解析"""
+        event = entry.get('event')
+        if event is None:
+            if self.parser is None:
+                self.parser = LogParser()
+            event = self.parser.parse_entry(entry)
+        return event
+
+    def flush(self):
+        """提交修改过的分区"""
+        with self.lock:
+            for key in sorted(self._dirty):
+                connection = self._partitions.get(key)
+                if connection is not None:
+                    connection.commit()
+            self._dirty.clear()
+
+    def drop_before(self, server_name: str, cutoff: datetime) -> int:
+        """
+        删除早于指定日期的分区（清理旧日志时调用）
+
+        Args:
+            server_name: 服务器名称
+            cutoff: 保留该日期及之后的分区
+
+        Returns:
+            int: 删除的分区数量
+        """
+        index_dir = os.path.join(self.logs_directory, server_name, self.INDEX_DIRECTORY)
+        if not os.path.isdir(index_dir):
+            return 0
+        cutoff_date = cutoff.date().isoformat()
+        dropped = 0
+        with self.lock:
+            for entry in os.scandir(index_dir):
+                date = entry.name.split('.')[0]
+                if not entry.name.endswith(PARTITION_EXTENSION) or date >= cutoff_date:
+                    continue
+                self._close_partition((server_name, date))
+                for suffix in ("", "-wal", "-shm"):
+                    try:
+                        os.remove(entry.path + suffix)
+                    except FileNotFoundError:
+                        pass
+                dropped += 1
+        self.stats['dropped_partitions'] += dropped
+        return dropped
+
+    def rebuild(self, server_names: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        删除索引后从日志分段（包括已封存的文件）重新生成，应在收集器停止时运行
+
+        Args:
+            server_names: 要重新生成的服务器，默认为日志目录下的所有服务器
+
+        Returns:
+            Dict[str, int]: 服务器 -> 重新生成的索引项数量（由子类的_rebuild_server决定）
+        """
+        if server_names is None:
+            server_names = sorted(
+                entry.name for entry in os.scandir(self.logs_directory)
+                if entry.is_dir() and not entry.name.startswith('.')
+            ) if os.path.isdir(self.logs_directory) else []
+
+        rebuilt = {}
+        with self.lock:
+            for server_name in server_names:
+                for key in [key for key in self._partitions if key[0] == server_name]:
+                    self._close_partition(key)
+                shutil.rmtree(os.path.join(self.logs_directory, server_name, self.INDEX_DIRECTORY), ignore_errors=True)
+
+                rebuilt[server_name] = self._rebuild_server(server_name)
+                self.flush()
+                self.logger.info(f"重新生成了 {server_name} 的{self.INDEX_NAME}，共 {rebuilt[server_name]} {self.ITEM_UNIT}")
+        return rebuilt
+
+    def _rebuild_server(self, server_name: str) -> int:
+        """从日志分段写入一个服务器的索引（调用时持有self.lock，旧索引已删除），返回索引项数量"""
+        raise NotImplementedError
+
+    def close(self):
+        """提交并关闭所有分区"""
+        with self.lock:
+            for key in list(self._partitions):
+                self._close_partition(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取索引统计信息"""
+        with self.lock:
+            return {
+                **self.stats,
+                'open_partitions': len(self._partitions)
+            }
@@ -0,0 +1,310 @@
+"""
+玩家索引
+保存原始日志时，把击杀、聊天和进出日志中出现的玩家ID（Steam ID或EOS十六进制ID）
+写入倒排索引：玩家ID -> (分段, 位置)。查询某个玩家的所有事件时只读取索引指向的日志行，
+不需要扫描整段时间的日志文件。
+
+索引按日期分区，每个服务器每天一个SQLite文件，清理旧日志时按日期删除整个分区:
+    logs/server1/.players/2025-10-23.sqlite
+
+位置的含义取决于分段格式：
+- jsonl: 日志行在分段中的字节偏移量和长度（已封存的分段按解压后的内容计算）
+- json: 日志在分段数组中的下标，长度为0
+"""
+
+import os
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+
+from log_classifier import get_event_epoch
+from log_parser import LogParser, LogEvent, KillEvent, ChatEvent, ConnectionEvent
+from partitioned_index import PartitionedIndex
+from segment_io import segment_files, read_segment, open_segment, unsealed_path
+from segment_manifest import list_segments
+
+PLAYER_INDEX_DIRECTORY = ".players"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS postings (
+    player_id TEXT NOT NULL,
+    epoch INTEGER NOT NULL,
+    segment_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    PRIMARY KEY (player_id, epoch, segment_id, position)
+) WITHOUT ROWID;
+"""
+
+def event_player_ids(event: LogEvent) -> Tuple[str, ...]:
+    """
+    获取事件中出现的玩家ID
+
+    Args:
+        event: 解析后的事件记录
+
+    Returns:
+        Tuple[str, ...]: 玩家ID（去掉空值和"None"）
+    """
+    if isinstance(event, KillEvent):
+        ids = (event.killer_id, event.victim_id)
+    elif isinstance(event, ChatEvent):
+        ids = (event.sender_id,)
+    elif isinstance(event, ConnectionEvent):
+        ids = (event.player_id,)
+    else:
+        return ()
+    return tuple(player_id for player_id in ids if player_id and player_id != "None")
+
+class PlayerIndex(PartitionedIndex):
+    """
+    按日期分区的玩家倒排索引
+
+    写入原始日志后调用record_append添加索引项，flush时提交；
+    lookup按时间顺序返回玩家相关的日志条目
+    """
+
+    INDEX_DIRECTORY = PLAYER_INDEX_DIRECTORY
+    SCHEMA = _SCHEMA
+    INDEX_NAME = "玩家索引"
+
+    def __init__(self, logs_directory: str = "logs", parser: Optional[LogParser] = None,
+                 max_open_partitions: int = 16):
+        """
+        初始化玩家索引
+
+        Args:
+            logs_directory: 日志基础目录
+            parser: 没有预先解析事件记录的日志使用的解析器，默认在需要时创建
+            max_open_partitions: 最多同时打开的分区数量
+        """
+        super().__init__(logs_directory, parser, max_open_partitions)
+        # 已封存部分的长度缓存: 分段路径 -> (封存文件状态, 长度)
+        self._sealed_lengths: Dict[str, Tuple[Tuple, int]] = {}
+        self.stats.update({
+            'postings_added': 0,
+            'lookups': 0,
+            'entries_read': 0
+        })
+
+    def _sealed_length(self, segment_path: str, storage_format: str) -> int:
+        """
+        分段已封存部分的长度：jsonl为解压后的字节数，json为日志条数
+
+        封存后又写入迟到日志时，新日志位于未压缩文件中，位置需要加上这个长度
+        """
+        sealed_paths = [path for path in segment_files(segment_path) if path != segment_path]
+        if not sealed_paths:
+            return 0
+        states = tuple((path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in sealed_paths)
+        cached = self._sealed_lengths.get(segment_path)
+        if cached is not None and cached[0] == states:
+            return cached[1]
+
+        length = 0
+        for path in sealed_paths:
+            if storage_format == "jsonl":
+                with open_segment(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        length += len(chunk)
+            else:
+                length += len(read_segment(path))
+        if len(self._sealed_lengths) >= 256:
+            self._sealed_lengths.clear()
+        self._sealed_lengths[segment_path] = (states, length)
+        return length
+
+    def record_append(self, server_name: str, segment_path: str, entries: List[Dict[str, Any]],
+                      positions: List[Tuple[int, int]], default_epoch: Optional[float] = None):
+        """
+        记录写入分段的新日志（调用flush后提交）
+
+        Args:
+            server_name: 服务器名称
+            segment_path: 分段文件路径（未压缩时的路径）
+            entries: 新写入的日志条目
+            positions: 每条日志在未压缩文件中的位置，jsonl为(字节偏移量, 长度)，json为(数组下标, 0)
+            default_epoch: 无法确定事件时间时使用的时间
+        """
+        segment_path = unsealed_path(str(segment_path))
+        storage_format = "jsonl" if segment_path.endswith(".jsonl") else "json"
+        rows = []
+        with self.lock:
+            base = self._sealed_length(segment_path, storage_format)
+            for entry, (position, length) in zip(entries, positions):
+                player_ids = event_player_ids(self._event(entry))
+                if not player_ids:
+                    continue
+                epoch = get_event_epoch(entry)
+                epoch = int(epoch if epoch is not None else default_epoch or 0)
+                rows.extend((player_id, epoch, base + position, length) for player_id in player_ids)
+            if rows:
+                self._insert(server_name, segment_path, rows)
+
+    def _insert(self, server_name: str, segment_path: str, rows: List[Tuple[str, int, int, int]]):
+        date = _segment_date(segment_path)
+        connection = self._partition(server_name, date, create=True)
+        name = os.path.basename(segment_path)
+        connection.execute("INSERT OR IGNORE INTO segments (name) VALUES (?)", (name,))
+        segment_id = connection.execute("SELECT id FROM segments WHERE name = ?", (name,)).fetchone()[0]
+        connection.executemany(
+            "INSERT OR IGNORE INTO postings (player_id, epoch, segment_id, position, length) VALUES (?, ?, ?, ?, ?)",
+            [(player_id, epoch, segment_id, position, length) for player_id, epoch, position, length in rows]
+        )
+        self._dirty.add((server_name, date))
+        self.stats['postings_added'] += len(rows)
+
+    def reset_segment(self, server_name: str, segment_path: str):
+        """分段文件被重新创建（例如原文件损坏）时删除其未封存部分的索引项"""
+        segment_path = unsealed_path(str(segment_path))
+        storage_format = "jsonl" if segment_path.endswith(".jsonl") else "json"
+        with self.lock:
+            connection = self._partition(server_name, _segment_date(segment_path), create=False)
+            if connection is None:
+                return
+            base = self._sealed_length(segment_path, storage_format)
+            connection.execute(
+                "DELETE FROM postings WHERE position >= ? AND segment_id IN (SELECT id FROM segments WHERE name = ?)",
+                (base, os.path.basename(segment_path))
+            )
+            self._dirty.add((server_name, _segment_date(segment_path)))
+
+    def lookup(self, server_name: str, player_id: str, start: datetime, end: datetime) -> Iterator[Dict[str, Any]]:
+        """
+        按时间顺序读取玩家在时间范围内的所有事件，只打开索引指向的分段
+
+        Args:
+            server_name: 服务器名称
+            player_id: 玩家ID（Steam ID或EOS ID）
+            start: 开始时间
+            end: 结束时间
+
+        Yields:
+            Dict: 日志条目
+        """
+        start_epoch = int(start.timestamp())
+        end_epoch = int(end.timestamp())
+        self.stats['lookups'] += 1
+
+        # 分区按分段所在的日期划分，事件时间与分段时间可能相差一小时
+        day = (start - timedelta(days=1)).date()
+        while day <= end.date():
+            date = day.isoformat()
+            day += timedelta(days=1)
+            with self.lock:
+                connection = self._partition(server_name, date, create=False)
+                if connection is None:
+                    continue
+                rows = connection.execute(
+                    "SELECT p.epoch, s.name, p.position, p.length FROM postings p JOIN segments s ON s.id = p.segment_id"
+                    " WHERE p.player_id = ? AND p.epoch BETWEEN ? AND ? ORDER BY p.epoch, s.name, p.position",
+                    (player_id, start_epoch, end_epoch)
+                ).fetchall()
+            if not rows:
+                continue
+
+            day_dir = self._day_directory(server_name, date)
+            by_segment: Dict[str, List[Tuple[int, int]]] = OrderedDict()
+            for _, name, position, length in rows:
+                locations = by_segment.setdefault(name, [])
+                if not locations or locations[-1] != (position, length):
+                    locations.append((position, length))
+
+            found = []
+            for name, locations in by_segment.items():
+                for entry in self._read_locations(os.path.join(day_dir, name), locations):
+                    found.append(entry)
+            self.stats['entries_read'] += len(found)
+            found.sort(key=lambda entry: get_event_epoch(entry) or 0)
+            yield from found
+
+    def _day_directory(self, server_name: str, date: str) -> str:
+        """日期对应的日志目录: logs/server1/25_10/23"""
+        year, month, day = date.split('-')
+        return os.path.join(self.logs_directory, server_name, f"{year[2:]}_{month}", day)
+
+    def _read_locations(self, segment_path: str, locations: List[Tuple[int, int]]) -> Iterator[Dict[str, Any]]:
+        """读取分段中指定位置的日志，依次读取已封存部分和未压缩部分"""
+        locations = sorted(set(locations))
+        if segment_path.endswith(".json"):
+            entries = []
+            for file_path in segment_files(segment_path):
+                try:
+                    entries.extend(read_segment(file_path))
+                except Exception as e:
+                    self.logger.error(f"读取分段失败 {file_path}: {e}")
+            for position, _ in locations:
+                if position < len(entries):
+                    yield entries[position]
+            return
+
+        base = 0
+        pending = iter(locations)
+        location = next(pending, None)
+        for file_path in segment_files(segment_path):
+            with open_segment(file_path, 'rb') as f:
+                while location is not None:
+                    position, length = location
+                    f.seek(position - base)
+                    data = f.read(length)
+                    if len(data) < length:
+                        # 位置不在这个文件中，f.tell()为文件内容的长度
+                        break
+                    try:
+                        yield json.loads(data)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        self.logger.warning(f"玩家索引指向的位置不是完整的日志行 {segment_path}:{position}")
+                    location = next(pending, None)
+                if location is None:
+                    return
+                # 压缩文件越过末尾的seek停在末尾，f.tell()即为解压后的长度
+                base += f.seek(0, os.SEEK_END) if file_path == segment_path else f.tell()
+
+    def _rebuild_server(self, server_name: str) -> int:
+        """从原始日志分段（hll_logs_*，包括已封存的文件）重新生成索引，返回索引项数量"""
+        before = self.stats['postings_added']
+        server_dir = os.path.join(self.logs_directory, server_name)
+        for segment_path, segment_hour in list_segments(server_dir, ("hll_logs",)):
+            entries, positions = self._read_positions(segment_path)
+            rows = []
+            for entry, (position, length) in zip(entries, positions):
+                epoch = get_event_epoch(entry)
+                epoch = int(epoch if epoch is not None else segment_hour.timestamp())
+                rows.extend((player_id, epoch, position, length)
+                            for player_id in event_player_ids(self._event(entry)))
+            if rows:
+                self._insert(server_name, segment_path, rows)
+        return self.stats['postings_added'] - before
+
+    def _read_positions(self, segment_path: str) -> Tuple[List[Dict[str, Any]], List[Tuple[int, int]]]:
+        """读取分段的所有日志及其位置（与写入时的计算方式一致）"""
+        entries, positions = [], []
+        if segment_path.endswith(".json"):
+            for file_path in segment_files(segment_path):
+                try:
+                    entries.extend(read_segment(file_path))
+                except Exception as e:
+                    self.logger.error(f"读取分段失败 {file_path}: {e}")
+            return entries, [(index, 0) for index in range(len(entries))]
+
+        base = 0
+        for file_path in segment_files(segment_path):
+            with open_segment(file_path, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        try:
+                            entries.append(json.loads(line))
+                            positions.append((base, len(line)))
+                        except (json.JSONDecodeError, UnicodeDecodeError):
+                            pass
+                    base += len(line)
+        return entries, positions
+
+def _segment_date(segment_path: str) -> str:
+    """分段文件名中的日期: hll_logs_2025-10-23_12.jsonl -> 2025-10-23"""
+    return os.path.basename(segment_path).rsplit('_', 2)[-2]
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+本地模拟RCON V2服务器
+实现ServerConnect、Login、GetAdminLog和ServerInformation命令，用于在没有游戏服务器时测试原生RCON客户端
+
+数据包格式和XOR加密按协议文档（HLL_RCON_API_中文文档.md）单独实现，不复用客户端的代码，
+客户端的编码错误不会被同样错误的服务器掩盖
+"""
+
+import os
+import json
+import time
+import struct
+import random
+import operator
+import itertools
+import base64
+import asyncio
+import logging
+from typing import Optional, Dict, Any, List
+
+# 数据包头部：请求ID（4字节）+ 内容长度（4字节），小端无符号整数
+FRAME_HEADER = struct.Struct('<II')
+
+PROTOCOL_VERSION = 2
+
+def xor_bytes(data: bytes, key: bytes) -> bytes:
+    """
+    按协议文档的XORCipher逐字节加密/解密: bytes[i] ^= key[i % len(key)]
+
+    Args:
+        data: 原始数据
+        key: XOR密钥
+
+    Returns:
+        bytes: 处理后的数据
+    """
+    if not key:
+        return data
+    return bytes(map(operator.xor, data, itertools.cycle(key)))
+
+class FakeRconServer:
+    """模拟RCON V2服务器"""
+
+    def __init__(self, password: str, logs: List[Dict[str, Any]] = None,
+                 players: List[Dict[str, Any]] = None, host: str = "127.0.0.1", port: int = 0,
+                 response_delay: float = 0):
+        """
+        初始化模拟服务器
+
+        Args:
+            password: RCON密码
+            logs: 管理员日志条目，每条包含timestamp和message；默认生成示例日志
+            players: 玩家列表
+            host: 监听地址
+            port: 监听端口，0表示随机端口
+            response_delay: 每个命令的最大随机响应延迟（秒），大于0时响应可能乱序返回
+        """
+        self.password = password
+        self.logs = logs if logs is not None else self._sample_logs()
+        self.players = players if players is not None else [
+            {"name": "John Doe", "iD": "76561197960287930", "platform": "steam"}
+        ]
+        self.host = host
+        self.port = port
+        self.response_delay = response_delay
+        self.xor_key = os.urandom(16)
+        self.tokens = set()
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.writers = set()
+        self.logger = logging.getLogger("FakeRconServer")
+
+        # 收到的命令（读取到请求时记录，不论是否响应），便于测试时检查
+        self.received_commands: List[str] = []
+
+    @staticmethod
+    def _sample_logs() -> List[Dict[str, Any]]:
+        """生成示例日志"""
+        now = int(time.time())
+        return [
+            {"timestamp": "2025-10-23T04:34:21.310Z",
+             "message": f"[2:58 min ({now - 30})] KILL: esc—5(Allies/76561198287323037) -> ICE Tea(Axis/76561199130443107) with M1 GARAND"},
+            {"timestamp": "2025-10-23T04:34:21.310Z",
+             "message": f"[2:47 min ({now - 20})] CHAT[Team][mrgeorge06824(Axis/02339d3b7647c9bfd89cca2ce1fa9813)]: KKKKK"},
+            {"timestamp": "2025-10-23T04:34:21.310Z",
+             "message": f"[2:49 min ({now - 10})] CONNECTED 美术特长生 (76561199404917656)"},
+        ]
+
+    async def start(self) -> int:
+        """
+        启动服务器
+
+        Returns:
+            int: 实际监听的端口
+        """
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.logger.info(f"模拟RCON服务器监听 {self.host}:{self.port}")
+        return self.port
+
+    async def stop(self):
+        """停止服务器"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    def drop_connections(self):
+        """断开所有客户端连接（用于测试客户端自动重连）"""
+        for writer in list(self.writers):
+            writer.close()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个客户端连接，每个命令在独立任务中处理，响应可能乱序返回"""
+        self.writers.add(writer)
+        write_lock = asyncio.Lock()
+        tasks = set()
+        encrypted = False
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                request_id, length = FRAME_HEADER.unpack(header)
+                body = await reader.readexactly(length)
+                if encrypted:
+                    body = xor_bytes(body, self.xor_key)
+
+                request = json.loads(body.decode('utf-8'))
+                self.received_commands.append(request.get("Name", ""))
+                if request.get("Name") == "ServerConnect":
+                    # 握手必须按顺序处理，之后的通信都需要加密
+                    await self._respond(writer, write_lock, request_id, request)
+                    encrypted = True
+                    continue
+
+                task = asyncio.ensure_future(self._respond(writer, write_lock, request_id, request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.writers.discard(writer)
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, write_lock: asyncio.Lock,
+                       request_id: int, request: Dict[str, Any]):
+        """处理命令并写回响应"""
+        name = request.get("Name")
+        if self.response_delay > 0 and name not in ("ServerConnect", "Login"):
+            await asyncio.sleep(random.uniform(0, self.response_delay))
+
+        response = json.dumps(self._dispatch(request), ensure_ascii=False).encode('utf-8')
+        if name != "ServerConnect":
+            response = xor_bytes(response, self.xor_key)
+
+        async with write_lock:
+            writer.write(FRAME_HEADER.pack(request_id, len(response)) + response)
+            await writer.drain()
+
+    def _dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """根据命令名称生成响应"""
+        name = request.get("Name", "")
+        content = request.get("ContentBody", "")
+
+        if name == "ServerConnect":
+            return self._response(name, base64.b64encode(self.xor_key).decode('ascii'))
+
+        if name == "Login":
+            if content != self.password:
+                return self._response(name, "", 401, "Invalid password")
+            token = base64.b16encode(os.urandom(16)).decode('ascii')
+            self.tokens.add(token)
+            return self._response(name, token)
+
+        if request.get("AuthToken") not in self.tokens:
+            return self._response(name, "", 401, "Unauthorized")
+
+        params = json.loads(content) if isinstance(content, str) and content else (content or {})
+
+        if name == "GetAdminLog":
+            cutoff = time.time() - int(params.get("LogBackTrackTime", 0))
+            entries = [entry for entry in self.logs if self._entry_epoch(entry) >= cutoff]
+            return self._response(name, json.dumps({"entries": entries}, ensure_ascii=False))
+
+        if name == "ServerInformation":
+            if params.get("Name") == "players":
+                return self._response(name, json.dumps({"players": self.players}, ensure_ascii=False))
+            if params.get("Name") == "session":
+                return self._response(name, json.dumps({"playerCount": len(self.players)}))
+            return self._response(name, "", 400, "Unknown information type")
+
+        return self._response(name, "", 400, "Invalid command")
+
+    @staticmethod
+    def _entry_epoch(entry: Dict[str, Any]) -> int:
+        """读取示例日志前缀中的事件时间"""
+        message = entry.get("message", "")
+        try:
+            return int(message[message.index("(") + 1:message.index(")")])
+        except ValueError:
+            return 0
+
+    @staticmethod
+    def _response(name: str, content_body: str, status_code: int = 200,
+                  status_message: str = "Successfully performed request.") -> Dict[str, Any]:
+        """构建响应"""
+        return {
+            "statusCode": status_code,
+            "statusMessage": status_message,
+            "version": PROTOCOL_VERSION,
+            "name": name,
+            "contentBody": content_body
+        }
+
+async def _main(port: int, password: str):
+    server = FakeRconServer(password=password, port=port)
+    await server.start()
+    print(f"模拟RCON服务器已启动: 127.0.0.1:{server.port}，密码: {password}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地模拟RCON V2服务器")
+    parser.add_argument("--port", type=int, default=20300, help="监听端口")
+    parser.add_argument("--password", default="test", help="RCON密码")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_main(args.port, args.password))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,467 @@
+"""
+日志分段文件读写工具
+支持两种存储格式：
+- json: 整个文件是一个JSON数组，每次保存重写整个文件
+- jsonl: 每行一条JSON记录（JSON Lines），每次保存只追加新记录
+已封存的分段在文件名后追加压缩扩展名（.gz、.xz或.zst），读取时自动解压
+"""
+
+import io
+import os
+import gzip
+import lzma
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Iterator, Iterable, Optional, Tuple, Hashable
+
+from log_classifier import get_event_epoch
+from log_entry import LogEntry
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+STORAGE_FORMATS = ("json", "jsonl")
+
+# 封存压缩方式 -> 扩展名，zstd需要安装zstandard
+COMPRESSION_EXTENSIONS = {
+    "gzip": ".gz",
+    "lzma": ".xz",
+    "zstd": ".zst"
+}
+SEALED_EXTENSIONS = tuple(COMPRESSION_EXTENSIONS.values())
+
+logger = logging.getLogger("SegmentIO")
+
+def segment_extension(storage_format: str) -> str:
+    """
+    获取存储格式对应的文件扩展名
+
+    Args:
+        storage_format: 存储格式（json或jsonl）
+
+    Returns:
+        str: 文件扩展名
+    """
+    if storage_format not in STORAGE_FORMATS:
+        raise ValueError(f"不支持的存储格式: {storage_format}")
+    return f".{storage_format}"
+
+def available_compressions() -> Tuple[str, ...]:
+    """获取当前环境可用的封存压缩方式"""
+    return tuple(name for name in COMPRESSION_EXTENSIONS if name != "zstd" or zstandard is not None)
+
+def sealed_extension(file_path: str) -> str:
+    """获取文件的压缩扩展名，未压缩时返回空字符串"""
+    for extension in SEALED_EXTENSIONS:
+        if str(file_path).endswith(extension):
+            return extension
+    return ""
+
+def unsealed_path(file_path: str) -> str:
+    """去掉压缩扩展名，得到分段原本的文件路径"""
+    extension = sealed_extension(file_path)
+    return str(file_path)[:-len(extension)] if extension else str(file_path)
+
+def segment_files(file_path: str) -> List[str]:
+    """
+    获取一个分段实际存在的所有文件
+
+    封存后又写入的迟到日志会保存在新的未压缩文件中，因此一个分段可能同时有两个文件，
+    先返回较早的封存文件
+
+    Args:
+        file_path: 分段未压缩时的文件路径
+
+    Returns:
+        List[str]: 存在的文件路径
+    """
+    file_path = str(file_path)
+    files = [file_path + extension for extension in SEALED_EXTENSIONS if os.path.exists(file_path + extension)]
+    if os.path.exists(file_path):
+        files.append(file_path)
+    return files
+
+def open_segment(file_path: str, mode: str = 'rb', **kwargs) -> Any:
+    """
+    打开分段文件，根据扩展名透明地解压或压缩（流式处理，不会一次读入整个文件）
+
+    Args:
+        file_path: 文件路径
+        mode: 打开模式（rb、rt、wb、wt）
+        **kwargs: 文本模式下的encoding、errors等参数
+
+    Returns:
+        文件对象
+    """
+    extension = sealed_extension(file_path)
+    if extension == ".gz":
+        return gzip.open(file_path, mode, **kwargs)
+    if extension == ".xz":
+        return lzma.open(file_path, mode, **kwargs)
+    if extension == ".zst":
+        if zstandard is None:
+            raise IOError(f"读取 {file_path} 需要安装zstandard")
+        raw = open(file_path, mode.replace('t', '').replace('b', '') + 'b')
+        if 'r' in mode:
+            # 封存后追加的迟到日志是独立的帧，需要跨帧读取
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor(level=10).stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(stream, **kwargs) if 't' in mode else stream
+    return open(file_path, mode, **kwargs)
+
+def partition_by_hour(entries: List[Dict[str, Any]], default_time: datetime = None) -> Dict[datetime, List[Dict[str, Any]]]:
+    """
+    按事件时间所在的小时对日志分组
+
+    Args:
+        entries: 日志条目列表
+        default_time: 无法确定事件时间时使用的时间，默认为当前时间
+
+    Returns:
+        Dict[datetime, List]: 整点时间 -> 该小时的日志条目
+    """
+    if default_time is None:
+        default_time = datetime.now()
+    default_hour = default_time.replace(minute=0, second=0, microsecond=0)
+
+    partitions: Dict[datetime, List[Dict[str, Any]]] = {}
+    minute_hours: Dict[int, datetime] = {}  # 同一分钟内的事件只计算一次本地时间
+
+    for entry in entries:
+        epoch = get_event_epoch(entry)
+        if epoch is None:
+            hour = default_hour
+        else:
+            minute = int(epoch // 60)
+            hour = minute_hours.get(minute)
+            if hour is None:
+                hour = datetime.fromtimestamp(minute * 60).replace(minute=0, second=0, microsecond=0)
+                minute_hours[minute] = hour
+        partitions.setdefault(hour, []).append(entry)
+
+    return partitions
+
+def iter_hours(start: datetime, end: datetime) -> Iterator[datetime]:
+    """
+    遍历时间范围覆盖的所有整点小时
+
+    Args:
+        start: 开始时间
+        end: 结束时间
+
+    Yields:
+        datetime: 整点时间
+    """
+    hour = start.replace(minute=0, second=0, microsecond=0)
+    while hour <= end:
+        yield hour
+        hour += timedelta(hours=1)
+
+def in_time_range(entry: Dict[str, Any], start_epoch: float, end_epoch: float) -> bool:
+    """判断日志条目的事件时间是否在范围内，无法确定事件时间的条目视为在范围内"""
+    epoch = get_event_epoch(entry)
+    return epoch is None or start_epoch <= epoch <= end_epoch
+
+def storable_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """去掉只在内存中使用的字段（解析后的事件记录），得到可以写入文件的日志条目"""
+    if isinstance(entry, LogEntry):
+        return entry.to_dict()
+    if 'event' not in entry:
+        return entry
+    return {key: value for key, value in entry.items() if key != 'event'}
+
+def encode_jsonl(entries: List[Dict[str, Any]]) -> bytes:
+    """将日志条目编码为JSON Lines字节串"""
+    return "".join(json.dumps(storable_entry(entry), ensure_ascii=False) + "\n" for entry in entries).encode('utf-8')
+
+def encode_jsonl_lines(entries: List[Dict[str, Any]]) -> List[bytes]:
+    """将日志条目逐条编码为JSON Lines的行（需要每条日志在文件中的位置时使用）"""
+    return [(json.dumps(storable_entry(entry), ensure_ascii=False) + "\n").encode('utf-8') for entry in entries]
+
+def append_jsonl(file_path: str, entries: List[Dict[str, Any]]) -> int:
+    """
+    以一次缓冲写入的方式向JSON Lines文件追加日志
+
+    如果文件末尾有上次写入中断留下的残缺行，会先补一个换行符，
+    保证新记录不会和残缺行拼接在一起。
+
+    Args:
+        file_path: 文件路径
+        entries: 日志条目列表
+
+    Returns:
+        int: 写入的字节数
+    """
+    data = encode_jsonl(entries)
+
+    with open(file_path, 'ab+') as f:
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                data = b"\n" + data
+        f.write(data)
+
+    return len(data)
+
+def iter_jsonl(file_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    逐行读取JSON Lines文件
+
+    写入中断只会留下残缺的最后一行，这样的行会被跳过而不会影响其余记录。
+
+    Args:
+        file_path: 文件路径
+
+    Yields:
+        Dict: 日志条目
+    """
+    with open_segment(file_path, 'rt', encoding='utf-8', errors='replace') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"跳过残缺的日志行 {file_path}:{line_number}")
+
+def read_segment(file_path: str) -> List[Dict[str, Any]]:
+    """
+    读取日志分段文件，根据扩展名自动识别格式，已封存的文件自动解压
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        List[Dict]: 日志条目列表
+
+    Raises:
+        json.JSONDecodeError: json格式文件损坏时抛出
+    """
+    if unsealed_path(file_path).endswith(".jsonl"):
+        return list(iter_jsonl(file_path))
+
+    with open_segment(file_path, 'rt', encoding='utf-8') as f:
+        data = json.load(f)
+    return data if isinstance(data, list) else []
+
+def write_json_atomic(file_path: str, data: Any):
+    """
+    原子地写入JSON文件（先写临时文件再替换）
+
+    Args:
+        file_path: 文件路径
+        data: 要写入的数据
+    """
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, file_path)
+
+def sync_files(file_paths: Iterable[str]):
+    """
+    把文件及其所在目录同步到磁盘（预写日志删除之前调用，保证其中的日志已经落盘）
+
+    Args:
+        file_paths: 文件路径，已不存在的文件会被跳过
+    """
+    directories = set()
+    for file_path in file_paths:
+        try:
+            fd = os.open(file_path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        directories.add(os.path.dirname(os.path.abspath(file_path)))
+    for directory in directories:
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+class SegmentWriterPool:
+    """
+    分段文件写入器池
+
+    为每个分段文件保持一个打开的追加句柄，避免每次保存都重新打开文件。
+    句柄按LRU策略淘汰，空闲超时后关闭；同一分组（例如同一服务器的同一日志类型）
+    进入新的小时后，只保留当前小时和上一小时的句柄。
+    """
+
+    def __init__(self, max_open_files: int = 64, idle_timeout: float = 300):
+        """
+        初始化写入器池
+
+        Args:
+            max_open_files: 最多同时打开的文件句柄数量
+            idle_timeout: 句柄空闲多少秒后关闭
+        """
+        self.max_open_files = max(1, max_open_files)
+        self.idle_timeout = idle_timeout
+        self.lock = threading.RLock()
+        self.logger = logging.getLogger("SegmentWriterPool")
+
+        # 文件路径 -> 句柄信息，按最近使用顺序排列
+        self._handles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # 分组 -> 该分组最新的小时
+        self._group_hours: Dict[Hashable, Any] = {}
+
+        # 统计信息
+        self.stats = {
+            'opens': 0,
+            'closes': 0,
+            'appends': 0,
+            'bytes_written': 0
+        }
+
+    def append(self, file_path: str, entries: List[Dict[str, Any]],
+               group: Optional[Hashable] = None, hour_key: Any = None) -> Tuple[int, int]:
+        """
+        向分段文件追加日志（一次缓冲写入）
+
+        Args:
+            file_path: 分段文件路径
+            entries: 日志条目列表
+            group: 分组标识，用于小时切换时关闭旧句柄
+            hour_key: 分段所属的小时，可比较大小
+
+        Returns:
+            Tuple[int, int]: (写入起始偏移量, 写入字节数)
+        """
+        return self._write(file_path, encode_jsonl(entries), group, hour_key)
+
+    def append_lines(self, file_path: str, lines: List[bytes],
+                     group: Optional[Hashable] = None, hour_key: Any = None) -> Tuple[int, int]:
+        """
+        向分段文件追加已编码的行（encode_jsonl_lines的结果），一次缓冲写入
+
+        Args:
+            file_path: 分段文件路径
+            lines: 已编码的行
+            group: 分组标识，用于小时切换时关闭旧句柄
+            hour_key: 分段所属的小时，可比较大小
+
+        Returns:
+            Tuple[int, int]: (写入起始偏移量, 写入字节数)
+        """
+        return self._write(file_path, b"".join(lines), group, hour_key)
+
+    def _write(self, file_path: str, data: bytes, group: Optional[Hashable], hour_key: Any) -> Tuple[int, int]:
+        """写入数据并返回起始偏移量和字节数"""
+        with self.lock:
+            if group is not None and hour_key is not None:
+                self._roll_over(group, hour_key)
+
+            handle = self._get_handle(str(file_path), group, hour_key)
+            f = handle['file']
+            offset = f.tell()
+            try:
+                f.write(data)
+                f.flush()
+            except Exception:
+                # 写入失败时关闭句柄，下次重新打开并修复残缺行
+                self._close(str(file_path))
+                raise
+
+            handle['last_used'] = time.time()
+            self.stats['appends'] += 1
+            self.stats['bytes_written'] += len(data)
+            return offset, len(data)
+
+    def _get_handle(self, file_path: str, group: Optional[Hashable], hour_key: Any) -> Dict[str, Any]:
+        """获取文件句柄，不存在时打开并按LRU淘汰"""
+        handle = self._handles.get(file_path)
+        if handle is not None:
+            self._handles.move_to_end(file_path)
+            return handle
+
+        while len(self._handles) >= self.max_open_files:
+            oldest_path = next(iter(self._handles))
+            self._close(oldest_path)
+
+        f = open(file_path, 'ab')
+        if f.tell() > 0:
+            # 上次写入中断留下的残缺行需要先换行
+            with open(file_path, 'rb') as reader:
+                reader.seek(-1, os.SEEK_END)
+                if reader.read(1) != b"\n":
+                    f.write(b"\n")
+
+        handle = {
+            'file': f,
+            'group': group,
+            'hour_key': hour_key,
+            'last_used': time.time()
+        }
+        self._handles[file_path] = handle
+        self.stats['opens'] += 1
+        return handle
+
+    def _roll_over(self, group: Hashable, hour_key: Any):
+        """分组进入新的小时时关闭更早小时的句柄"""
+        previous_hour = self._group_hours.get(group)
+        if previous_hour is not None and hour_key <= previous_hour:
+            return
+
+        self._group_hours[group] = hour_key
+        if previous_hour is None:
+            return
+
+        for file_path, handle in list(self._handles.items()):
+            if handle['group'] == group and handle['hour_key'] is not None and handle['hour_key'] < previous_hour:
+                self._close(file_path)
+
+    def _close(self, file_path: str):
+        """关闭指定文件的句柄"""
+        handle = self._handles.pop(file_path, None)
+        if handle is None:
+            return
+        try:
+            handle['file'].close()
+        except Exception as e:
+            self.logger.error(f"关闭分段文件失败 {file_path}: {e}")
+        self.stats['closes'] += 1
+
+    def is_open(self, file_path: str) -> bool:
+        """检查文件是否有打开的句柄"""
+        with self.lock:
+            return str(file_path) in self._handles
+
+    def close_idle(self, now: Optional[float] = None):
+        """关闭空闲超时的句柄"""
+        if now is None:
+            now = time.time()
+        with self.lock:
+            for file_path, handle in list(self._handles.items()):
+                if now - handle['last_used'] >= self.idle_timeout:
+                    self._close(file_path)
+
+    def close_all(self):
+        """关闭所有句柄"""
+        with self.lock:
+            for file_path in list(self._handles):
+                self._close(file_path)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取写入器池统计信息"""
+        with self.lock:
+            return {
+                **self.stats,
+                'open_files': len(self._handles)
+            }
@@ -0,0 +1,417 @@
+"""
+分段清单
+每个分段文件旁边保存一个小的清单文件（<分段文件>.manifest），记录条目数量、字节数、
+事件时间范围和各类型数量；每个日期目录和年月目录保存汇总清单（.<kind>.manifest）。
+统计和状态只读取清单，不再解析日志文件。
+
+目录结构:
+    logs/server1/25_10/.raw.manifest                         # 月汇总
+    logs/server1/25_10/23/.raw.manifest                      # 日汇总（包含当天每个分段的清单）
+    logs/server1/25_10/23/hll_logs_2025-10-23_12.jsonl.manifest
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+from log_classifier import LogClassifier, LogType, get_event_epoch
+from segment_io import segment_files, read_segment, unsealed_path
+
+MANIFEST_EXTENSION = ".manifest"
+
+# 分段文件名（可能已封存）: hll_logs_2025-10-23_12.jsonl.gz
+SEGMENT_FILE_PATTERN = re.compile(
+    r'^(?P<prefix>[a-z_]+)_(?P<date>\d{4}-\d{2}-\d{2})_(?P<hour>\d{2})\.(?:jsonl|json)(?:\.gz|\.xz|\.zst)?$'
+)
+
+def list_segments(server_dir: str, prefixes: Iterable[str]) -> List[Tuple[str, datetime]]:
+    """
+    列出服务器目录下指定前缀的分段（包括已封存的文件）
+
+    Args:
+        server_dir: 服务器日志目录
+        prefixes: 分段文件名前缀，例如("hll_logs",)
+
+    Returns:
+        List[Tuple[str, datetime]]: 按路径排序的(未压缩时的分段路径, 分段所在小时)
+    """
+    prefixes = frozenset(prefixes)
+    segments = {}
+    if not os.path.isdir(server_dir):
+        return []
+    for month_entry in os.scandir(server_dir):
+        if not month_entry.is_dir() or not re.match(r'^\d{2}_\d{2}$', month_entry.name):
+            continue
+        for day_entry in os.scandir(month_entry.path):
+            if not day_entry.is_dir():
+                continue
+            for entry in os.scandir(day_entry.path):
+                match = SEGMENT_FILE_PATTERN.match(entry.name)
+                if match is None or match.group('prefix') not in prefixes:
+                    continue
+                segments[unsealed_path(entry.path)] = datetime.strptime(
+                    f"{match.group('date')} {match.group('hour')}", "%Y-%m-%d %H"
+                )
+    return sorted(segments.items())
+
+def empty_summary() -> Dict[str, Any]:
+    """空的汇总"""
+    return {'files': 0, 'entries': 0, 'bytes': 0, 'min_epoch': None, 'max_epoch': None, 'types': {}}
+
+def merge_summary(summary: Dict[str, Any], other: Dict[str, Any]):
+    """把一个分段清单或汇总合并到summary中"""
+    summary['files'] += other.get('files', 1)
+    summary['entries'] += other['entries']
+    summary['bytes'] += other['bytes']
+    for key, pick in (('min_epoch', min), ('max_epoch', max)):
+        if other[key] is not None:
+            summary[key] = other[key] if summary[key] is None else pick(summary[key], other[key])
+    for log_type, count in other['types'].items():
+        summary['types'][log_type] = summary['types'].get(log_type, 0) + count
+
+def _write_json(file_path: str, data: Dict[str, Any]):
+    """原子地写入清单文件"""
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, file_path)
+
+def _read_json(file_path: str) -> Optional[Dict[str, Any]]:
+    """读取清单文件，不存在或损坏时返回None"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+        return None
+
+class ManifestStore:
+    """
+    一类分段（原始日志或分类日志）的清单
+
+    写入分段后调用record_append更新内存中的清单，flush时写入分段清单、日汇总和月汇总；
+    缺少清单的历史分段在第一次读取时从文件重建一次
+    """
+
+    def __init__(self, kind: str, prefixes: Iterable[str], classifier: Optional[LogClassifier] = None,
+                 max_cached_days: int = 64):
+        """
+        初始化清单存储
+
+        Args:
+            kind: 清单种类（raw或categorized），用于汇总清单的文件名
+            prefixes: 属于该种类的分段文件名前缀
+            classifier: 统计各类型数量使用的分类器，默认在需要时创建
+            max_cached_days: 内存中最多缓存的日汇总数量
+        """
+        self.kind = kind
+        self.prefixes = frozenset(prefixes)
+        self.classifier = classifier
+        self.max_cached_days = max(2, max_cached_days)
+        self.lock = threading.RLock()
+        self.logger = logging.getLogger("ManifestStore")
+
+        self._days: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # 日期目录 -> 日汇总
+        self._months: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # 年月目录 -> 月汇总
+        self._dirty_segments: Dict[str, str] = {}  # 分段路径 -> 日期目录
+        self._dirty_days: set = set()
+        self._just_built: set = set()  # 本次调用中从文件重建的分段（重建时已包含刚写入的日志）
+
+        # 统计信息
+        self.stats = {
+            'manifest_writes': 0,
+            'rebuilt_segments': 0
+        }
+
+    def rollup_name(self) -> str:
+        """汇总清单的文件名"""
+        return f".{self.kind}{MANIFEST_EXTENSION}"
+
+    def owns(self, file_path: str) -> bool:
+        """判断分段文件是否属于该清单"""
+        match = SEGMENT_FILE_PATTERN.match(os.path.basename(str(file_path)))
+        return match is not None and match.group('prefix') in self.prefixes
+
+    def _type_of(self, entry: Dict[str, Any]) -> str:
+        """获取日志条目的类型"""
+        if self.classifier is None:
+            self.classifier = LogClassifier()
+        return self.classifier.classify_log(entry).value
+
+    @staticmethod
+    def _segment_bytes(segment_path: str) -> int:
+        """分段在磁盘上的字节数（包括已封存的文件）"""
+        total = 0
+        for file_path in segment_files(segment_path):
+            try:
+                total += os.path.getsize(file_path)
+            except OSError:
+                pass
+        return total
+
+    def record_append(self, segment_path: str, entries: List[Dict[str, Any]], log_type: Optional[LogType] = None):
+        """
+        记录写入分段的新日志（调用flush后写入磁盘）
+
+        Args:
+            segment_path: 分段文件路径（未压缩时的路径）
+            entries: 新写入的日志条目
+            log_type: 分段中所有日志的类型，None表示逐条分类
+        """
+        segment_path = unsealed_path(segment_path)
+        day_dir = os.path.dirname(segment_path)
+        with self.lock:
+            self._just_built.clear()
+            manifest = self._segment(segment_path, day_dir)
+            if segment_path in self._just_built:
+                entries = []
+            for entry in entries:
+                epoch = get_event_epoch(entry)
+                if epoch is not None:
+                    epoch = int(epoch)
+                    if manifest['min_epoch'] is None or epoch < manifest['min_epoch']:
+                        manifest['min_epoch'] = epoch
+                    if manifest['max_epoch'] is None or epoch > manifest['max_epoch']:
+                        manifest['max_epoch'] = epoch
+                type_value = log_type.value if log_type is not None else self._type_of(entry)
+                manifest['types'][type_value] = manifest['types'].get(type_value, 0) + 1
+            manifest['entries'] += len(entries)
+            manifest['bytes'] = self._segment_bytes(segment_path)
+            manifest['updated'] = datetime.now().isoformat()
+            self._mark_dirty(segment_path, day_dir)
+            self._just_built.clear()
+
+    def record_size(self, segment_path: str):
+        """分段文件被替换（例如封存）后更新字节数并立即写入"""
+        segment_path = unsealed_path(segment_path)
+        day_dir = os.path.dirname(segment_path)
+        with self.lock:
+            manifest = self._segment(segment_path, day_dir)
+            manifest['bytes'] = self._segment_bytes(segment_path)
+            self._mark_dirty(segment_path, day_dir)
+            self.flush()
+
+    def reset_segment(self, segment_path: str):
+        """分段文件被重新创建（例如原文件损坏）时清空其清单"""
+        segment_path = unsealed_path(segment_path)
+        day_dir = os.path.dirname(segment_path)
+        with self.lock:
+            day = self._day(day_dir)
+            day['segments'][os.path.basename(segment_path)] = self._new_manifest()
+            self._mark_dirty(segment_path, day_dir)
+
+    def remove_segment(self, segment_path: str):
+        """分段文件被删除后删除其清单并更新汇总"""
+        segment_path = unsealed_path(segment_path)
+        day_dir = os.path.dirname(segment_path)
+        with self.lock:
+            self._dirty_segments.pop(segment_path, None)
+            try:
+                os.remove(segment_path + MANIFEST_EXTENSION)
+            except FileNotFoundError:
+                pass
+            day = self._day(day_dir)
+            day['segments'].pop(os.path.basename(segment_path), None)
+            self._dirty_days.add(day_dir)
+            self.flush()
+
+    @staticmethod
+    def _new_manifest() -> Dict[str, Any]:
+        return {'entries': 0, 'bytes': 0, 'min_epoch': None, 'max_epoch': None, 'types': {}, 'updated': None}
+
+    def _mark_dirty(self, segment_path: str, day_dir: str):
+        self._dirty_segments[segment_path] = day_dir
+        self._dirty_days.add(day_dir)
+
+    def _segment(self, segment_path: str, day_dir: str) -> Dict[str, Any]:
+        """获取分段清单（在日汇总中），不存在时新建"""
+        day = self._day(day_dir)
+        name = os.path.basename(segment_path)
+        manifest = day['segments'].get(name)
+        if manifest is None:
+            manifest = day['segments'][name] = self._new_manifest()
+        return manifest
+
+    def _build_segment(self, segment_path: str) -> Dict[str, Any]:
+        """从分段文件重建清单（没有清单的历史分段）"""
+        manifest = self._new_manifest()
+        for file_path in segment_files(segment_path):
+            try:
+                entries = read_segment(file_path)
+            except Exception as e:
+                self.logger.error(f"重建清单时读取分段失败 {file_path}: {e}")
+                continue
+            for entry in entries:
+                epoch = get_event_epoch(entry)
+                if epoch is not None:
+                    epoch = int(epoch)
+                    manifest['min_epoch'] = epoch if manifest['min_epoch'] is None else min(manifest['min_epoch'], epoch)
+                    manifest['max_epoch'] = epoch if manifest['max_epoch'] is None else max(manifest['max_epoch'], epoch)
+                type_value = self._type_of(entry)
+                manifest['types'][type_value] = manifest['types'].get(type_value, 0) + 1
+            manifest['entries'] += len(entries)
+        manifest['bytes'] = self._segment_bytes(segment_path)
+        manifest['updated'] = datetime.now().isoformat()
+        self.stats['rebuilt_segments'] += 1
+        self._just_built.add(segment_path)
+        return manifest
+
+    def _day(self, day_dir: str) -> Dict[str, Any]:
+        """获取日汇总：优先使用缓存，其次读取汇总清单，最后从各分段清单（或分段文件）重建"""
+        day = self._days.get(day_dir)
+        if day is not None:
+            self._days.move_to_end(day_dir)
+            return day
+
+        day = _read_json(os.path.join(day_dir, self.rollup_name()))
+        if day is None or 'segments' not in day:
+            day = {'segments': {}}
+            segment_paths = set()
+            if os.path.isdir(day_dir):
+                for entry in os.scandir(day_dir):
+                    if self.owns(entry.name):
+                        segment_paths.add(unsealed_path(entry.path))
+            for segment_path in sorted(segment_paths):
+                manifest = _read_json(segment_path + MANIFEST_EXTENSION)
+                if manifest is None:
+                    manifest = self._build_segment(segment_path)
+                    self._dirty_segments[segment_path] = day_dir
+                day['segments'][os.path.basename(segment_path)] = manifest
+            if segment_paths:
+                self._dirty_days.add(day_dir)
+
+        self._days[day_dir] = day
+        while len(self._days) > self.max_cached_days:
+            oldest_dir = next(iter(self._days))
+            if oldest_dir in self._dirty_days:
+                break
+            self._days.pop(oldest_dir)
+        return day
+
+    def _month(self, month_dir: str) -> Dict[str, Any]:
+        """获取月汇总，不存在时从各日汇总重建"""
+        month = self._months.get(month_dir)
+        if month is not None:
+            self._months.move_to_end(month_dir)
+            return month
+
+        month = _read_json(os.path.join(month_dir, self.rollup_name()))
+        if month is None or 'days' not in month:
+            month = {'days': {}}
+            if os.path.isdir(month_dir):
+                for entry in sorted(os.scandir(month_dir), key=lambda e: e.name):
+                    if entry.is_dir():
+                        summary = self._day_summary(self._day(entry.path))
+                        if summary['files']:
+                            month['days'][entry.name] = summary
+            month['summary'] = self._combine(month['days'].values())
+            self._write_rollup(month_dir, month)
+
+        self._months[month_dir] = month
+        while len(self._months) > self.max_cached_days:
+            self._months.popitem(last=False)
+        return month
+
+    @staticmethod
+    def _combine(summaries: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        summary = empty_summary()
+        for other in summaries:
+            merge_summary(summary, other)
+        return summary
+
+    def _day_summary(self, day: Dict[str, Any]) -> Dict[str, Any]:
+        return self._combine(day['segments'].values())
+
+    def _write_rollup(self, directory: str, rollup: Dict[str, Any]):
+        """写入汇总清单，没有分段时删除"""
+        rollup_path = os.path.join(directory, self.rollup_name())
+        items = rollup.get('segments', rollup.get('days'))
+        if not items:
+            try:
+                os.remove(rollup_path)
+            except FileNotFoundError:
+                pass
+            return
+        if os.path.isdir(directory):
+            _write_json(rollup_path, rollup)
+            self.stats['manifest_writes'] += 1
+
+    def flush(self):
+        """把修改过的分段清单、日汇总和月汇总写入磁盘"""
+        with self.lock:
+            for segment_path, day_dir in self._dirty_segments.items():
+                manifest = self._days[day_dir]['segments'].get(os.path.basename(segment_path))
+                if manifest is not None and os.path.isdir(day_dir):
+                    _write_json(segment_path + MANIFEST_EXTENSION, manifest)
+                    self.stats['manifest_writes'] += 1
+            self._dirty_segments.clear()
+
+            for day_dir in sorted(self._dirty_days):
+                day = self._days[day_dir]
+                day['summary'] = self._day_summary(day)
+                self._write_rollup(day_dir, day)
+
+                month_dir = os.path.dirname(day_dir)
+                month = self._month(month_dir)
+                day_name = os.path.basename(day_dir)
+                if day['summary']['files']:
+                    month['days'][day_name] = day['summary']
+                else:
+                    month['days'].pop(day_name, None)
+                month['summary'] = self._combine(month['days'].values())
+                self._write_rollup(month_dir, month)
+            self._dirty_days.clear()
+
+    def get_segment(self, segment_path: str) -> Optional[Dict[str, Any]]:
+        """
+        获取分段清单
+
+        Args:
+            segment_path: 分段文件路径（未压缩时的路径）
+
+        Returns:
+            Optional[Dict]: 分段清单，分段不存在时返回None
+        """
+        segment_path = unsealed_path(segment_path)
+        with self.lock:
+            manifest = self._day(os.path.dirname(segment_path))['segments'].get(os.path.basename(segment_path))
+            return dict(manifest) if manifest is not None else None
+
+    def summarize(self, server_dir: str) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        汇总一个服务器的所有分段，只读取月汇总清单
+
+        Args:
+            server_dir: 服务器日志目录
+
+        Returns:
+            Tuple[Dict, List[str]]: (汇总, 有日志的日期列表"YYYY-MM-DD")
+        """
+        summary = empty_summary()
+        dates = []
+        if not os.path.isdir(server_dir):
+            return summary, dates
+
+        with self.lock:
+            for entry in sorted(os.scandir(server_dir), key=lambda e: e.name):
+                if not entry.is_dir() or not re.match(r'^\d{2}_\d{2}$', entry.name):
+                    continue
+                month = self._month(entry.path)
+                merge_summary(summary, month.get('summary') or self._combine(month['days'].values()))
+                year, month_number = entry.name.split('_')
+                dates.extend(f"20{year}-{month_number}-{day}" for day in sorted(month['days']))
+            self.flush()
+        return summary, dates
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取清单存储统计信息"""
+        with self.lock:
+            return {
+                **self.stats,
+                'cached_days': len(self._days),
+                'cached_months': len(self._months)
+            }
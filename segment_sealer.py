@@ -0,0 +1,286 @@
+"""
+分段封存
+小时结束一段时间后，该小时的原始日志和分类日志不会再被写入，
+在后台线程中把这些分段压缩保存（gzip/lzma，安装了zstandard时可使用zstd），读取时自动解压。
+压缩不在收集线程和保存线程中进行。
+"""
+
+import os
+import re
+import gzip
+import lzma
+import json
+import time
+import shutil
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Iterable, Iterator
+
+from segment_io import (
+    COMPRESSION_EXTENSIONS, available_compressions, read_segment, SegmentWriterPool, zstandard
+)
+
+# 可以封存的分段文件名: hll_logs_2025-10-23_12.json、kills_2025-10-23_12.jsonl
+SEGMENT_NAME_PATTERN = re.compile(r'^[a-z_]+_(?P<date>\d{4}-\d{2}-\d{2})_(?P<hour>\d{2})\.(?P<format>jsonl|json)$')
+
+class SegmentSealer:
+    """
+    后台压缩已结束小时的分段文件
+
+    压缩时不持有任何锁；替换文件前持有所有写入器池的锁，确认文件没有打开的追加句柄
+    并且在压缩期间没有被修改，否则放弃本次结果，下次扫描时重试
+    """
+
+    def __init__(self, logs_directory: str, writer_pools: Iterable[SegmentWriterPool],
+                 compression: str = "gzip", seal_delay: float = 900, scan_interval: float = 600,
+                 recent_days: int = 2, manifest_stores: Iterable[Any] = ()):
+        """
+        初始化封存器
+
+        Args:
+            logs_directory: 日志基础目录
+            writer_pools: 写入这些分段的写入器池（原始日志和分类日志各一个）
+            compression: 压缩方式，gzip、lzma或zstd（未安装zstandard时使用gzip）
+            seal_delay: 小时结束多少秒后封存，应大于迟到日志可能写入的时间
+            scan_interval: 扫描间隔（秒）
+            recent_days: 首次全量扫描之后，只扫描最近几天的目录
+            manifest_stores: 分段清单（segment_manifest.ManifestStore），封存后更新其中的字节数
+        """
+        self.logger = logging.getLogger("SegmentSealer")
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(f"不支持的压缩方式: {compression}")
+        if compression not in available_compressions():
+            self.logger.warning(f"压缩方式 {compression} 不可用（未安装zstandard），使用gzip")
+            compression = "gzip"
+
+        self.logs_directory = logs_directory
+        self.writer_pools = list(writer_pools)
+        self.compression = compression
+        self.extension = COMPRESSION_EXTENSIONS[compression]
+        self.seal_delay = seal_delay
+        self.scan_interval = scan_interval
+        self.recent_days = recent_days
+        self.manifest_stores = list(manifest_stores)
+
+        self._full_scan_done = False
+        self._retry_directories = set()  # 有文件因打开或被修改而跳过的目录，下次扫描时重试
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # 统计信息
+        self.stats = {
+            'sealed_files': 0,
+            'bytes_before': 0,
+            'bytes_after': 0,
+            'skipped_open': 0,
+            'skipped_changed': 0,
+            'errors': 0,
+            'last_scan': None
+        }
+
+    def start(self):
+        """启动后台封存线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._seal_loop, name="segment-sealer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台封存线程"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+            self._thread = None
+
+    def _seal_loop(self):
+        """封存主循环"""
+        self.logger.info(f"开始分段封存循环，压缩方式: {self.compression}，小时结束 {self.seal_delay} 秒后封存")
+        while not self._stop_event.is_set():
+            try:
+                self.seal_pending()
+            except Exception as e:
+                self.logger.error(f"分段封存出错: {e}")
+            self._stop_event.wait(self.scan_interval)
+
+    def seal_pending(self, now: Optional[float] = None) -> int:
+        """
+        封存所有已结束的小时分段
+
+        Args:
+            now: 当前时间，默认为time.time()
+
+        Returns:
+            int: 本次封存的文件数量
+        """
+        if now is None:
+            now = time.time()
+
+        sealed = 0
+        retry_directories = set()
+        for file_path in self._candidates(now):
+            if self._stop_event.is_set():
+                break
+            if self.seal_file(file_path):
+                sealed += 1
+            else:
+                retry_directories.add(os.path.dirname(file_path))
+        self._retry_directories = retry_directories
+
+        self._full_scan_done = True
+        self.stats['last_scan'] = datetime.fromtimestamp(now).isoformat()
+        if sealed:
+            self.logger.info(f"封存了 {sealed} 个分段文件")
+        return sealed
+
+    def _day_directories(self, now: float) -> Iterator[str]:
+        """遍历需要扫描的日期目录：首次扫描全部，之后只扫描最近几天和上次有文件被跳过的目录"""
+        if not os.path.isdir(self.logs_directory):
+            return
+
+        retry_directories = set(self._retry_directories) if self._full_scan_done else set()
+
+        recent = None
+        if self._full_scan_done:
+            today = datetime.fromtimestamp(now)
+            recent = {
+                (f"{day.year % 100:02d}_{day.month:02d}", f"{day.day:02d}")
+                for day in (today - timedelta(days=offset) for offset in range(self.recent_days + 1))
+            }
+
+        for server_entry in os.scandir(self.logs_directory):
+            if not server_entry.is_dir():
+                continue
+            for month_entry in os.scandir(server_entry.path):
+                if not month_entry.is_dir():
+                    continue
+                if recent is not None and not any(month_entry.name == month for month, _ in recent):
+                    continue
+                for day_entry in os.scandir(month_entry.path):
+                    if not day_entry.is_dir():
+                        continue
+                    if recent is not None and (month_entry.name, day_entry.name) not in recent:
+                        continue
+                    retry_directories.discard(day_entry.path)
+                    yield day_entry.path
+
+        yield from (path for path in retry_directories if os.path.isdir(path))
+
+    def _candidates(self, now: float) -> List[str]:
+        """获取已结束且超过封存延迟的分段文件"""
+        candidates = []
+        for day_path in self._day_directories(now):
+            for entry in os.scandir(day_path):
+                match = SEGMENT_NAME_PATTERN.match(entry.name)
+                if not match or not entry.is_file():
+                    continue
+                try:
+                    hour_start = datetime.strptime(f"{match.group('date')} {match.group('hour')}", "%Y-%m-%d %H")
+                except ValueError:
+                    continue
+                if (hour_start + timedelta(hours=1)).timestamp() + self.seal_delay <= now:
+                    candidates.append(entry.path)
+        return sorted(candidates)
+
+    def seal_file(self, file_path: str) -> bool:
+        """
+        封存单个分段文件
+
+        已有封存文件时（封存后又写入了迟到日志）：jsonl格式追加一个新的压缩流，
+        json格式合并为一个JSON数组后重新压缩
+
+        Args:
+            file_path: 未压缩的分段文件路径
+
+        Returns:
+            bool: 是否封存成功
+        """
+        sealed_path = file_path + self.extension
+        tmp_path = sealed_path + ".tmp"
+        try:
+            before = os.stat(file_path)
+            if any(pool.is_open(file_path) for pool in self.writer_pools):
+                self.stats['skipped_open'] += 1
+                return False
+
+            with open(tmp_path, 'wb') as out:
+                if file_path.endswith(".json") and os.path.exists(sealed_path):
+                    entries = read_segment(sealed_path) + read_segment(file_path)
+                    with _compressed_writer(out, self.extension) as dst:
+                        dst.write(json.dumps(entries, ensure_ascii=False).encode('utf-8'))
+                else:
+                    if os.path.exists(sealed_path):
+                        with open(sealed_path, 'rb') as existing:
+                            shutil.copyfileobj(existing, out)
+                    # 压缩流可以直接拼接，读取时按顺序解压
+                    with open(file_path, 'rb') as src, _compressed_writer(out, self.extension) as dst:
+                        last = b"\n"
+                        for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                            dst.write(chunk)
+                            last = chunk[-1:]
+                        if file_path.endswith(".jsonl") and last != b"\n":
+                            # 残缺的最后一行单独成行，不会和之后追加的日志拼接
+                            dst.write(b"\n")
+
+            if not self._commit(file_path, before, tmp_path, sealed_path):
+                return False
+
+            for store in self.manifest_stores:
+                if store.owns(file_path):
+                    store.record_size(file_path)
+
+            self.stats['sealed_files'] += 1
+            self.stats['bytes_before'] += before.st_size
+            self.stats['bytes_after'] += os.path.getsize(sealed_path)
+            self.logger.debug(f"已封存 {file_path} -> {sealed_path}")
+            return True
+
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            self.stats['errors'] += 1
+            self.logger.error(f"封存分段失败 {file_path}: {e}")
+            return False
+        finally:
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def _commit(self, file_path: str, before: os.stat_result, tmp_path: str, sealed_path: str) -> bool:
+        """持有写入器池的锁，确认文件未被修改后替换为封存文件"""
+        locks = [pool.lock for pool in self.writer_pools]
+        for lock in locks:
+            lock.acquire()
+        try:
+            if any(pool.is_open(file_path) for pool in self.writer_pools):
+                self.stats['skipped_open'] += 1
+                return False
+            after = os.stat(file_path)
+            if (after.st_size, after.st_mtime_ns, after.st_ino) != (before.st_size, before.st_mtime_ns, before.st_ino):
+                self.stats['skipped_changed'] += 1
+                return False
+            os.replace(tmp_path, sealed_path)
+            os.remove(file_path)
+            return True
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取封存统计信息"""
+        stats = dict(self.stats)
+        stats['compression'] = self.compression
+        if stats['bytes_before']:
+            stats['ratio'] = round(stats['bytes_after'] / stats['bytes_before'], 3)
+        return stats
+
+def _compressed_writer(out, extension: str):
+    """在已打开的二进制文件上创建压缩写入流（关闭时不关闭底层文件）"""
+    if extension == ".gz":
+        return gzip.GzipFile(fileobj=out, mode='wb')
+    if extension == ".xz":
+        return lzma.LZMAFile(out, mode='wb')
+    return zstandard.ZstdCompressor(level=10).stream_writer(out, closefd=False)
@@ -0,0 +1,117 @@
+"""
+聚合统计测试
+月计数表编码后解码不变，损坏的文件被拒绝；跨日期和月份边界的时间范围统计与逐小时累加的结果一致
+
+用法:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import random
+import shutil
+import logging
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregate_store import AggregateStore, MonthTable, TYPES
+
+logging.disable(logging.CRITICAL)
+
+class MonthTableTest(unittest.TestCase):
+    """计数表编码"""
+
+    def test_encode_decode(self):
+        table = MonthTable(2025, 10)
+        table.add(1, 0, 0, 3)
+        table.add(31, 23, len(TYPES) - 1, 7)
+        table.add(31, 22, len(TYPES) - 1, 1)
+
+        decoded = MonthTable.decode(table.encode())
+        self.assertEqual((decoded.year, decoded.month), (2025, 10))
+        self.assertEqual(decoded.counts, table.counts)
+        self.assertEqual(decoded.row(0)[0], 3)
+        self.assertEqual(decoded.row(0)[len(TYPES) - 1], 8)
+        self.assertEqual(decoded.row(MonthTable.day_row(31))[len(TYPES) - 1], 8)
+        self.assertEqual(decoded.row(MonthTable.hour_row(31, 23))[len(TYPES) - 1], 7)
+
+    def test_decode_rejects_corrupt_data(self):
+        data = bytearray(MonthTable(2025, 10).encode())
+        with self.assertRaises(ValueError):
+            MonthTable.decode(bytes(data[:10]))
+        with self.assertRaises(ValueError):
+            MonthTable.decode(b'XXXX' + bytes(data[4:]))
+        data[-1] ^= 0xFF
+        with self.assertRaises(ValueError):
+            MonthTable.decode(bytes(data))
+
+class AggregateRangeTest(unittest.TestCase):
+    """按月、日、小时组合的时间范围统计"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="aggregate_test_")
+        # 2025-10-30 00:00 到 2025-11-02 00:00 的每个小时都有日志，数量各不相同
+        self.hours = {}
+        hour = datetime(2025, 10, 30)
+        rng = random.Random(17)
+        while hour < datetime(2025, 11, 2):
+            self.hours[hour] = {log_type: rng.randint(0, 5) for log_type in TYPES}
+            hour += timedelta(hours=1)
+        # 9月整月只有一个小时有日志
+        self.hours[datetime(2025, 9, 15, 8)] = {TYPES[0]: 11}
+
+        store = AggregateStore(self.directory)
+        for hour, counts in self.hours.items():
+            store.record("s1", hour, counts)
+        store.flush()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def expected(self, start: datetime, end: datetime) -> dict:
+        """逐小时累加：包括start所在的小时，不包括end之后开始的小时"""
+        start_hour = start.replace(minute=0, second=0, microsecond=0)
+        totals = dict.fromkeys(TYPES, 0)
+        for hour, counts in self.hours.items():
+            if start_hour <= hour < end:
+                for log_type, count in counts.items():
+                    totals[log_type] += count
+        return totals
+
+    def test_ranges_across_boundaries(self):
+        # 最多缓存两个月份的计数表，跨三个月的查询需要从文件重新读取
+        store = AggregateStore(self.directory, max_cached_months=2)
+        ranges = [
+            (datetime(2025, 10, 30), datetime(2025, 11, 2)),             # 整日
+            (datetime(2025, 10, 30, 5), datetime(2025, 10, 31, 7)),      # 日期边界两端的小时
+            (datetime(2025, 10, 31, 22), datetime(2025, 11, 1, 2)),      # 月份边界
+            (datetime(2025, 10, 31, 23, 30), datetime(2025, 11, 1, 0, 10)),  # 不在整点
+            (datetime(2025, 9, 1), datetime(2025, 11, 1, 12)),           # 整月、空的月份和部分日期
+            (datetime(2025, 8, 1), datetime(2026, 1, 1)),
+            (datetime(2025, 11, 1, 3), datetime(2025, 11, 1, 3)),        # 空范围
+        ]
+        for start, end in ranges:
+            with self.subTest(start=start, end=end):
+                self.assertEqual(store.count("s1", start, end), self.expected(start, end))
+
+        rng = random.Random(29)
+        first = datetime(2025, 10, 29)
+        for _ in range(50):
+            start = first + timedelta(minutes=rng.randrange(5 * 24 * 60))
+            end = start + timedelta(minutes=rng.randrange(4 * 24 * 60))
+            self.assertEqual(store.count("s1", start, end), self.expected(start, end), (start, end))
+
+    def test_count_servers(self):
+        store = AggregateStore(self.directory)
+        store.record("s2", datetime(2025, 10, 31, 1), {TYPES[0]: 4})
+        start, end = datetime(2025, 10, 31), datetime(2025, 11, 1)
+        result = store.count_servers(["s1", "s2", "missing"], start, end)
+        self.assertEqual(result["servers"]["s1"], self.expected(start, end))
+        self.assertEqual(result["servers"]["missing"], dict.fromkeys(TYPES, 0))
+        self.assertEqual(result["total"][TYPES[0]], self.expected(start, end)[TYPES[0]] + 4)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+聊天索引测试
+保存分类日志时写入的聊天索引能按关键词（包括单个中文字）、短语、频道和玩家搜索，
+按日期分区的索引在分区被关闭、删除旧分区和重新生成后结果正确
+
+用法:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_index import tokenize
+from categorized_log_manager import CategorizedLogManager
+
+EPOCH = 1761193883
+DAY = 86400
+
+def chat(epoch: int, channel: str, sender: str, sender_id: str, text: str) -> dict:
+    return {"timestamp": "2025-10-23T04:34:21.310Z",
+            "message": f"[2:47 min ({epoch})] CHAT[{channel}][{sender}(Axis/{sender_id})]: {text}"}
+
+class ChatIndexSearchTest(unittest.TestCase):
+    """写入聊天索引后搜索"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="chat_index_test_")
+        self.manager = CategorizedLogManager(self.directory, storage_format="jsonl", chat_index=True)
+        # 每次只打开一个分区，跨日期写入和查询时会关闭并提交之前的分区
+        self.manager.chat_index.max_open_partitions = 1
+        self.index = self.manager.chat_index
+        self.manager.save_categorized_logs("s1", [
+            chat(EPOCH, "Team", "alice", "76561190000000001", "好好学习 NOOB"),
+            chat(EPOCH + 10, "All", "bob", "76561190000000002", "gg noob team"),
+            chat(EPOCH + DAY, "Unit", "alice", "76561190000000001", "明天见"),
+        ])
+
+    def tearDown(self):
+        self.manager.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def search(self, query: str = "", **kwargs) -> list:
+        start = datetime.fromtimestamp(EPOCH) - timedelta(days=1)
+        end = datetime.fromtimestamp(EPOCH + 2 * DAY)
+        return [message["text"] for message in self.index.search(["s1"], query, start, end, **kwargs)]
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("好好学习 NOOB"), ["好好", "好学", "学习", "noob"])
+        self.assertEqual(tokenize("好好学习", unigrams=True), ["好好", "好学", "学习", "好", "好", "学", "习"])
+        self.assertEqual(tokenize("ｇｇ 好"), ["gg", "好"])
+
+    def test_search(self):
+        self.assertEqual(self.search("noob"), ["gg noob team", "好好学习 NOOB"])
+        self.assertEqual(self.search("学习"), ["好好学习 NOOB"])
+        # 单个中文字按单字词项查找
+        self.assertEqual(self.search("学"), ["好好学习 NOOB"])
+        self.assertEqual(self.search("见"), ["明天见"])
+        self.assertEqual(self.search("习好"), [])
+        self.assertEqual(self.search('"gg noob"'), ["gg noob team"])
+        self.assertEqual(self.search('"noob gg"'), [])
+        self.assertEqual(self.search(channel="team"), ["好好学习 NOOB"])
+        self.assertEqual(self.search(player="ALICE"), ["明天见", "好好学习 NOOB"])
+        self.assertEqual(self.search(player="76561190000000002"), ["gg noob team"])
+        self.assertEqual(self.search(limit=1), ["明天见"])
+
+    def test_duplicate_messages_indexed_once(self):
+        self.index.record_messages("s1", [chat(EPOCH, "Team", "alice", "76561190000000001", "好好学习 NOOB")],
+                                   datetime.fromtimestamp(EPOCH))
+        self.index.flush()
+        self.assertEqual(self.search("noob"), ["gg noob team", "好好学习 NOOB"])
+
+    def test_drop_and_rebuild(self):
+        cutoff = datetime.fromtimestamp(EPOCH + DAY).replace(hour=0, minute=0, second=0)
+        self.assertEqual(self.index.drop_before("s1", cutoff), 1)
+        self.assertEqual(self.search(), ["明天见"])
+
+        # 从聊天日志分段重新生成后恢复删除的分区
+        self.assertEqual(self.index.rebuild(["s1"]), {"s1": 3})
+        self.assertEqual(self.search(), ["明天见", "gg noob team", "好好学习 NOOB"])
+        self.assertEqual(self.search("学"), ["好好学习 NOOB"])
+
+if __name__ == "__main__":
+    unittest.main()
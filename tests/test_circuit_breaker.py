@@ -0,0 +1,91 @@
+"""
+断路器测试
+使用注入的时钟检查closed -> open -> half_open的状态转换、指数退避和上限，以及试探请求的结果
+
+用法:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import logging
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from circuit_breaker import CircuitBreaker
+
+logging.disable(logging.CRITICAL)
+
+class CircuitBreakerTest(unittest.TestCase):
+    """断路器状态转换"""
+
+    def make_breaker(self, **kwargs) -> CircuitBreaker:
+        options = {"failure_threshold": 3, "base_delay": 10, "max_delay": 35, "jitter": 0}
+        options.update(kwargs)
+        return CircuitBreaker("s1", **options)
+
+    def test_opens_after_threshold(self):
+        breaker = self.make_breaker()
+        now = 1000.0
+        self.assertFalse(breaker.record_failure(now))
+        self.assertFalse(breaker.record_failure(now))
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.allow(now), 0)
+
+        self.assertTrue(breaker.record_failure(now))
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(breaker.allow(now + 4), 6)
+        self.assertEqual(breaker.retry_in(now + 9), 1)
+        self.assertEqual(breaker.stats['short_circuited'], 1)
+
+    def test_success_resets_failure_count(self):
+        breaker = self.make_breaker()
+        breaker.record_failure(0)
+        breaker.record_failure(0)
+        breaker.record_success()
+        self.assertFalse(breaker.record_failure(0))
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_trial(self):
+        breaker = self.make_breaker(failure_threshold=1)
+        now = 1000.0
+        breaker.record_failure(now)
+
+        # 退避结束后只放行一次试探请求
+        now += 10
+        self.assertEqual(breaker.allow(now), 0)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertGreater(breaker.allow(now), 0)
+        self.assertEqual(breaker.stats['trials'], 1)
+
+        # 试探失败：退避加倍后重新打开
+        self.assertTrue(breaker.record_failure(now))
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(breaker.retry_in(now), 20)
+
+        # 再次失败时退避不超过max_delay
+        now += 20
+        self.assertEqual(breaker.allow(now), 0)
+        breaker.record_failure(now)
+        self.assertEqual(breaker.retry_in(now), 35)
+
+        # 试探成功：关闭并重置退避
+        now += 35
+        self.assertEqual(breaker.allow(now), 0)
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.allow(now), 0)
+        breaker.record_failure(now)
+        self.assertEqual(breaker.retry_in(now), 10)
+
+    def test_jitter_shortens_delay(self):
+        breaker = self.make_breaker(failure_threshold=1, jitter=0.5)
+        for _ in range(20):
+            breaker.record_success()
+            breaker.record_failure(0)
+            self.assertGreaterEqual(breaker.retry_in(0), 5)
+            self.assertLessEqual(breaker.retry_in(0), 10)
+
+if __name__ == "__main__":
+    unittest.main()
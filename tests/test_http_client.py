@@ -0,0 +1,121 @@
+"""
+HTTP客户端请求重试测试
+会话失效（401）时重新登录后重试；连接错误只重试GET请求和确认没有发出的请求，
+可能已被服务器执行的POST命令不会重复发送
+
+用法:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import json
+import logging
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from hll_http_client import HLLHttpClient
+
+logging.disable(logging.CRITICAL)
+
+def make_response(status_code: int, body: dict) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode('utf-8')
+    return response
+
+class StubSession:
+    """按顺序返回预设结果的会话，记录每次请求的方法和路径"""
+
+    def __init__(self, client: HLLHttpClient, results: list):
+        self.base_url = client.api_base_url
+        self.results = list(results)
+        self.calls = []
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        path = url[len(self.base_url):]
+        self.calls.append((method, path))
+        if path == "/api/v2/connect":
+            return make_response(200, {"session_id": f"session-{len(self.calls)}"})
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+def refused() -> requests.ConnectionError:
+    """建立连接时被拒绝（请求没有发出）"""
+    reason = NewConnectionError(None, "Connection refused")
+    return requests.ConnectionError(MaxRetryError(None, "/api/v2/command/KickPlayer", reason))
+
+class HttpClientRequestTest(unittest.TestCase):
+    """_request的重试策略"""
+
+    def make_client(self, results: list) -> HLLHttpClient:
+        client = HLLHttpClient("127.0.0.1", 1, "pw", api_host="127.0.0.1", api_port=17080)
+        client.connected = True
+        client.session = StubSession(client, results)
+        return client
+
+    def test_request_not_sent(self):
+        self.assertTrue(HLLHttpClient._request_not_sent(requests.ConnectTimeout("timed out")))
+        self.assertTrue(HLLHttpClient._request_not_sent(refused()))
+        self.assertFalse(HLLHttpClient._request_not_sent(requests.ConnectionError("Connection reset by peer")))
+
+    def test_post_not_resent_after_connection_error(self):
+        client = self.make_client([requests.ConnectionError("Connection reset by peer")])
+        with self.assertRaises(requests.ConnectionError):
+            client._request("POST", "/api/v2/command/KickPlayer", json={"PlayerId": "1"})
+        self.assertEqual(client.session.calls, [("POST", "/api/v2/command/KickPlayer")])
+        self.assertTrue(client.api_unreachable)
+
+    def test_post_retried_when_not_sent(self):
+        for error in (refused(), requests.ConnectTimeout("timed out")):
+            with self.subTest(error=error):
+                client = self.make_client([error, make_response(200, {"result": "ok"})])
+                response = client._request("POST", "/api/v2/command/KickPlayer", json={"PlayerId": "1"})
+                self.assertEqual(response.json(), {"result": "ok"})
+                self.assertEqual(client.session.calls, [
+                    ("POST", "/api/v2/command/KickPlayer"),
+                    ("POST", "/api/v2/connect"),
+                    ("POST", "/api/v2/command/KickPlayer"),
+                ])
+                self.assertEqual(client.stats["reconnects"], 1)
+
+    def test_post_missing_key_not_retried(self):
+        client = self.make_client([make_response(200, {"error": "busy"})])
+        response = client._request("POST", "/api/v2/command/KickPlayer", expected_key="result", json={})
+        self.assertEqual(response.json(), {"error": "busy"})
+        self.assertEqual(len(client.session.calls), 1)
+
+    def test_get_retried_after_connection_error(self):
+        client = self.make_client([requests.ConnectionError("Connection reset by peer"),
+                                   make_response(200, {"entries": []})])
+        response = client._request("GET", "/api/v2/logs?seconds=60", expected_key="entries")
+        self.assertEqual(response.json(), {"entries": []})
+        self.assertEqual([path for _, path in client.session.calls],
+                         ["/api/v2/logs?seconds=60", "/api/v2/connect", "/api/v2/logs?seconds=60"])
+
+    def test_unauthorized_relogin(self):
+        for method in ("GET", "POST"):
+            with self.subTest(method=method):
+                client = self.make_client([make_response(401, {}), make_response(200, {"result": "ok"})])
+                response = client._request(method, "/api/v2/command/KickPlayer")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([path for _, path in client.session.calls],
+                                 ["/api/v2/command/KickPlayer", "/api/v2/connect", "/api/v2/command/KickPlayer"])
+                self.assertTrue(client.connected)
+                self.assertEqual(client.session_id, "session-2")
+
+    def test_unauthorized_relogin_fails(self):
+        client = self.make_client([make_response(401, {})])
+        client.connect = lambda: False
+        with self.assertRaises(ConnectionError):
+            client._request("POST", "/api/v2/command/KickPlayer")
+        self.assertFalse(client.connected)
+
+if __name__ == "__main__":
+    unittest.main()
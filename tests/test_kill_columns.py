@@ -0,0 +1,95 @@
+"""
+列式击杀文件测试
+追加的块按列读回后与原始击杀事件一致，按时间范围读取只返回范围内的行，写入中断留下的残缺块在下次追加时截掉
+
+用法:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_parser import LogParser
+from kill_columns import KillColumnReader, append_kill_block, aggregate_kills, valid_length
+
+EPOCH = 1761193883
+
+MESSAGES = [
+    f"[2:58 min ({EPOCH + 20})] KILL: esc—5(Allies/76561198287323037) -> ICE Tea(Axis/76561199130443107) with M1 GARAND",
+    f"[2:57 min ({EPOCH})] KILL: ICE Tea(Axis/76561199130443107) -> esc—5(Allies/76561198287323037) with KARABINER 98K",
+    f"[2:33 min ({EPOCH + 10})] TEAM KILL: 於罔yu(Axis/9cd56a1d6578e8d911076b0933b3d1b6) -> "
+    f"ICE Tea(Axis/76561199130443107) with 150MM HOWITZER [sFH 18]",
+    f"[2:30 min ({EPOCH + 40})] KILL: esc—5(Allies/76561198287323037) -> 於罔yu(Axis/9cd56a1d6578e8d911076b0933b3d1b6) with M1 GARAND",
+]
+
+def expected_row(event) -> dict:
+    return {
+        'epoch': event.epoch,
+        'killer': event.killer,
+        'killer_team': event.killer_team,
+        'killer_id': event.killer_id,
+        'victim': event.victim,
+        'victim_team': event.victim_team,
+        'victim_id': event.victim_id,
+        'weapon': event.weapon,
+        'teamkill': event.teamkill
+    }
+
+class KillColumnsRoundTripTest(unittest.TestCase):
+    """写入列式块后读回"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="kill_columns_test_")
+        self.path = os.path.join(self.directory, "kills_2025-10-23_12.kcol")
+        parser = LogParser()
+        self.events = [parser.parse(message) for message in MESSAGES]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def read_rows(self, start=None, end=None) -> list:
+        with KillColumnReader(self.path) as reader:
+            return [row for block in reader.iter_blocks(start, end) for row in block.rows()]
+
+    def test_round_trip(self):
+        self.assertEqual(append_kill_block(self.path, self.events[:3]), 3)
+        self.assertEqual(append_kill_block(self.path, self.events[3:]), 1)
+
+        # 每个块内按事件时间排序，块按写入顺序排列
+        expected = [expected_row(event) for event in sorted(self.events[:3], key=lambda e: e.epoch)]
+        expected.append(expected_row(self.events[3]))
+        self.assertEqual(self.read_rows(), expected)
+        self.assertTrue(expected[1]['teamkill'])
+
+        # 时间范围在块内二分查找，跳过范围外的块
+        self.assertEqual([row['epoch'] for row in self.read_rows(EPOCH + 5, EPOCH + 20)], [EPOCH + 10, EPOCH + 20])
+        self.assertEqual([row['epoch'] for row in self.read_rows(EPOCH + 30, None)], [EPOCH + 40])
+        self.assertEqual(self.read_rows(EPOCH + 50, None), [])
+
+        with KillColumnReader(self.path) as reader:
+            stats = aggregate_kills(reader.iter_blocks())
+        self.assertEqual(stats['total'], 4)
+        self.assertEqual(stats['kills']['76561198287323037'], 2)
+        self.assertEqual(stats['deaths']['76561199130443107'], 2)
+        self.assertEqual(stats['teamkills']['9cd56a1d6578e8d911076b0933b3d1b6'], 1)
+        self.assertEqual(stats['weapons']['M1 GARAND'], 2)
+        self.assertEqual(stats['names']['9cd56a1d6578e8d911076b0933b3d1b6'], "於罔yu")
+
+    def test_truncates_torn_block(self):
+        append_kill_block(self.path, self.events[:2])
+        length = valid_length(self.path)
+        with open(self.path, 'ab') as f:
+            f.write(b'HKC1\x01\x00torn')
+        self.assertEqual(valid_length(self.path), length)
+        self.assertEqual(len(self.read_rows()), 2)
+
+        append_kill_block(self.path, self.events[2:])
+        self.assertEqual([row['epoch'] for row in self.read_rows()], [EPOCH, EPOCH + 20, EPOCH + 10, EPOCH + 40])
+
+if __name__ == "__main__":
+    unittest.main()
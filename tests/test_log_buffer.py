@@ -0,0 +1,103 @@
+"""
+日志缓存测试
+溢出文件在cache_lock外写入，写入期间被取走的分块不会同时留在溢出文件中
+
+用法:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_entry import LogEntry
+from log_buffer import LogCache, ServerBuffer, InstrumentedLock
+
+def restore(server_name: str, raw_entry: dict) -> LogEntry:
+    """由原始条目重建LogEntry"""
+    return LogEntry.from_api_entry(server_name, raw_entry, {})
+
+def make_logs(server_name: str, count: int) -> list:
+    """生成count条日志"""
+    now = int(time.time())
+    return [restore(server_name, {"timestamp": f"[{now}]", "message": f"[{now}] msg {i}"}) for i in range(count)]
+
+class LogCacheSpillTest(unittest.TestCase):
+    """超出内存上限时的溢出"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="buffer_test_")
+        self.cache = LogCache(self.directory, restore, max_entries=100)
+        self.cache_lock = InstrumentedLock("cache_lock")
+        self.cache.add_server("s1")
+        self.original_write_spill = ServerBuffer.write_spill
+
+    def tearDown(self):
+        ServerBuffer.write_spill = self.original_write_spill
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def extend(self, count: int) -> bool:
+        with self.cache_lock:
+            return self.cache.extend("s1", make_logs("s1", count))
+
+    def test_spill_writes_outside_lock(self):
+        original_write_spill = self.original_write_spill
+        held = []
+        def write_spill(buffer, chunk, seq):
+            held.append(self.cache_lock._lock.locked())
+            # 写入期间收集线程可以继续追加
+            self.extend(10)
+            return original_write_spill(buffer, chunk, seq)
+        ServerBuffer.write_spill = write_spill
+
+        self.assertTrue(self.extend(150))
+        self.cache.enforce_budget(self.cache_lock)
+
+        self.assertEqual(held, [False])
+        buffer = self.cache["s1"]
+        self.assertEqual(buffer.spilled_entries, 150)
+        self.assertEqual(buffer.memory_entries, 10)
+        self.assertEqual(len(buffer.chunks), 2)
+        self.assertEqual([log.message.rsplit(' ', 1)[1] for log in self.cache.load("s1", buffer.chunks[0])][:3],
+                         ["0", "1", "2"])
+
+    def test_chunk_taken_during_spill_stays_in_memory(self):
+        original_write_spill = self.original_write_spill
+        taken = []
+        def write_spill(buffer, chunk, seq):
+            with self.cache_lock:
+                taken.extend(buffer.take())
+            return original_write_spill(buffer, chunk, seq)
+        ServerBuffer.write_spill = write_spill
+
+        self.extend(150)
+        self.cache.enforce_budget(self.cache_lock)
+
+        buffer = self.cache["s1"]
+        self.assertEqual(buffer.spilled_entries, 0)
+        self.assertEqual(buffer.memory_entries, 150)
+        self.assertIsNotNone(taken[0].logs)
+        self.assertEqual(os.listdir(os.path.join(self.directory, "s1")), [])
+
+    def test_spill_failure_keeps_logs_in_memory(self):
+        def write_spill(buffer, chunk, seq):
+            raise OSError("disk full")
+        ServerBuffer.write_spill = write_spill
+
+        self.extend(150)
+        self.cache.enforce_budget(self.cache_lock)
+
+        # 溢出失败后丢弃到上限的DROP_WATERMARK以下
+        stats = self.cache.get_stats()
+        self.assertEqual(stats['spill_errors'], 1)
+        self.assertEqual(stats['dropped_entries'], 60)
+        self.assertEqual(stats['memory_entries'], 90)
+        self.assertFalse(any(chunk.spilling for chunk in self.cache["s1"].chunks))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+"""
+收集器游标测试
+早于游标的迟到日志在去重窗口内仍被收集，收集过的日志不会重复
+
+用法:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import time
+import logging
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_collector import LogCollector
+
+logging.disable(logging.CRITICAL)
+
+def make_entry(epoch: int, text: str) -> dict:
+    """生成一条API返回的聊天日志"""
+    return {"timestamp": f"[{epoch}]",
+            "message": f"[1:00 min ({epoch})] CHAT[Team][A(Allies/76561190000000001)]: {text}"}
+
+class LogCursorTest(unittest.TestCase):
+    """按游标和去重索引过滤拉取结果"""
+
+    def setUp(self):
+        self.collector = LogCollector({
+            "servers": [{"name": "s1", "host": "127.0.0.1", "port": 1, "password": "x"}],
+            "log_settings": {"dedupe_window_seconds": 600}
+        })
+        self.now = int(time.time())
+
+    def ingest(self, entries: list) -> list:
+        logs = self.collector._ingest_logs("s1", entries, time.time(), 60)
+        return [log.raw_data["message"].rsplit(": ", 1)[1] for log in logs]
+
+    def test_late_entries_are_collected_once(self):
+        self.assertEqual(self.ingest([make_entry(self.now - 10, "a"), make_entry(self.now, "b")]), ["a", "b"])
+
+        # 下一次拉取返回一条事件时间早于游标的迟到日志
+        late = make_entry(self.now - 5, "late")
+        self.assertEqual(self.ingest([make_entry(self.now - 10, "a"), late, make_entry(self.now, "b")]), ["late"])
+        self.assertEqual(self.ingest([late, make_entry(self.now, "b")]), [])
+
+    def test_entries_older_than_dedupe_window_are_dropped(self):
+        self.ingest([make_entry(self.now, "b")])
+        self.assertEqual(self.ingest([make_entry(self.now - 601, "old"), make_entry(self.now - 599, "recent")]),
+                         ["recent"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""
+玩家索引测试
+保存原始日志时写入的索引项能按玩家ID和时间范围读回对应的日志行，重新生成索引后结果不变
+
+用法:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_manager import LogManager
+
+EPOCH = 1761193883
+PLAYER = "76561198287323037"
+
+def make_logs() -> list:
+    """同一个玩家在两个小时内的击杀和进入日志，以及一条其他玩家的聊天"""
+    return [
+        {"timestamp": "2025-10-23T04:34:21.310Z",
+         "message": f"[2:58 min ({EPOCH})] KILL: esc(Allies/{PLAYER}) -> ICE Tea(Axis/76561199130443107) with M1 GARAND"},
+        {"timestamp": "2025-10-23T04:34:21.310Z",
+         "message": f"[2:47 min ({EPOCH + 10})] CHAT[Team][mrgeorge(Axis/02339d3b7647c9bfd89cca2ce1fa9813)]: KKKKK"},
+        {"timestamp": "2025-10-23T05:34:21.310Z",
+         "message": f"[2:49 min ({EPOCH + 3600})] CONNECTED esc ({PLAYER})"},
+    ]
+
+class PlayerIndexRoundTripTest(unittest.TestCase):
+    """写入索引后按玩家读回日志"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="player_index_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def lookup(self, manager: LogManager, player_id: str, start: int, end: int) -> list:
+        return [entry["message"] for entry in manager.find_player_logs(
+            "s1", player_id, datetime.fromtimestamp(start), datetime.fromtimestamp(end))]
+
+    def check_round_trip(self, storage_format: str):
+        manager = LogManager(os.path.join(self.directory, storage_format), storage_format=storage_format,
+                             player_index=True)
+        self.addCleanup(manager.close)
+        logs = make_logs()
+        self.assertEqual(manager.save_logs("s1", logs), 3)
+
+        expected = [logs[0]["message"], logs[2]["message"]]
+        self.assertEqual(self.lookup(manager, PLAYER, EPOCH - 60, EPOCH + 7200), expected)
+        self.assertEqual(self.lookup(manager, PLAYER, EPOCH + 1, EPOCH + 7200), expected[1:])
+        self.assertEqual(self.lookup(manager, "02339d3b7647c9bfd89cca2ce1fa9813", EPOCH - 60, EPOCH + 60),
+                         [logs[1]["message"]])
+        self.assertEqual(self.lookup(manager, "76561190000000000", EPOCH - 60, EPOCH + 7200), [])
+
+        # 重新生成的索引与保存时写入的一致
+        self.assertEqual(manager.player_index.rebuild(["s1"]), {"s1": 4})
+        self.assertEqual(self.lookup(manager, PLAYER, EPOCH - 60, EPOCH + 7200), expected)
+
+    def test_jsonl_round_trip(self):
+        self.check_round_trip("jsonl")
+
+    def test_json_round_trip(self):
+        self.check_round_trip("json")
+
+if __name__ == "__main__":
+    unittest.main()
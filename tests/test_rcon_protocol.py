@@ -0,0 +1,93 @@
+"""
+RCON V2协议测试
+客户端和模拟服务器各自实现数据包格式和XOR加密，用固定的测试向量分别检查，再互相通信；
+连接断开后只重新发送只读命令
+
+用法:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hll_rcon_client
+import rcon_fake_server
+from hll_rcon_client import HLLRconClient
+from rcon_fake_server import FakeRconServer
+
+# (明文, 密钥, 密文)
+XOR_VECTORS = [
+    (b"", b"\x01\x02", b""),
+    (b"ab", b"\x01\x02", b"``"),
+    (b"hello", b"\xff", b"\x97\x9a\x93\x93\x90"),
+    (b'{"Name":"Login"}', b"\x10\x20\x30", b"k\x02~qMU2\x1a\x12\\OWyN\x12m"),
+]
+
+class RconProtocolTest(unittest.TestCase):
+    """客户端和模拟服务器的编码与测试向量一致"""
+
+    def test_xor_vectors(self):
+        for plain, key, cipher in XOR_VECTORS:
+            self.assertEqual(hll_rcon_client.xor_cipher(plain, key), cipher)
+            self.assertEqual(rcon_fake_server.xor_bytes(plain, key), cipher)
+            self.assertEqual(rcon_fake_server.xor_bytes(cipher, key), plain)
+
+    def test_frame_header(self):
+        expected = b"\x07\x00\x00\x00\x2a\x01\x00\x00"
+        self.assertEqual(hll_rcon_client.HEADER.pack(7, 298), expected)
+        self.assertEqual(rcon_fake_server.FRAME_HEADER.pack(7, 298), expected)
+
+    def test_client_against_fake_server(self):
+        async def run():
+            server = FakeRconServer(password="pw")
+            port = await server.start()
+            client = HLLRconClient("127.0.0.1", port, "pw", timeout=5)
+            try:
+                self.assertTrue(await client.connect())
+                logs = await client.get_admin_logs(seconds=300)
+            finally:
+                await client.disconnect()
+                await server.stop()
+            self.assertEqual(len(logs), 3)
+            self.assertIn("Login", server.received_commands)
+
+        asyncio.run(run())
+
+    def test_mutating_command_not_resent_after_reconnect(self):
+        async def run():
+            server = FakeRconServer(password="pw")
+            # 服务器收到踢人命令后不响应，客户端在等待响应时连接断开
+            original_respond = server._respond
+            async def respond(writer, write_lock, request_id, request):
+                if request.get("Name") == "KickPlayer":
+                    await asyncio.Event().wait()
+                await original_respond(writer, write_lock, request_id, request)
+            server._respond = respond
+            port = await server.start()
+            client = HLLRconClient("127.0.0.1", port, "pw", timeout=5)
+            try:
+                self.assertTrue(await client.connect())
+                kick = asyncio.ensure_future(client.send_command("KickPlayer", PlayerId="76561197960287930"))
+                while "KickPlayer" not in server.received_commands:
+                    await asyncio.sleep(0.01)
+                server.drop_connections()
+
+                self.assertIsNone(await kick)
+                # 重连后只读命令正常执行
+                logs = await client.get_admin_logs(seconds=300)
+            finally:
+                await client.disconnect()
+                await server.stop()
+            self.assertEqual(server.received_commands.count("KickPlayer"), 1)
+            self.assertEqual(server.received_commands.count("Login"), 2)
+            self.assertEqual(client.stats["requests_not_resent"], 1)
+            self.assertEqual(len(logs), 3)
+
+        asyncio.run(run())
+
+if __name__ == "__main__":
+    unittest.main()
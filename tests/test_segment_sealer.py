@@ -0,0 +1,95 @@
+"""
+分段封存测试
+封存后的分段读回的内容与原文件一致；已有封存文件时迟到的日志作为新的压缩流追加（json格式合并），
+拼接后的压缩流按写入顺序读回
+
+用法:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from segment_io import (
+    SegmentWriterPool, append_jsonl, available_compressions, read_segment, segment_files, write_json_atomic
+)
+from segment_sealer import SegmentSealer, COMPRESSION_EXTENSIONS
+
+logging.disable(logging.CRITICAL)
+
+def make_entries(start: int, count: int) -> list:
+    return [{"timestamp": f"[{i}]", "message": f"[{i}] msg {i} 中文"} for i in range(start, start + count)]
+
+class SegmentSealerTest(unittest.TestCase):
+    """封存和再次封存"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="sealer_test_")
+        self.pool = SegmentWriterPool()
+
+    def tearDown(self):
+        self.pool.close_all()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_sealer(self, compression: str) -> SegmentSealer:
+        return SegmentSealer(self.directory, [self.pool], compression=compression)
+
+    def test_reseal_jsonl_appends_stream(self):
+        for compression in available_compressions():
+            with self.subTest(compression=compression):
+                sealer = self.make_sealer(compression)
+                path = os.path.join(self.directory, f"hll_logs_2025-10-23_12_{compression}.jsonl")
+                sealed_path = path + COMPRESSION_EXTENSIONS[compression]
+                first, late, later = make_entries(0, 3), make_entries(3, 2), make_entries(5, 2)
+
+                append_jsonl(path, first)
+                self.assertTrue(sealer.seal_file(path))
+                self.assertFalse(os.path.exists(path))
+                self.assertEqual(read_segment(sealed_path), first)
+
+                # 封存后写入的迟到日志（最后一行写入中断）
+                append_jsonl(path, late)
+                with open(path, 'ab') as f:
+                    f.write(b'{"timestamp": "[9]", "mess')
+                self.assertEqual(segment_files(path), [sealed_path, path])
+                self.assertTrue(sealer.seal_file(path))
+
+                append_jsonl(path, later)
+                self.assertTrue(sealer.seal_file(path))
+                self.assertEqual(segment_files(path), [sealed_path])
+                # 残缺的行单独成行被跳过，之后的压缩流仍能读取
+                self.assertEqual(read_segment(sealed_path), first + late + later)
+
+    def test_reseal_json_merges(self):
+        sealer = self.make_sealer("gzip")
+        path = os.path.join(self.directory, "kills_2025-10-23_12.json")
+        first, late = make_entries(0, 3), make_entries(3, 2)
+
+        write_json_atomic(path, first)
+        self.assertTrue(sealer.seal_file(path))
+        write_json_atomic(path, late)
+        self.assertTrue(sealer.seal_file(path))
+        self.assertEqual(read_segment(path + ".gz"), first + late)
+        self.assertEqual(sealer.stats['sealed_files'], 2)
+
+    def test_open_segment_not_sealed(self):
+        sealer = self.make_sealer("gzip")
+        path = os.path.join(self.directory, "hll_logs_2025-10-23_12.jsonl")
+        self.pool.append(path, make_entries(0, 2), group="s1", hour_key=12)
+
+        self.assertFalse(sealer.seal_file(path))
+        self.assertEqual(sealer.stats['skipped_open'], 1)
+        self.assertEqual(segment_files(path), [path])
+
+        self.pool.close_all()
+        self.assertTrue(sealer.seal_file(path))
+        self.assertEqual(read_segment(path + ".gz"), make_entries(0, 2))
+
+if __name__ == "__main__":
+    unittest.main()
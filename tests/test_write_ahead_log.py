@@ -0,0 +1,183 @@
+"""
+预写日志测试
+输出写入失败时WAL必须保留，崩溃重启后重放保存全部日志，保存成功后才删除旧的WAL文件
+
+用法:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import glob
+import time
+import errno
+import shutil
+import logging
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import log_manager
+from log_collector import LogCollector
+from segment_io import read_segment
+from write_ahead_log import read_records
+
+logging.disable(logging.CRITICAL)
+
+class WriteAheadLogCheckpointTest(unittest.TestCase):
+    """WAL检查点只在输出确认写入后删除文件"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="wal_test_")
+        self.collectors = []
+
+    def tearDown(self):
+        for collector in self.collectors:
+            collector.wal.close()
+            collector.log_manager.close()
+            collector.categorized_log_manager.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_collector(self) -> LogCollector:
+        """创建启用预写日志的收集器（不启动收集线程），返回前已打开WAL"""
+        config = {
+            "servers": [{"name": "s1", "host": "127.0.0.1", "port": 1, "password": "x"}],
+            "log_settings": {
+                "logs_directory": self.directory,
+                "storage_format": "jsonl",
+                "write_ahead_log": True,
+                "seal_segments": False,
+                "save_interval": 60
+            }
+        }
+        collector = LogCollector(config)
+        self.collectors.append(collector)
+        return collector
+
+    def cache_logs(self, collector: LogCollector, count: int):
+        """缓存count条聊天日志并等待WAL同步"""
+        now = int(time.time())
+        entries = [
+            {"timestamp": f"[{now}]",
+             "message": f"[{now}] CHAT[Team][Player{i}(Allies/7656119{i:010d})]: msg {i}"}
+            for i in range(count)
+        ]
+        lsn = collector._cache_logs("s1", [collector._restore_entry("s1", entry) for entry in entries])
+        self.assertTrue(collector.wal.wait_durable(lsn, timeout=5))
+
+    def wal_entries(self) -> int:
+        """WAL目录中所有完整记录的日志条数"""
+        return sum(
+            len(entries)
+            for file_path in glob.glob(os.path.join(self.directory, ".wal", "*.wal"))
+            for _, entries in read_records(file_path)[0]
+        )
+
+    def raw_messages(self) -> list:
+        """已保存的原始日志消息"""
+        return [
+            entry["message"]
+            for file_path in sorted(glob.glob(os.path.join(self.directory, "s1", "**", "hll_logs*.jsonl"),
+                                              recursive=True))
+            for entry in read_segment(file_path)
+        ]
+
+    def fail_writes(self, collector: LogCollector):
+        """模拟磁盘已满：两个日志管理器的所有写入都抛出ENOSPC"""
+        def fail(*args, **kwargs):
+            raise OSError(errno.ENOSPC, "No space left on device")
+        for pool in (collector.log_manager.writer_pool, collector.categorized_log_manager.writer_pool):
+            pool.append = pool.append_lines = fail
+
+    def test_failing_sink_keeps_wal(self):
+        collector = self.make_collector()
+        collector.wal.open()
+        self.cache_logs(collector, 100)
+        self.fail_writes(collector)
+
+        collector._save_all_cached_logs()
+
+        self.assertEqual(collector.get_status()["writer"]["entries_written"], 0)
+        self.assertEqual(len(collector.log_cache["s1"]), 100)
+        self.assertEqual(self.wal_entries(), 100)
+
+    def test_replay_after_crash(self):
+        collector = self.make_collector()
+        collector.wal.open()
+        self.cache_logs(collector, 100)
+        self.fail_writes(collector)
+        collector._save_all_cached_logs()
+        # 崩溃：缓存丢失，没有停止收集器
+
+        restarted = self.make_collector()
+        with restarted.cache_lock:
+            restarted.log_cache.discard_spilled()
+        restarted._replay_wal(restarted.wal.open())
+
+        messages = self.raw_messages()
+        self.assertEqual(len(messages), 100)
+        self.assertEqual(len(set(messages)), 100)
+        self.assertEqual(len(restarted.log_cache["s1"]), 0)
+        self.assertEqual(self.wal_entries(), 0)
+
+    def test_replay_failure_keeps_wal(self):
+        collector = self.make_collector()
+        collector.wal.open()
+        self.cache_logs(collector, 100)
+
+        restarted = self.make_collector()
+        self.fail_writes(restarted)
+        restarted._replay_wal(restarted.wal.open())
+
+        self.assertEqual(self.raw_messages(), [])
+        self.assertEqual(len(restarted.log_cache["s1"]), 100)
+        self.assertEqual(self.wal_entries(), 100)
+
+    def test_sync_failure_keeps_wal(self):
+        collector = self.make_collector()
+        collector.wal.open()
+        self.cache_logs(collector, 100)
+
+        original_sync_files = log_manager.sync_files
+        def fail(file_paths):
+            raise OSError(errno.EIO, "Input/output error")
+        log_manager.sync_files = fail
+        try:
+            collector._save_all_cached_logs()
+        finally:
+            log_manager.sync_files = original_sync_files
+
+        self.assertEqual(len(self.raw_messages()), 100)
+        self.assertEqual(self.wal_entries(), 100)
+        self.assertTrue(collector.log_manager._unsynced_files)
+
+        # 下一个检查点同步了上次失败的文件后删除WAL
+        self.cache_logs(collector, 10)
+        collector._save_all_cached_logs()
+        collector._save_all_cached_logs()
+        self.assertEqual(self.wal_entries(), 0)
+
+    def test_fsync_failure_is_not_durable(self):
+        collector = self.make_collector()
+        collector.wal.open()
+        self.cache_logs(collector, 10)
+
+        def fail(fd):
+            raise OSError(errno.EIO, "Input/output error")
+        collector.wal._fsync = fail
+        now = int(time.time())
+        entry = {"timestamp": f"[{now}]",
+                 "message": f"[{now}] CHAT[Team][Player(Allies/76561190000000000)]: after failure"}
+        lsn = collector._cache_logs("s1", [collector._restore_entry("s1", entry)])
+
+        # fsync失败后的记录不能确认落盘，之前已经同步的记录不受影响
+        with self.assertRaises(OSError):
+            collector.wal.wait_durable(lsn, timeout=5)
+        self.assertTrue(collector.wal.wait_durable(lsn - 1, timeout=5))
+        self.assertEqual(collector.wal.get_stats()["fsync_errors"], 1)
+        with self.assertRaises(OSError):
+            collector.wal.wait_durable(lsn, timeout=5)
+
+if __name__ == "__main__":
+    unittest.main()
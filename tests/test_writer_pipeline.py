@@ -0,0 +1,140 @@
+"""
+批量写入管道测试
+写入失败的服务器等待max_batch_age后重试，取走的分块在任何失败后都回到缓存，
+分类日志部分写入失败后重试时不重复写入已成功的类型和小时
+
+用法:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_entry import LogEntry
+from log_buffer import LogCache, InstrumentedLock
+from log_classifier import LogType
+from log_parser import LogParser
+from categorized_log_manager import CategorizedLogManager
+from writer_pipeline import WriterPipeline
+
+def restore(server_name: str, raw_entry: dict) -> LogEntry:
+    """由原始条目重建LogEntry"""
+    return LogEntry.from_api_entry(server_name, raw_entry, {})
+
+def make_logs(server_name: str, count: int) -> list:
+    """生成count条日志"""
+    now = int(time.time())
+    return [restore(server_name, {"timestamp": f"[{now}]", "message": f"[{now}] msg {i}"}) for i in range(count)]
+
+class WriterPipelineRetryTest(unittest.TestCase):
+    """写入失败后的重试"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="writer_test_")
+        self.cache = LogCache(self.directory, restore)
+        self.cache_lock = InstrumentedLock("cache_lock")
+        self.cache.add_server("s1")
+        self.calls = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def failing_sink(self, server_name: str, logs: list):
+        self.calls += 1
+        raise OSError("disk full")
+
+    def add_logs(self, pipeline: WriterPipeline, count: int):
+        with self.cache_lock:
+            self.cache.extend("s1", make_logs("s1", count))
+            pending = len(self.cache["s1"])
+        pipeline.notify("s1", pending)
+
+    def test_failed_server_waits_for_max_batch_age(self):
+        pipeline = WriterPipeline(self.cache, self.cache_lock, max_batch_entries=10, max_batch_age=0.5)
+        pipeline.register_sink("raw", self.failing_sink)
+        pipeline.start()
+        try:
+            self.add_logs(pipeline, 20)
+            time.sleep(0.25)
+            # 第一次按批次大小写入失败，之后即使还有新日志也不立即重试
+            self.assertEqual(self.calls, 1)
+            self.add_logs(pipeline, 20)
+            time.sleep(0.1)
+            self.assertEqual(self.calls, 1)
+            time.sleep(0.5)
+            self.assertEqual(self.calls, 2)
+        finally:
+            pipeline.stop()
+        self.assertEqual(len(self.cache["s1"]), 40)
+
+    def test_load_error_releases_chunks(self):
+        pipeline = WriterPipeline(self.cache, self.cache_lock, max_batch_entries=10, max_batch_age=60)
+        written = []
+        pipeline.register_sink("raw", lambda server_name, logs: written.extend(logs))
+        self.add_logs(pipeline, 20)
+
+        original_load = self.cache.load
+        def fail(server_name, chunk):
+            raise FileNotFoundError("spill file missing")
+        self.cache.load = fail
+        pipeline.flush_all()
+        self.assertEqual(pipeline.stats['failed_flushes'], 1)
+        with self.cache_lock:
+            self.assertFalse(any(chunk.saving for chunk in self.cache["s1"].chunks))
+
+        # 取走的分块已归还，下次写入成功
+        self.cache.load = original_load
+        pipeline.flush_all()
+        self.assertEqual(len(written), 20)
+        self.assertEqual(len(self.cache["s1"]), 0)
+
+    def test_categorized_retry_skips_written_parts(self):
+        manager = CategorizedLogManager(os.path.join(self.directory, "logs"), storage_format="jsonl",
+                                        kill_columns=True)
+        self.addCleanup(manager.close)
+        pipeline = WriterPipeline(self.cache, self.cache_lock, max_batch_entries=100, max_batch_age=60)
+        pipeline.register_sink("categorized", manager.save_categorized_logs, partial=True)
+
+        epoch = 1761193883
+        messages = [
+            f"[2:58 min ({epoch})] KILL: A{i}(Allies/7656119828732303{i}) -> B{i}(Axis/7656119913044310{i}) with M1 GARAND"
+            for i in range(3)
+        ] + [f"[2:47 min ({epoch})] CHAT[Team][C{i}(Axis/7656119913044320{i})]: hello {i}" for i in range(2)]
+        parser = LogParser(manager.classifier)
+        logs = [LogEntry.from_api_entry("s1", {"timestamp": f"[{epoch}]", "message": m}, parser.parse(m))
+                for m in messages]
+        with self.cache_lock:
+            self.cache.extend("s1", logs)
+
+        # 击杀写入成功后聊天写入失败
+        original_append = manager.writer_pool.append
+        def fail_chat(file_path, *args, **kwargs):
+            if os.path.basename(file_path).startswith("chat"):
+                raise IOError("disk full")
+            return original_append(file_path, *args, **kwargs)
+        manager.writer_pool.append = fail_chat
+        pipeline.flush_all()
+        self.assertEqual(len(self.cache["s1"]), 5)
+
+        manager.writer_pool.append = original_append
+        pipeline.flush_all()
+        self.assertEqual(len(self.cache["s1"]), 0)
+
+        hour = datetime.fromtimestamp(epoch).replace(minute=0, second=0, microsecond=0)
+        self.assertEqual(len(manager.get_categorized_logs("s1", LogType.KILL, hour)), 3)
+        self.assertEqual(len(manager.get_categorized_logs("s1", LogType.CHAT, hour)), 2)
+        kill_rows = sum(len(block) for block in manager.read_kill_columns("s1", hour, hour.replace(minute=59)))
+        self.assertEqual(kill_rows, 3)
+        counts = manager.aggregates.count("s1", hour, hour.replace(minute=59))
+        self.assertEqual(counts.get(LogType.KILL.value), 3)
+        self.assertEqual(counts.get(LogType.CHAT.value), 2)
+
+if __name__ == "__main__":
+    unittest.main()
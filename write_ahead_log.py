@@ -0,0 +1,390 @@
+"""
+预写日志（WAL）
+拉取到的新日志在进入内存缓存的同时追加到预写日志文件中，进程崩溃后重启时重放到日志文件，
+保存间隔内的缓存不会丢失。
+
+每条记录带长度和CRC32校验（一次拉取一条记录）：
+    长度(uint32) | CRC32(uint32) | JSON: {"server": 服务器, "entries": [API返回的原始条目, ...]}
+写入中断只会留下残缺的最后一条记录，重放时校验失败的记录及其之后的内容会被跳过。
+
+fsync使用组提交：后台线程在未同步的数据达到sync_bytes或最早的未同步记录等待了sync_interval秒后
+执行一次fsync，期间到达的所有记录共用这一次fsync。
+
+缓存保存到日志文件之前切换到新的WAL文件（rotate，只切换文件句柄，旧文件由同步线程fsync后关闭），
+保存完成后删除之前的文件（discard_before）:
+    logs/.wal/00000001.wal
+"""
+
+import os
+import json
+import time
+import zlib
+import struct
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+
+RECORD_HEADER = struct.Struct('<II')  # 长度, CRC32
+WAL_EXTENSION = ".wal"
+
+def encode_record(server_name: str, entries: List[Dict[str, Any]]) -> bytes:
+    """编码一条预写日志记录"""
+    payload = json.dumps({"server": server_name, "entries": entries}, ensure_ascii=False,
+                         separators=(',', ':')).encode('utf-8')
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+def read_records(file_path: str) -> Tuple[List[Tuple[str, List[Dict[str, Any]]]], int, bool]:
+    """
+    读取预写日志文件中的完整记录
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        Tuple[List, int, bool]: ([(服务器, 原始条目列表), ...], 有效内容的长度, 是否有残缺或损坏的记录)
+    """
+    with open(file_path, 'rb') as f:
+        data = f.read()
+
+    records = []
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        length, crc = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            break
+        try:
+            record = json.loads(payload)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            break
+        records.append((record.get("server", ""), record.get("entries", [])))
+        offset = start + length
+    return records, offset, offset != len(data)
+
+class WriteAheadLog:
+    """
+    带组提交的预写日志
+
+    append写入记录（不等待fsync）并返回序号，wait_durable等待该序号之前的记录同步到磁盘
+    """
+
+    def __init__(self, directory: str, sync_interval: float = 0.05, sync_bytes: int = 1024 * 1024,
+                 fsync: bool = True):
+        """
+        初始化预写日志
+
+        Args:
+            directory: WAL文件目录
+            sync_interval: 最早的未同步记录最多等待多少秒后fsync
+            sync_bytes: 未同步的数据达到多少字节后立即fsync
+            fsync: 是否fsync，关闭时只写入操作系统缓存（进程崩溃不丢失，断电可能丢失）
+        """
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.sync_bytes = sync_bytes
+        self.fsync = fsync
+        self.logger = logging.getLogger("WriteAheadLog")
+
+        self._cond = threading.Condition()
+        self._file = None
+        self._file_seq = 0
+        self._file_records = 0  # 当前文件中的记录数
+        self._written_lsn = 0   # 最后写入的记录序号
+        self._durable_lsn = 0   # 已同步到磁盘的记录序号
+        self._pending_bytes = 0
+        self._first_pending: Optional[float] = None
+        self._retired: List[Any] = []  # rotate换下、等待同步线程fsync后关闭的文件
+        self._directory_dirty = False  # 新建的文件还没有同步目录项
+        self._syncing = False
+        self._closing = False
+        # fsync失败后内核可能已经丢弃了未写入的页，重试fsync也无法保证之前的记录落盘，之后的wait_durable都失败
+        self._sync_error: Optional[OSError] = None
+        self._flusher: Optional[threading.Thread] = None
+
+        # 统计信息
+        self.stats = {
+            'records': 0,
+            'bytes': 0,
+            'fsyncs': 0,
+            'fsync_seconds': 0.0,
+            'max_fsync_ms': 0.0,
+            'fsync_errors': 0,
+            'replayed_records': 0,
+            'torn_files': 0
+        }
+
+    def _file_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:08d}{WAL_EXTENSION}")
+
+    def _existing_seqs(self) -> List[int]:
+        seqs = []
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(WAL_EXTENSION) and name[:-len(WAL_EXTENSION)].isdigit():
+                    seqs.append(int(name[:-len(WAL_EXTENSION)]))
+        return sorted(seqs)
+
+    def open(self) -> int:
+        """
+        打开新的WAL文件并启动同步线程，已有的文件保留用于重放
+
+        Returns:
+            int: 新文件的序号，小于该序号的文件是上次运行留下的
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with self._cond:
+            existing = self._existing_seqs()
+            self._open_file((existing[-1] if existing else 0) + 1)
+            self._closing = False
+        if self.fsync:
+            self._sync_directory()
+            self._directory_dirty = False
+        self._flusher = threading.Thread(target=self._flush_loop, name="wal-flusher", daemon=True)
+        self._flusher.start()
+        return self._file_seq
+
+    def _open_file(self, seq: int):
+        """打开（创建）WAL文件，调用时持有self._cond，目录项由同步线程在下一次fsync时同步"""
+        self._file = open(self._file_path(seq), 'ab')
+        self._file_seq = seq
+        self._file_records = 0
+        self._directory_dirty = self.fsync
+
+    def _sync_directory(self):
+        """同步目录项，保证新建的文件在断电后仍然存在"""
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def append(self, server_name: str, entries: List[Dict[str, Any]]) -> int:
+        """
+        追加一条记录（写入操作系统缓存，由同步线程批量fsync）
+
+        Args:
+            server_name: 服务器名称
+            entries: API返回的原始日志条目
+
+        Returns:
+            int: 记录序号，传给wait_durable等待其同步到磁盘
+        """
+        return self.append_encoded(encode_record(server_name, entries))
+
+    def append_encoded(self, record: bytes) -> int:
+        """
+        追加一条已编码的记录（encode_record的结果），调用方可以在持有其他锁之前完成编码
+
+        Returns:
+            int: 记录序号
+        """
+        with self._cond:
+            if self._file is None:
+                raise RuntimeError("预写日志未打开")
+            self._file.write(record)
+            self._file.flush()
+            self._written_lsn += 1
+            self._file_records += 1
+            self._pending_bytes += len(record)
+            if self._first_pending is None:
+                self._first_pending = time.monotonic()
+            self.stats['records'] += 1
+            self.stats['bytes'] += len(record)
+            if not self.fsync:
+                self._durable_lsn = self._written_lsn
+            self._cond.notify_all()
+            return self._written_lsn
+
+    def wait_durable(self, lsn: int, timeout: Optional[float] = None) -> bool:
+        """
+        等待记录同步到磁盘（组提交：同一批记录共用一次fsync）
+
+        Args:
+            lsn: append返回的记录序号
+            timeout: 最多等待的秒数
+
+        Returns:
+            bool: 是否已同步
+
+        Raises:
+            OSError: fsync失败，记录没有同步到磁盘
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._durable_lsn < lsn and self._file is not None:
+                if self._sync_error is not None:
+                    raise OSError(f"预写日志fsync失败，记录 {lsn} 没有同步到磁盘: {self._sync_error}")
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return self._durable_lsn >= lsn
+
+    def _flush_loop(self):
+        """同步线程：等待未同步的数据达到sync_bytes或等待时间达到sync_interval后fsync"""
+        while True:
+            with self._cond:
+                while not self._closing and not self._retired and not self._needs_sync():
+                    self._cond.wait()
+                if self._closing and not self._retired and not self._needs_sync():
+                    return
+                if self._sync_error is not None:
+                    # 已经无法保证落盘：只关闭换下的文件
+                    retired, self._retired = self._retired, []
+                    for f in retired:
+                        f.close()
+                    continue
+                while (not self._closing and self._first_pending is not None
+                       and self._pending_bytes < self.sync_bytes):
+                    remaining = self._first_pending + self.sync_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                target = self._written_lsn
+                files = self._retired + [self._file]
+                self._retired = []
+                sync_directory = self._directory_dirty
+                self._directory_dirty = False
+                self._pending_bytes = 0
+                self._first_pending = None
+                self._syncing = True
+
+            # fsync时不持有锁，其他线程可以继续追加（它们等待下一次fsync）
+            error = None
+            try:
+                for f in files:
+                    self._fsync(f.fileno())
+                if sync_directory:
+                    self._sync_directory()
+            except OSError as e:
+                error = e
+                self.logger.error(f"预写日志fsync失败，之后的记录不再确认落盘: {e}")
+            finally:
+                with self._cond:
+                    for f in files[:-1]:
+                        f.close()
+                    self._syncing = False
+                    if error is not None:
+                        self._sync_error = error
+                        self.stats['fsync_errors'] += 1
+                    elif self._sync_error is None:
+                        # 只有全部文件和目录都同步成功后才确认
+                        self._durable_lsn = max(self._durable_lsn, target)
+                    self._cond.notify_all()
+
+    def _needs_sync(self) -> bool:
+        """是否有未同步的记录需要同步线程处理（fsync失败后不再同步），调用时持有self._cond"""
+        return self._written_lsn != self._durable_lsn and self._sync_error is None
+
+    def _fsync(self, fd: int):
+        start = time.perf_counter()
+        os.fsync(fd)
+        elapsed = time.perf_counter() - start
+        self.stats['fsyncs'] += 1
+        self.stats['fsync_seconds'] += elapsed
+        self.stats['max_fsync_ms'] = max(self.stats['max_fsync_ms'], elapsed * 1000)
+
+    def rotate(self) -> int:
+        """
+        之后的记录写入新文件，当前文件交给同步线程fsync后关闭（不在调用线程中做磁盘同步）
+
+        当前文件中没有记录时（例如日志文件不可写、缓存中只有之前的日志）不切换
+
+        Returns:
+            int: 新文件的序号，保存完当前缓存后可以删除小于该序号的文件
+        """
+        with self._cond:
+            if self._file is None:
+                raise RuntimeError("预写日志未打开")
+            if self._file_records == 0:
+                return self._file_seq
+            if self.fsync:
+                self._retired.append(self._file)
+            else:
+                self._file.close()
+            self._open_file(self._file_seq + 1)
+            self._cond.notify_all()
+            return self._file_seq
+
+    def discard_before(self, seq: int):
+        """删除序号小于seq的WAL文件（其中的日志已保存到日志文件）"""
+        for old_seq in self._existing_seqs():
+            if old_seq >= seq:
+                break
+            try:
+                os.remove(self._file_path(old_seq))
+            except FileNotFoundError:
+                pass
+
+    def replay(self, before_seq: int) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        按写入顺序读取序号小于before_seq的WAL文件中的记录
+
+        Args:
+            before_seq: open返回的序号
+
+        Yields:
+            Tuple[str, List[Dict]]: (服务器名称, API返回的原始条目列表)
+        """
+        for seq in self._existing_seqs():
+            if seq >= before_seq:
+                break
+            file_path = self._file_path(seq)
+            records, _, torn = read_records(file_path)
+            if torn:
+                self.stats['torn_files'] += 1
+                self.logger.warning(f"预写日志 {file_path} 末尾有残缺的记录，已跳过")
+            self.stats['replayed_records'] += len(records)
+            yield from records
+
+    def close(self):
+        """同步剩余的记录，停止同步线程并关闭文件"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if self._flusher is not None:
+            self._flusher.join(timeout=10)
+            self._flusher = None
+        with self._cond:
+            if self._file is not None:
+                try:
+                    if self._sync_error is None:
+                        for f in self._retired:
+                            if self.fsync:
+                                self._fsync(f.fileno())
+                        if self.fsync and self._written_lsn > self._durable_lsn:
+                            self._fsync(self._file.fileno())
+                        if self._directory_dirty:
+                            self._sync_directory()
+                        self._durable_lsn = self._written_lsn
+                except OSError as e:
+                    self._sync_error = e
+                    self.stats['fsync_errors'] += 1
+                    self.logger.error(f"关闭预写日志时fsync失败: {e}")
+                finally:
+                    for f in self._retired:
+                        f.close()
+                    self._retired = []
+                    self._file.close()
+                    self._file = None
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取预写日志统计信息"""
+        with self._cond:
+            stats = dict(self.stats)
+            stats['file_seq'] = self._file_seq
+            stats['unsynced_records'] = self._written_lsn - self._durable_lsn
+            stats['sync_error'] = str(self._sync_error) if self._sync_error is not None else None
+        if stats['fsyncs']:
+            stats['avg_fsync_ms'] = round(stats['fsync_seconds'] * 1000 / stats['fsyncs'], 3)
+            stats['records_per_fsync'] = round(stats['records'] / stats['fsyncs'], 1)
+        stats['fsync_seconds'] = round(stats['fsync_seconds'], 3)
+        stats['max_fsync_ms'] = round(stats['max_fsync_ms'], 3)
+        return stats
@@ -0,0 +1,332 @@
+"""
+批量写入管道
+收集线程把新日志加入缓存后通知写入管道，调度线程按每个服务器的批次大小和等待时间决定何时写入：
+    - 未保存的日志达到max_batch_entries条时立即写入
+    - 最早的未保存日志等待了max_batch_age秒后写入
+每个服务器同一时间最多只有一个写入任务（保证顺序），不同服务器的写入在线程池中并行执行。
+
+每批日志依次写入所有注册的输出（原始日志、分类日志等），每个分块记录已写入的输出，
+某个输出失败后重试时只写入尚未成功的输出，不会重复写入其他输出。按部分写入的输出（例如分类日志的每个类型和小时）
+还记录失败前已写入的部分，重试时只写入剩下的部分。写入失败的服务器等待max_batch_age秒后重试，
+期间即使未保存的日志达到max_batch_entries条也不会再次写入。
+
+max_batch_age越大，每个分段文件被追加（json格式为整个文件重写）的次数越少，但日志在内存中停留的时间越长；
+启用预写日志时停留时间不影响崩溃安全。
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+from log_entry import LogEntry
+from log_buffer import LogCache, InstrumentedLock, SAVE_BATCH_ENTRIES
+
+class WriterPipeline:
+    """
+    由缓存通知驱动的批量写入管道
+    """
+
+    def __init__(self, cache: LogCache, cache_lock: InstrumentedLock, max_batch_entries: int = 5000,
+                 max_batch_age: float = 60, workers: int = 4,
+                 after_flush: Optional[Callable[[], None]] = None):
+        """
+        初始化写入管道
+
+        Args:
+            cache: 日志缓存
+            cache_lock: 保护缓存的锁（只在取走、移除分块时短暂持有）
+            max_batch_entries: 服务器未保存的日志达到多少条时立即写入
+            max_batch_age: 最早的未保存日志最多等待多少秒后写入（写入失败后的重试间隔也使用该值）
+            workers: 并行写入的服务器数量
+            after_flush: 每次成功写入一个服务器之后调用（例如检查预写日志是否可以删除）
+        """
+        self.cache = cache
+        self.cache_lock = cache_lock
+        self.max_batch_entries = max(1, max_batch_entries)
+        self.max_batch_age = max_batch_age
+        self.workers = max(1, workers)
+        self.after_flush = after_flush
+        self.logger = logging.getLogger("WriterPipeline")
+
+        # 输出名称 -> 写入函数(服务器名称, 日志列表)，按注册顺序写入
+        self.sinks: Dict[str, Callable[..., Any]] = {}
+        self._partial_sinks: set = set()
+
+        self._cond = threading.Condition()
+        self._pending: Dict[str, Tuple[float, int]] = {}  # 服务器 -> (最早的未保存日志加入时间, 未保存条数)
+        self._inflight: set = set()
+        self._retry_after: Dict[str, float] = {}  # 写入失败的服务器 -> 重试时间，之前不按批次大小触发写入
+        self._running = False
+        self._dispatcher: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        # 统计信息
+        self.stats = {
+            'flushes_by_size': 0,
+            'flushes_by_age': 0,
+            'flushes_forced': 0,
+            'failed_flushes': 0,
+            'batches': 0,
+            'entries_written': 0,
+            'sinks': {}
+        }
+
+    def register_sink(self, name: str, write: Callable[..., Any], partial: bool = False):
+        """
+        注册输出
+
+        Args:
+            name: 输出名称
+            write: 写入函数(服务器名称, 日志列表)，失败时抛出异常
+            partial: 输出是否按部分写入。为True时写入函数多接收一个集合参数(服务器名称, 日志列表, 已写入的部分)，
+                     跳过集合中的部分并把写入成功的部分加入集合，失败时集合中的部分重试时不再写入
+        """
+        self.sinks[name] = write
+        if partial:
+            self._partial_sinks.add(name)
+        self.stats['sinks'][name] = {'writes': 0, 'entries': 0, 'failures': 0, 'seconds': 0.0}
+
+    def start(self):
+        """启动调度线程和写入线程池"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="log-writer")
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="log-writer-dispatch", daemon=True)
+        self._dispatcher.start()
+        self.logger.info(f"启动写入管道，批次上限: {self.max_batch_entries}条/{self.max_batch_age}秒，"
+                         f"并行写入: {self.workers}")
+
+    def stop(self):
+        """停止调度线程，写入所有剩余的日志后关闭线程池"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._dispatcher is not None:
+            self._dispatcher.join(timeout=10)
+            self._dispatcher = None
+        self.flush_all()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def notify(self, server_name: str, pending: int):
+        """
+        收集线程加入新日志后调用
+
+        Args:
+            server_name: 服务器名称
+            pending: 该服务器缓存中的日志条数
+        """
+        with self._cond:
+            since = self._pending.get(server_name, (time.monotonic(), 0))[0]
+            self._pending[server_name] = (since, pending)
+            if pending >= self.max_batch_entries:
+                self._cond.notify_all()
+
+    def _dispatch_loop(self):
+        """调度线程：等待批次达到大小或等待时间上限后提交写入任务"""
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                due, timeout = self._due_servers(time.monotonic())
+                if not due:
+                    self._cond.wait(timeout)
+                    continue
+                for server_name, reason in due:
+                    self._claim(server_name)
+                    self.stats[f'flushes_by_{reason}'] += 1
+
+            for server_name, _ in due:
+                self._executor.submit(self._flush_server, server_name)
+
+    def _due_servers(self, now: float) -> Tuple[List[Tuple[str, str]], Optional[float]]:
+        """找出需要写入的服务器，返回([(服务器, 原因), ...], 距下一个服务器到期的秒数)，调用时持有self._cond"""
+        due = []
+        timeout = None
+        for server_name, (since, pending) in self._pending.items():
+            if server_name in self._inflight:
+                continue
+            if pending >= self.max_batch_entries and now >= self._retry_after.get(server_name, 0):
+                due.append((server_name, 'size'))
+                continue
+            remaining = since + self.max_batch_age - now
+            if remaining <= 0:
+                due.append((server_name, 'age'))
+            elif timeout is None or remaining < timeout:
+                timeout = remaining
+        return due, timeout
+
+    def _claim(self, server_name: str):
+        """标记服务器有写入任务，调用时持有self._cond"""
+        while server_name in self._inflight:
+            self._cond.wait()
+        self._inflight.add(server_name)
+        self._pending.pop(server_name, None)
+
+    def flush_all(self):
+        """立即写入所有服务器的缓存并等待完成（保存剩余日志、强制保存时使用）"""
+        with self.cache_lock:
+            server_names = [server_name for server_name, buffer in self.cache.items() if buffer]
+        if not server_names:
+            return
+
+        with self._cond:
+            for server_name in server_names:
+                self._claim(server_name)
+            self.stats['flushes_forced'] += len(server_names)
+
+        if self._executor is not None:
+            for future in [self._executor.submit(self._flush_server, name) for name in server_names]:
+                future.result()
+        else:
+            for server_name in server_names:
+                self._flush_server(server_name)
+
+    def _flush_server(self, server_name: str):
+        """写入一个服务器当前的全部分块（已由_claim标记）"""
+        try:
+            success = self._write_chunks(server_name)
+        except Exception as e:
+            self.logger.error(f"写入 {server_name} 缓存日志出错: {e}")
+            success = False
+
+        # 写入期间通知的条数包含正在写入的日志，按写入后剩余的条数更新（锁顺序: cache_lock -> self._cond）
+        with self.cache_lock:
+            remaining = len(self.cache[server_name])
+            with self._cond:
+                self._inflight.discard(server_name)
+                if not success:
+                    # 失败的日志留在缓存中，等待max_batch_age后重试（期间即使达到批次大小也不写入）
+                    now = time.monotonic()
+                    self.stats['failed_flushes'] += 1
+                    self._pending[server_name] = (now, remaining)
+                    self._retry_after[server_name] = now + self.max_batch_age
+                else:
+                    self._retry_after.pop(server_name, None)
+                    if not remaining:
+                        self._pending.pop(server_name, None)
+                    elif server_name in self._pending:
+                        self._pending[server_name] = (self._pending[server_name][0], remaining)
+                self._cond.notify_all()
+
+        # 只有全部输出确认写入后才回调，失败的分块仍在缓存中，检查点不会删除它们的WAL
+        if success and self.after_flush is not None:
+            try:
+                self.after_flush()
+            except Exception as e:
+                self.logger.error(f"写入后回调出错: {e}")
+
+    def _write_chunks(self, server_name: str) -> bool:
+        """
+        在锁内取走服务器的全部分块，在锁外按顺序写入所有输出，相邻的分块合并为不超过
+        SAVE_BATCH_ENTRIES条的批次，返回是否全部写入
+
+        写入失败或读取溢出文件出错时，未写入的分块都归还缓存，下次写入时重试
+        """
+        with self.cache_lock:
+            buffer = self.cache[server_name]
+            chunks = buffer.take()
+
+        start = 0
+        try:
+            while start < len(chunks):
+                end = start
+                batch: List[Tuple[Any, List[LogEntry]]] = []
+                batch_size = 0
+                while end < len(chunks) and (end == start or batch_size < SAVE_BATCH_ENTRIES):
+                    logs = self.cache.load(server_name, chunks[end])
+                    batch.append((chunks[end], logs))
+                    batch_size += len(logs)
+                    end += 1
+
+                if not self._write_batch(server_name, batch):
+                    return False
+                with self.cache_lock:
+                    for chunk in chunks[start:end]:
+                        buffer.complete(chunk)
+                start = end
+            return True
+        finally:
+            if start < len(chunks):
+                with self.cache_lock:
+                    buffer.release(chunks[start:])
+
+    def _write_batch(self, server_name: str, batch: List[Tuple[Any, List[LogEntry]]]) -> bool:
+        """把一批分块写入每个尚未写入的输出，返回是否全部成功"""
+        all_written = True
+        for name, write in self.sinks.items():
+            pending = [(chunk, chunk_logs) for chunk, chunk_logs in batch if name not in chunk.written_sinks]
+            for chunks, logs, parts in self._sink_groups(name, pending):
+                sink_stats = self.stats['sinks'][name]
+                start = time.perf_counter()
+                try:
+                    if parts is None:
+                        write(server_name, logs)
+                    else:
+                        write(server_name, logs, parts)
+                except Exception as e:
+                    if parts:
+                        for chunk in chunks:
+                            chunk.written_parts[name] = set(parts)
+                    with self._cond:
+                        sink_stats['failures'] += 1
+                    self.logger.error(f"写入 {server_name} 的日志到 {name} 失败: {e}")
+                    all_written = False
+                    break
+                with self._cond:
+                    sink_stats['writes'] += 1
+                    sink_stats['entries'] += len(logs)
+                    sink_stats['seconds'] += time.perf_counter() - start
+                for chunk in chunks:
+                    chunk.written_sinks.add(name)
+                    chunk.written_parts.pop(name, None)
+
+        if all_written:
+            with self._cond:
+                self.stats['batches'] += 1
+                self.stats['entries_written'] += sum(len(logs) for _, logs in batch)
+        return all_written
+
+    def _sink_groups(self, name: str, pending: List[Tuple[Any, List[LogEntry]]]):
+        """
+        把尚未写入某个输出的分块分组，每组调用一次写入函数
+
+        普通输出只有一组；按部分写入的输出把已写入部分相同的相邻分块分为一组（通常只有上次部分失败的分块
+        和之后的新分块两组），每组带一个已写入部分的集合
+
+        Returns:
+            Iterator[Tuple[List[分块], List[LogEntry], Optional[set]]]: (分块, 日志, 已写入的部分)
+        """
+        if not pending:
+            return
+        if name not in self._partial_sinks:
+            yield [chunk for chunk, _ in pending], [log for _, chunk_logs in pending for log in chunk_logs], None
+            return
+        start = 0
+        while start < len(pending):
+            parts = pending[start][0].written_parts.get(name, set())
+            end = start + 1
+            while end < len(pending) and pending[end][0].written_parts.get(name, set()) == parts:
+                end += 1
+            group = pending[start:end]
+            yield ([chunk for chunk, _ in group], [log for _, chunk_logs in group for log in chunk_logs],
+                   set(parts))
+            start = end
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取写入管道统计信息"""
+        with self._cond:
+            stats = {key: value for key, value in self.stats.items() if key != 'sinks'}
+            stats['pending_servers'] = len(self._pending)
+            stats['inflight_servers'] = len(self._inflight)
+            stats['sinks'] = {
+                name: {**sink_stats, 'seconds': round(sink_stats['seconds'], 3)}
+                for name, sink_stats in self.stats['sinks'].items()
+            }
+        stats['avg_batch_entries'] = round(stats['entries_written'] / stats['batches'], 1) if stats['batches'] else 0
+        return stats